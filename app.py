@@ -1,19 +1,58 @@
+import importlib
+import sys
+import time
+import startup_profile
+
+# Time the imports below and the pages' first imports when PROFILE_STARTUP is set
+startup_profile.install()
+
 import streamlit as st
-import yaml
 import streamlit_authenticator as stauth
-from streamlit_authenticator.utilities import Hasher
-import data, predict, history, dashboard
+import auth_config
+import perf_metrics
 
 # Configure page
 st.set_page_config(page_title="Income Predictor App", page_icon="🔮", layout="wide")
 
-def main():
-    # Load yaml configuration file
-    with open("config.yaml", "r") as config_file:
-        config = yaml.safe_load(config_file)
+# Pages by name and the module and function that show them. A page module, and
+# pandas, plotly and the models behind it, is only imported the first time the
+# page is selected, so the login screen does not wait on them.
+pages = {
+    "Home Page": None,
+    "Data Page": ("data", "show_data"),
+    "Predict Page": ("predict", "show_predictions"),
+    "History Page": ("history", "show_history"),
+    "Dashboard Page": ("dashboard", "show_dashboard"),
+    "Performance Page": ("performance", "show_performance"),
+}
+
+# Pages only listed for the usernames under admins in config.yaml
+admin_pages = ["Performance Page"]
+
+
+def show_page(page):
+    if pages[page] is None:
+        show_home_page()
+        return
+    module_name, function_name = pages[page]
+    first_import = module_name not in sys.modules
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    if first_import:
+        startup_profile.page_loaded(page, time.perf_counter() - start)
+    getattr(module, function_name)()
+
+
+# Start loading the models in the background so the first prediction does not
+# wait on them; after the first paint so the login screen does not either
+def preload_models():
+    importlib.import_module("model_registry").preload()
 
-    # Pre-hash all plain text passwords
-    Hasher.hash_passwords(config["credentials"])
+
+def main():
+    # Load yaml configuration file with its passwords hashed; both are only
+    # redone when config.yaml changes
+    config = auth_config.load_config()
 
     authenticator = stauth.Authenticate(
                                         config["credentials"],
@@ -54,19 +93,21 @@ def main():
         
         # Navigation menu
         st.sidebar.title("Navigation")
-        st.session_state["page"] = st.sidebar.selectbox("## Please select a page here 👇", options = ["Home Page", "Data Page", "Predict Page", "History Page", "Dashboard Page"])
+        is_admin = st.session_state["username"] in (config.get("admins") or [])
+        options = [page for page in pages if is_admin or page not in admin_pages]
+        st.session_state["page"] = st.sidebar.selectbox("## Please select a page here 👇", options = options)
 
         # Show a page based on selection
-        if st.session_state["page"] == "Home Page":
-            show_home_page()
-        elif st.session_state["page"] == "Data Page":
-            data.show_data()
-        elif st.session_state["page"] == "Predict Page":
-            predict.show_predictions()
-        elif st.session_state["page"] == "History Page":
-            history.show_history()
-        elif st.session_state["page"] == "Dashboard Page" :
-            dashboard.show_dashboard()
+        show_page(st.session_state["page"])
+
+    # The first run of the process has painted the login screen (or a page)
+    startup_profile.painted()
+    preload_models()
+    # Refresh the Prometheus text file of the stage timings when PERF_METRICS is set
+    perf_metrics.export()
+    if startup_profile.enabled:
+        with st.sidebar.expander("Startup profile"):
+            st.code(startup_profile.report())
 
 
 # Create home page
@@ -0,0 +1,56 @@
+import json
+import os
+import threading
+import streamlit as st
+import yaml
+from streamlit_authenticator.utilities import Hasher
+
+config_path = "config.yaml"
+
+# Hashed credentials of the config they were hashed from, so a restart does
+# not hash every password again. bcrypt is slow on purpose: ~0.2 s a user.
+hashed_credentials_path = "data/cache/credentials.json"
+
+
+# Path, modification time and size of the config; a new version means it was edited
+def config_version(file_path = config_path):
+    stat = os.stat(file_path)
+    return [os.path.realpath(file_path), stat.st_mtime_ns, stat.st_size]
+
+
+def _read_hashed(version):
+    try:
+        with open(hashed_credentials_path) as f:
+            stored = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return stored["credentials"] if stored.get("version") == version else None
+
+
+def _write_hashed(version, credentials):
+    os.makedirs(os.path.dirname(hashed_credentials_path), exist_ok = True)
+    temp_path = f"{hashed_credentials_path}.{threading.get_ident()}.tmp"
+    # The hashes are only readable by the app's user, as the config should be
+    with open(os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as f:
+        json.dump({"version": version, "credentials": credentials}, f)
+    os.replace(temp_path, hashed_credentials_path)
+
+
+# Parse the config and hash its plain text passwords, or take the hashes kept
+# from an earlier start. Kept in process memory per config version, and every
+# session gets its own copy, which the authenticator may update.
+@st.cache_data(max_entries = 1, show_spinner = False)
+def _load(file_path, version):
+    with open(file_path, "r") as config_file:
+        config = yaml.safe_load(config_file)
+    credentials = _read_hashed(version)
+    if credentials is None:
+        credentials = Hasher.hash_passwords(config["credentials"])
+        _write_hashed(version, credentials)
+    config["credentials"] = credentials
+    return config
+
+
+# Config with hashed passwords; a rerun only checks the file's modification time
+def load_config(file_path = config_path):
+    return _load(file_path, config_version(file_path))
@@ -0,0 +1,69 @@
+import argparse
+import os
+import pickle
+import sys
+import model_registry
+import perf_metrics
+import scoring
+
+# Saved pipelines next to this script, so the command works from any directory
+default_model_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
+
+
+def parse_args(argv = None):
+    parser = argparse.ArgumentParser(description = "Score a CSV, Excel or Parquet file without starting the Streamlit app.")
+    parser.add_argument("input", help = "dataset to score (.csv, .xlsx or .parquet)")
+    parser.add_argument("output", help = "file to write the predictions to (.csv or .parquet)")
+    parser.add_argument("--model", choices = sorted(scoring.model_choices), default = "xgboost", help = "pipeline to score with")
+    parser.add_argument("--chunk-size", type = int, default = 50000, help = "rows held in memory at a time")
+    parser.add_argument("--workers", type = int, default = scoring.default_workers, help = "workers each chunk is sharded across")
+    parser.add_argument("--executor", choices = ["thread", "process"], default = "thread", help = "kind of worker pool")
+    parser.add_argument("--backend", choices = ["pipeline", "compiled"], default = "pipeline",
+                        help = "score with the fitted pipeline or its compiled NumPy version")
+    parser.add_argument("--models-dir", default = default_model_dir, help = "directory holding the saved pipelines and encoder")
+    parser.add_argument("--quiet", action = "store_true", help = "do not report progress")
+    return parser.parse_args(argv)
+
+
+# Report rows scored and throughput on stderr, overwriting the same line
+def show_progress(rows_done, total_rows, elapsed):
+    print(f"\r{rows_done:,} of {total_rows:,} rows scored ({rows_done / max(elapsed, 1e-9):,.0f} rows/sec)",
+          end = "", file = sys.stderr, flush = True)
+
+
+def main(argv = None):
+    args = parse_args(argv)
+    model_name = scoring.model_choices[args.model]
+    model_registry.use_model_dir(args.models_dir)
+
+    # A missing file or a Git LFS pointer that was never pulled fails here
+    try:
+        encoder = scoring.load_encoder()
+        model = scoring.load_model(model_name, args.backend)
+    except (OSError, KeyError, pickle.UnpicklingError) as e:
+        print(f"Error: could not load the {model_name} model and encoder from {args.models_dir}: {e!r}", file = sys.stderr)
+        return 1
+
+    try:
+        rows_done, elapsed = scoring.stream_bulk_prediction(args.input, model, encoder, args.output, args.chunk_size,
+                                                            model_name = scoring.bulk_model_names[model_name],
+                                                            progress = None if args.quiet else show_progress,
+                                                            workers = args.workers, executor = args.executor)
+    except (ValueError, OSError) as e:
+        print(f"\nError: {e}", file = sys.stderr)
+        return 1
+
+    if not args.quiet:
+        print(f"\n{rows_done:,} rows scored in {elapsed:.1f}s -> {args.output}", file = sys.stderr)
+
+    # Where the time went, with PERF_METRICS set; also written as Prometheus text
+    if perf_metrics.enabled:
+        for stage in perf_metrics.snapshot():
+            print(f"{stage['stage']:>20} {stage['count']:>6} calls {stage['total_s']:>8.2f}s {stage['p95_ms']:>9.1f} ms p95",
+                  file = sys.stderr)
+        perf_metrics.export(force = True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
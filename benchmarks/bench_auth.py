@@ -0,0 +1,67 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+import yaml
+from streamlit_authenticator.utilities import Hasher
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import auth_config
+
+
+# config.yaml shaped like the app's, with plain text passwords
+def write_config(file_path, users):
+    usernames = {f"user_{i}": {"email": f"user_{i}@example.com", "failed_login_attempts": 0, "logged_in": False,
+                               "name": f"User {i}", "password": f"password{i}"} for i in range(users)}
+    config = {"credentials": {"usernames": usernames},
+              "cookie": {"expiry_days": 30, "key": "some_signature_key", "name": "some_cookie_name"},
+              "pre-authorized": {"emails": ["someone@example.com"]}}
+    with open(file_path, "w") as f:
+        yaml.safe_dump(config, f)
+
+
+# What app.main() did on every rerun
+def parse_and_hash(file_path):
+    with open(file_path, "r") as config_file:
+        config = yaml.safe_load(config_file)
+    Hasher.hash_passwords(config["credentials"])
+    return config
+
+
+def timed(function, *args, repeats = 1):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        function(*args)
+    return (time.perf_counter() - start) / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Auth config per rerun: parse and bcrypt every password against the cached bootstrap")
+    parser.add_argument("--users", type = int, nargs = "+", default = [2, 100, 1000])
+    parser.add_argument("--repeats", type = int, default = 200)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp())
+    print(f"{'users':>6} {'before_rerun_s':>14} {'first_start_s':>13} {'restart_ms':>10} {'after_rerun_ms':>14}")
+    for users in args.users:
+        write_config(auth_config.config_path, users)
+        before = timed(parse_and_hash, auth_config.config_path)
+
+        # First start hashes and keeps the hashes; a restart reads them back
+        if os.path.exists(auth_config.hashed_credentials_path):
+            os.remove(auth_config.hashed_credentials_path)
+        auth_config._load.clear()
+        first_start = timed(auth_config.load_config)
+        auth_config._load.clear()
+        restart = timed(auth_config.load_config)
+
+        # Every later rerun only checks the config's modification time
+        rerun = timed(auth_config.load_config, repeats = args.repeats)
+        config = auth_config.load_config()
+        assert all(Hasher._is_hash(user["password"]) for user in config["credentials"]["usernames"].values())
+        print(f"{users:>6} {before:>14.2f} {first_start:>13.2f} {restart * 1000:>10.1f} {rerun * 1000:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import bitmap_index
+import kpi_cube
+import schema
+
+dimensions = ["education", "industry_code_main", "country_of_birth_own"]
+labels = ["Above limit", "Below limit"]
+
+
+# Scored rows with just the KPI columns, categorical as the dashboard loads
+# them, so ten million rows fit in memory
+def kpi_frame(rows, seed = 0):
+    rng = np.random.default_rng(seed)
+    data = {"age": rng.integers(0, 91, rows)}
+    for column in ["gender", "tax_status"] + dimensions:
+        options = schema.category_options[column]
+        weights = 1.0 / np.arange(1, len(options) + 1) ** 1.5
+        data[column] = pd.Categorical.from_codes(rng.choice(len(options), rows, p = weights / weights.sum()), options)
+    data["income_above_limit"] = pd.Categorical.from_codes((rng.random(rows) >= 0.1).astype(np.int8), labels)
+    return pd.DataFrame(data)
+
+
+# Filter with full-column comparisons into a copied frame, then aggregate it
+def pandas_kpis(df, age, gender, tax_status):
+    filtered_df = df[(df["age"] >= age[0]) & (df["age"] <= age[1]) & (df["gender"] == gender) & (df["tax_status"] == tax_status)]
+    answers = [filtered_df["income_above_limit"].value_counts(), filtered_df["gender"].value_counts()]
+    answers += [filtered_df.groupby([dimension, "income_above_limit"], observed = True).size() for dimension in dimensions]
+    return answers
+
+
+# Intersect bitmaps, then count the selected rows' codes
+def bitmap_kpis(index, age, gender, tax_status):
+    selected = index.select(*age, equal = {"gender": gender, "tax_status": tax_status})
+    answers = [index.counts(selected, ["income_above_limit"]), index.counts(selected, ["gender"])]
+    answers += [index.counts(selected, [dimension, "income_above_limit"]) for dimension in dimensions]
+    return answers
+
+
+# The same answers from the bitmap index over the KPI cube
+def cube_kpis(cube, age, gender, tax_status):
+    selected = kpi_cube.select(cube, age, gender, tax_status)
+    answers = [kpi_cube.label_counts(cube, selected), kpi_cube.gender_counts(cube, selected)]
+    answers += [kpi_cube.cells(cube, selected, dimension) for dimension in dimensions]
+    return answers
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "KPI filters: pandas masks and copies against bitmap indexes over rows and over the KPI cube")
+    parser.add_argument("--rows", type = int, nargs = "+", default = [1000000, 10000000])
+    parser.add_argument("--repeats", type = int, default = 10)
+    parser.add_argument("--chunk-size", type = int, default = 1000000)
+    args = parser.parse_args()
+
+    print(f"{'rows':>9} {'rows_index_s':>12} {'cube_index_s':>12} {'pandas_ms':>9} {'rows_ms':>8} {'cube_ms':>8}")
+    for n in args.rows:
+        df = kpi_frame(n, seed = 11)
+        index, rows_build = timed(bitmap_index.BitmapIndex, df, ["gender", "tax_status"], "age", dimensions + ["income_above_limit"])
+
+        # The cube is built chunk by chunk, as a bulk run writes it
+        start = time.perf_counter()
+        cube = kpi_cube.index(kpi_cube.merge([kpi_cube.build(df.iloc[i:i + args.chunk_size]) for i in range(0, n, args.chunk_size)]))
+        cube_build = time.perf_counter() - start
+
+        rng = np.random.default_rng(0)
+        filters = []
+        for _ in range(args.repeats):
+            low = int(rng.integers(0, 60))
+            filters.append(((low, low + int(rng.integers(5, 30))), str(rng.choice(["Male", "Female"])), str(rng.choice(schema.category_options["tax_status"]))))
+
+        timings = {}
+        for name, function, data in [("pandas", pandas_kpis, df), ("rows", bitmap_kpis, index), ("cube", cube_kpis, cube)]:
+            start = time.perf_counter()
+            results = [function(data, *f) for f in filters]
+            timings[name] = (time.perf_counter() - start) * 1000 / args.repeats
+            timings[name + "_answers"] = results
+
+        # Every method must count the same predictions
+        for expected, found, cubed in zip(timings["pandas_answers"], timings["rows_answers"], timings["cube_answers"]):
+            assert expected[0].sum() == found[0].sum() == cubed[0].sum()
+            assert dict(expected[0][expected[0] > 0]) == dict(found[0]) == dict(cubed[0])
+            for dimension, e, f in zip(dimensions, expected[2:], found[2:]):
+                assert dict(e[e > 0]) == dict(f), dimension
+        print(f"{n:>9} {rows_build:>12.2f} {cube_build:>12.2f} {timings['pandas']:>9.1f} {timings['rows']:>8.1f} {timings['cube']:>8.1f}")
+        del df, index, cube
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+import plotly.express as px
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import countries
+import kpi_cube
+import synthetic
+
+
+# Seconds to build and serialise a figure, and the bytes sent to the browser
+def measure(build):
+    start = time.perf_counter()
+    payload = len(build().to_json())
+    return time.perf_counter() - start, payload
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Country of birth choropleth: census labels per row against one ISO-3 row per country")
+    parser.add_argument("--rows", type = int, nargs = "+", default = [50000, 200000])
+    args = parser.parse_args()
+
+    print(f"{'rows':>8} {'method':>10} {'locations':>9} {'mapped':>6} {'build_s':>8} {'payload_kb':>10}")
+    for n in args.rows:
+        df = synthetic.census_frame(n, seed = 9)
+        df["income_above_limit"] = np.where(np.random.default_rng(0).random(n) < 0.1, "Above limit", "Below limit")
+        cube = kpi_cube.index(kpi_cube.build(df))
+        cells = kpi_cube.cells(cube, cube.select(), "country_of_birth_own")
+
+        # Every filtered row, as the map was drawn before the KPI cube
+        rows = df[["country_of_birth_own", "income_above_limit"]]
+        build_s, payload = measure(lambda: px.choropleth(rows, locations = "country_of_birth_own", locationmode = "country names",
+                                                         color = "income_above_limit"))
+        print(f"{n:>8} {'rows':>10} {len(rows):>9} {'-':>6} {build_s:>8.2f} {payload / 1e3:>10.1f}")
+
+        # Census labels per income label, as the cube gave them
+        build_s, payload = measure(lambda: px.choropleth(cells, locations = "country_of_birth_own", locationmode = "country names",
+                                                         color = "income_above_limit"))
+        print(f"{n:>8} {'cells':>10} {len(cells):>9} {'-':>6} {build_s:>8.2f} {payload / 1e3:>10.1f}")
+
+        # One ISO-3 row per country
+        start = time.perf_counter()
+        by_country = countries.aggregate(cells, "country_of_birth_own", kpi_cube.label_column)
+        aggregate_s = time.perf_counter() - start
+        build_s, payload = measure(lambda: px.choropleth(by_country, locations = "iso3", locationmode = "ISO-3", color = "above_rate"))
+        mapped = f"{by_country['total'].sum() / n:.0%}"
+        print(f"{n:>8} {'countries':>10} {len(by_country):>9} {mapped:>6} {aggregate_s + build_s:>8.2f} {payload / 1e3:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
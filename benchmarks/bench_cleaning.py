@@ -0,0 +1,83 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import columnar_cache
+import schema
+
+
+# Previous clean_columns: per-column .str.strip(), frame-wide replace, all object dtypes
+def legacy_clean_columns(data_chunk):
+    data_chunk = data_chunk.drop(columns = schema.columns_to_drop, axis = 1)
+    for col in data_chunk.select_dtypes(include = ["category", "object"]).columns:
+        data_chunk[col] = data_chunk[col].str.strip()
+    data_chunk.replace("?", np.nan, inplace = True)
+    data_chunk["is_hispanic"] = data_chunk["is_hispanic"].replace("NA", "All other")
+    return data_chunk
+
+
+# Raw census-style frame: leading spaces, "?" for missing and the dropped columns
+def raw_frame(rows):
+    rng = np.random.default_rng(0)
+    raw = {"ID": [f"ID_TZ{i:07d}" for i in range(rows)]}
+    for col in schema.expected_features[1:]:
+        if col in schema.category_options:
+            labels = np.array([" " + value for value in schema.category_options[col]] + [" ?"], dtype = object)
+            raw[col] = labels[rng.integers(0, len(labels), rows)]
+        else:
+            raw[col] = rng.integers(0, 100, rows)
+    for col in schema.columns_to_drop:
+        raw[col] = np.array([" ?", " Not in universe"], dtype = object)[rng.integers(0, 2, rows)]
+    return pd.DataFrame(raw)
+
+
+def measure(function, df):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function(df)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, result.memory_usage(deep = True).sum()
+
+
+# Values that only appear in a later chunk (out of range, missing, not a number)
+# must not change its types, or a strict writer stops partway through a file
+def check_chunk_types():
+    first, later = raw_frame(2000).iloc[:1000], raw_frame(2000).iloc[1000:].copy()
+    later.loc[later.index[0], "wage_per_hour"] = 40000
+    later.loc[later.index[1], "gains"] = 10 ** 8
+    later["age"] = later["age"].astype(object)
+    later.loc[later.index[2], "age"] = " ?"
+    cleaned = [schema.clean_columns(first), schema.clean_columns(later)]
+    assert (cleaned[0].dtypes == cleaned[1].dtypes).all(), "a later chunk changed the cleaned types"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        writer = columnar_cache.ChunkWriter(os.path.join(tmp, "chunks.tmp"), strict = True)
+        for chunk in cleaned:
+            writer.write(chunk)
+        assert writer.save(os.path.join(tmp, "chunks.parquet"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "clean_columns throughput and peak memory")
+    parser.add_argument("--rows", type = int, default = 1_000_000)
+    args = parser.parse_args()
+
+    check_chunk_types()
+    print(f"rows={args.rows}")
+    print(f"{'version':>8} {'seconds':>8} {'rows/s':>11} {'peak_MB':>8} {'result_MB':>10}")
+    for name, function in [("legacy", legacy_clean_columns), ("schema", schema.clean_columns)]:
+        # A fresh frame per run keeps only one raw copy alive at a time
+        elapsed, peak, size = measure(function, raw_frame(args.rows))
+        print(f"{name:>8} {elapsed:>8.2f} {args.rows / elapsed:>11,.0f} {peak / 1e6:>8.0f} {size / 1e6:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import columnar_cache
+import page_index
+from bench_paging import write_csv
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Dataset reload time and memory: CSV parse vs Parquet cache")
+    parser.add_argument("--rows", type = int, default = 1_000_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        page_index.cache_dir = columnar_cache.cache_dir = os.path.join(tmp, "cache")
+        file_path = os.path.join(tmp, "bench.csv")
+        write_csv(file_path, args.rows)
+
+        convert_time, _ = timed(columnar_cache.convert, file_path)
+        csv_time, csv_df = timed(pd.read_csv, file_path)
+        parquet_time, parquet_df = timed(columnar_cache.read_frame, file_path)
+        projected_time, projected_df = timed(columnar_cache.read_frame, file_path, columns = ["age", "gender"])
+
+        megabytes = lambda df: df.memory_usage(deep = True).sum() / 1e6
+        print(f"rows={args.rows} csv_size={os.path.getsize(file_path) / 1e6:.1f}MB "
+              f"parquet_size={os.path.getsize(columnar_cache.cached_path(file_path)) / 1e6:.1f}MB convert={convert_time:.3f}s")
+        print(f"{'read':>22} {'seconds':>9} {'frame_MB':>9}")
+        print(f"{'csv full':>22} {csv_time:>9.3f} {megabytes(csv_df):>9.1f}")
+        print(f"{'parquet full':>22} {parquet_time:>9.3f} {megabytes(parquet_df):>9.1f}")
+        print(f"{'parquet age,gender':>22} {projected_time:>9.3f} {megabytes(projected_df):>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import running_stats
+import synthetic
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Correlation heatmap: DataFrame.corr() over every row against running statistics")
+    parser.add_argument("--rows", type = int, nargs = "+", default = [50000, 200000, 800000])
+    parser.add_argument("--chunk-size", type = int, default = 50000)
+    args = parser.parse_args()
+
+    print(f"{'rows':>8} {'pandas_ms':>10} {'update_ms':>10} {'corr_ms':>8} {'max_diff':>9}")
+    for n in args.rows:
+        df = synthetic.census_frame(n, seed = 5)
+        df["Probability"] = np.random.default_rng(0).uniform(50, 100, n)
+
+        start = time.perf_counter()
+        expected = df.select_dtypes(include = ["number"]).corr()
+        pandas_ms = (time.perf_counter() - start) * 1000
+
+        # Updating is paid once, as each chunk of a bulk run is written
+        correlation = running_stats.CorrelationAccumulator()
+        start = time.perf_counter()
+        for i in range(0, n, args.chunk_size):
+            correlation.update(df.iloc[i:i + args.chunk_size])
+        update_ms = (time.perf_counter() - start) * 1000
+
+        # Reading the matrix is what each dashboard rerun pays
+        start = time.perf_counter()
+        corr = correlation.corr()
+        corr_ms = (time.perf_counter() - start) * 1000
+        max_diff = np.nanmax(np.abs(corr.loc[expected.index, expected.columns].to_numpy() - expected.to_numpy()))
+        print(f"{n:>8} {pandas_ms:>10.1f} {update_ms:>10.1f} {corr_ms:>8.2f} {max_diff:>9.1e}")
+
+
+if __name__ == "__main__":
+    main()
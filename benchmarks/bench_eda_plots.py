@@ -0,0 +1,55 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+import plotly.express as px
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import eda_plots
+import synthetic
+
+box_columns = ["age", "working_week_per_year", "industry_code", "occupation_code", "total_employed", "mig_year",
+               "losses", "importance_of_record", "gains", "wage_per_hour", "stocks_status"]
+scatter_columns = ["employment_stat", "wage_per_hour", "mig_year", "importance_of_record", "income_above_limit"]
+
+
+# The EDA Dashboard's box plots and scatter matrix drawn from every row
+def every_row(df, max_points):
+    box = px.box(df[box_columns], color_discrete_sequence = ["green", "lightgreen"])
+    scatter = px.scatter_matrix(df[scatter_columns], dimensions = scatter_columns[:-1], color = "income_above_limit")
+    return [box, scatter]
+
+
+# The same figures from summaries and a stratified sample
+def summarised(df, max_points):
+    box = eda_plots.box_figure(eda_plots.box_stats(df, box_columns), title = "")
+    sample = eda_plots.stratified_sample(df[scatter_columns], "income_above_limit", max_points)
+    scatter = px.scatter_matrix(sample, dimensions = scatter_columns[:-1], color = "income_above_limit")
+    return [box, scatter]
+
+
+# Seconds to build and serialise the figures, and the bytes sent to the browser
+def measure(render, df, max_points):
+    start = time.perf_counter()
+    payload = sum(eda_plots.payload_bytes(fig) for fig in render(df, max_points))
+    return time.perf_counter() - start, payload
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "EDA box plots and scatter matrix: every row against summaries and samples")
+    parser.add_argument("--rows", type = int, nargs = "+", default = [20000, 100000, 300000])
+    parser.add_argument("--max-points", type = int, default = eda_plots.max_scatter_points)
+    args = parser.parse_args()
+
+    print(f"{'rows':>8} {'every_row_s':>11} {'every_row_mb':>12} {'summary_s':>9} {'summary_kb':>10}")
+    for n in args.rows:
+        df = synthetic.census_frame(n, seed = 7)
+        df["income_above_limit"] = np.where(np.random.default_rng(0).random(n) < 0.1, "Above limit", "Below limit")
+        full_s, full_bytes = measure(every_row, df, args.max_points)
+        summary_s, summary_bytes = measure(summarised, df, args.max_points)
+        print(f"{n:>8} {full_s:>11.2f} {full_bytes / 1e6:>12.1f} {summary_s:>9.2f} {summary_bytes / 1e3:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import history_store
+import schema
+import synthetic
+
+
+# History rows as make_single_prediction builds them, spread over a year, both models and both labels
+def history_rows(n, seed = 0):
+    df = synthetic.census_frame(n, seed = seed)
+    rng = np.random.default_rng(seed)
+    days = np.sort(rng.integers(0, 365, n))
+    probability = np.round(rng.uniform(50, 100, n), 2)
+    above = rng.random(n) < 0.1
+    return [[record["ID"], str(np.datetime64("2024-01-01") + day), "12:00"] + [record[feature] for feature in schema.model_features]
+            + [["XGBoost", "Random Forest"][i % 2], "Above limit" if above[i] else "Below limit", float(probability[i])]
+            for i, (record, day) in enumerate(zip(df.to_dict("records"), days))]
+
+
+# Each session thread saves its share of rows, timing every call
+def run_sessions(save, rows, sessions):
+    latencies = [[] for _ in range(sessions)]
+
+    def session(i):
+        for row in rows[i::sessions]:
+            start = time.perf_counter()
+            save(row)
+            latencies[i].append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target = session, args = (i,)) for i in range(sessions)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    history_store.flush()
+    return time.perf_counter() - start, np.concatenate([np.array(l) for l in latencies]) * 1000
+
+
+# Latency of the first and a deep page of a History page query, and of its count
+def page_latency(filters, sort_by, descending, page_size = 50, depth = 100):
+    start = time.perf_counter()
+    _, cursor = history_store.query(filters, sort_by, descending, page_size)
+    first = time.perf_counter() - start
+    for _ in range(depth - 2):
+        _, cursor = history_store.query(filters, sort_by, descending, page_size, cursor)
+    start = time.perf_counter()
+    history_store.query(filters, sort_by, descending, page_size, cursor)
+    deep = time.perf_counter() - start
+    start = time.perf_counter()
+    history_store.count(filters)
+    return first * 1000, deep * 1000, (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Single prediction history: saving through the background writer, and History page queries")
+    parser.add_argument("--rows", type = int, default = 2000)
+    parser.add_argument("--sessions", type = int, default = 8)
+    parser.add_argument("--history-rows", type = int, nargs = "+", default = [10000, 100000],
+                        help = "history sizes to time History page queries at")
+    args = parser.parse_args()
+
+    rows = history_rows(args.rows)
+    print(f"rows={args.rows} sessions={args.sessions}")
+    print(f"{'path':>10} {'mean_ms':>8} {'p99_ms':>8} {'total_s':>8} {'stored':>7}")
+    with tempfile.TemporaryDirectory() as directory:
+        for path, save in [("direct", history_store.add_prediction), ("queued", history_store.submit_prediction)]:
+            history_store._connection = None
+            history_store.db_path = os.path.join(directory, f"{path}.db")
+            total, latencies = run_sessions(save, rows, args.sessions)
+            stored = history_store.count()
+            print(f"{path:>10} {latencies.mean():>8.3f} {np.percentile(latencies, 99):>8.3f} {total:>8.2f} {stored:>7}")
+            assert stored == args.rows and history_store.read_latest(args.rows)["ID"].notna().all()
+            history_store._connection.close()
+
+        print(f"{'history':>8} {'query':>28} {'page1_ms':>9} {'page100_ms':>10} {'count_ms':>9}")
+        queries = {
+            "newest first": ({}, "seq", True),
+            "probability, high first": ({}, "Probability", True),
+            "filtered, by probability": ({"models": ["XGBoost"], "labels": ["Below limit"], "probability": (60, 90)}, "Probability", True),
+            "filtered, newest first": ({"date_from": "2024-03-01", "labels": ["Above limit"]}, "seq", True),
+            "ID prefix": ({"id_prefix": "ID_TZ00001"}, "seq", True),
+        }
+        for n in args.history_rows:
+            history_store._connection = None
+            history_store.db_path = os.path.join(directory, f"pages_{n}.db")
+            history_store.add_predictions(history_rows(n, seed = 1))
+            for name, query in queries.items():
+                first, deep, counted = page_latency(*query)
+                print(f"{n:>8} {name:>28} {first:>9.2f} {deep:>10.2f} {counted:>9.2f}")
+            history_store._connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import kpi_cube
+import synthetic
+
+
+# The KPI Dashboard's previous work on raw rows for one set of filters
+def raw_kpis(df, age, gender, tax_status):
+    filtered_df = df[(df["age"] >= age[0]) & (df["age"] <= age[1]) & (df["gender"] == gender) & (df["tax_status"] == tax_status)]
+    counts = [filtered_df[filtered_df["income_above_limit"] == label].shape[0] for label in ["Above limit", "Below limit"]]
+    counts += [filtered_df[filtered_df["gender"] == value].shape[0] for value in ["Male", "Female"]]
+    filtered_df["income_above_limit"].value_counts()
+    for dimension in ["education", "industry_code_main"]:
+        filtered_df.groupby(by = [dimension, "income_above_limit"], observed = True).size().unstack().apply(lambda x: x / x.sum() * 100, axis = 1)
+    return counts
+
+
+# The same answers from the cube
+def cube_kpis(cube, age, gender, tax_status):
+    selected = kpi_cube.select(cube, age, gender, tax_status)
+    income_counts = kpi_cube.label_counts(cube, selected)
+    gender_counts = kpi_cube.gender_counts(cube, selected)
+    for dimension in ["education", "industry_code_main"]:
+        kpi_cube.breakdown(cube, selected, dimension).apply(lambda x: x / x.sum() * 100, axis = 1)
+    kpi_cube.cells(cube, selected, "country_of_birth_own")
+    return [int(income_counts.get(label, 0)) for label in ["Above limit", "Below limit"]] + [int(gender_counts.get(value, 0)) for value in ["Male", "Female"]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "KPI Dashboard filters answered from raw rows against the KPI cube")
+    parser.add_argument("--rows", type = int, nargs = "+", default = [50000, 200000, 800000])
+    parser.add_argument("--repeats", type = int, default = 20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'rows':>8} {'cube_cells':>10} {'build_s':>8} {'raw_ms':>8} {'cube_ms':>8}")
+    for n in args.rows:
+        df = synthetic.census_frame(n, seed = 3)
+        df["income_above_limit"] = np.where(rng.random(n) < 0.1, "Above limit", "Below limit")
+
+        start = time.perf_counter()
+        cube = kpi_cube.index(kpi_cube.build(df))
+        build = time.perf_counter() - start
+
+        filters = [((20, 60), "Male", df["tax_status"].iloc[i]) for i in range(args.repeats)]
+        start = time.perf_counter()
+        raw = [raw_kpis(df, *f) for f in filters]
+        raw_ms = (time.perf_counter() - start) * 1000 / args.repeats
+        start = time.perf_counter()
+        cubed = [cube_kpis(cube, *f) for f in filters]
+        cube_ms = (time.perf_counter() - start) * 1000 / args.repeats
+        assert raw == cubed
+        print(f"{n:>8} {cube.rows:>10} {build:>8.2f} {raw_ms:>8.1f} {cube_ms:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+import argparse
+import gc
+import json
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from unittest.mock import MagicMock
+from urllib import parse
+import numpy as np
+import psutil
+from streamlit.runtime import Runtime
+from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+from streamlit.runtime.media_file_manager import MediaFileManager
+from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+from streamlit.runtime.pages_manager import PagesManager
+from streamlit.testing.v1 import AppTest
+from streamlit.testing.v1.local_script_runner import LocalScriptRunner
+from streamlit.testing.v1.util import patch_config_options
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import schema
+import synthetic
+
+package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The app script run by every simulated session; like `streamlit run`, it
+# re-executes app.py on each rerun with the package importable
+runner_script = """
+import runpy, sys
+sys.path.insert(0, {package_dir!r})
+runpy.run_path({app_path!r}, run_name = "__main__")
+"""
+
+
+# A directory the app can run from: config, assets, a Test.csv of the given
+# size and models. Look-alike models are fitted when models/ only holds Git
+# LFS pointers.
+def prepare_workspace(work_dir, test_rows):
+    shutil.copy(os.path.join(package_dir, "config.yaml"), work_dir)
+    shutil.copytree(os.path.join(package_dir, "assets"), os.path.join(work_dir, "assets"))
+    os.makedirs(os.path.join(work_dir, "data"))
+    synthetic.write_census_csv(os.path.join(work_dir, "data", "Test.csv"), test_rows)
+
+    import joblib
+    os.makedirs(os.path.join(work_dir, "models"))
+    cwd = os.getcwd()
+    os.chdir(package_dir)
+    try:
+        models, encoder = synthetic.load_models()
+    finally:
+        os.chdir(cwd)
+    joblib.dump(models["XGBoost"], os.path.join(work_dir, "models", "xgboost_model.joblib"))
+    joblib.dump(models["Random Forest"], os.path.join(work_dir, "models", "random_forest_model.joblib"))
+    joblib.dump(encoder, os.path.join(work_dir, "models", "encoder.joblib"))
+
+    script_path = os.path.join(work_dir, "run_app.py")
+    with open(script_path, "w") as f:
+        f.write(runner_script.format(package_dir = package_dir, app_path = os.path.join(package_dir, "app.py")))
+    return script_path
+
+
+# AppTest puts a new mock runtime in place for every run and removes it
+# afterwards, so one session finishing pulls the runtime from under the others
+# and no run sees another's st.cache_data. Here every session runs against one
+# runtime, as the sessions of a server share its runtime.
+class SharedRuntimeAppTest(AppTest):
+    def _run(self, widget_state = None, timeout = None):
+        script_runner = LocalScriptRunner(self._script_path, self.session_state,
+                                          PagesManager(self._script_path, setup_watcher = False),
+                                          args = self.args, kwargs = self.kwargs)
+        self._tree = script_runner.run(widget_state, self.query_params, timeout or self.default_timeout, self._page_hash)
+        self._tree._runner = self
+        self.query_params = parse.parse_qs(script_runner.event_data[-1]["client_state"].query_string)
+        return self
+
+
+def start_shared_runtime():
+    runtime = MagicMock(spec = Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    Runtime._instance = runtime
+
+
+def widget(widgets, label):
+    return next(w for w in widgets if w.label == label)
+
+
+# One analyst: logs in, pages through the Data Hub, makes single and bulk
+# predictions, browses the history and both dashboards. Every rerun's latency
+# is recorded under the step it belongs to.
+class Session:
+    def __init__(self, script_path, bulk_frame, pages, seed, username, password):
+        self.at = SharedRuntimeAppTest(script_path, default_timeout = 600)
+        self.bulk_frame = bulk_frame
+        self.pages = pages
+        self.rng = random.Random(seed)
+        self.username = username
+        self.password = password
+        self.latencies = {}
+        self.errors = []
+        self.step = None
+
+    def rerun(self, step):
+        self.step = step
+        start = time.perf_counter()
+        self.at.run()
+        self.latencies.setdefault(step, []).append(time.perf_counter() - start)
+        self.errors += [f"{step}: {exception.value}" for exception in self.at.exception]
+
+    def open_page(self, page):
+        self.at.sidebar.selectbox[0].set_value(page)
+        self.rerun(page)
+
+    def login(self):
+        self.rerun("login_screen")
+        self.at.sidebar.text_input[0].input(self.username)
+        self.at.sidebar.text_input[1].input(self.password)
+        self.at.sidebar.button[0].click()
+        self.rerun("login")
+
+    def data_hub(self):
+        self.open_page("Data Page")
+        self.at.sidebar.radio(key = "option_selected").set_value("Data Hub")
+        self.rerun("data_hub_page")
+        for _ in range(self.pages):
+            self.at.sidebar.number_input(key = "page_num_1").set_value(self.rng.randrange(0, 20))
+            self.rerun("data_hub_page")
+
+    def single_prediction(self):
+        self.open_page("Predict Page")
+        for key in ["gender", "education", "tax_status", "country_of_birth_own"]:
+            self.at.selectbox(key = key).set_value(self.rng.choice(schema.category_options[key]))
+        self.at.number_input(key = "age").set_value(self.rng.randrange(16, 90))
+        self.at.number_input(key = "importance_of_record").set_value(round(self.rng.uniform(40, 3000), 2))
+        self.at.text_input(key = "ID").input(f"ID_TZ{self.rng.randrange(10 ** 7):07d}")
+        widget(self.at.button, "Make Prediction").click()
+        self.rerun("single_prediction")
+
+    # File uploads cannot be simulated, so the session holds a cleaned page as the Data Page leaves it
+    def bulk_prediction(self):
+        self.at.session_state["uploaded_data"] = self.bulk_frame
+        widget(self.at.sidebar.radio, "Choose Prediction Type").set_value("Bulk Prediction")
+        self.rerun("bulk_prediction_page")
+        widget(self.at.button, "Make Bulk Prediction").click()
+        self.rerun("bulk_prediction")
+        widget(self.at.sidebar.radio, "Choose Prediction Type").set_value("Single Prediction")
+
+    def history(self):
+        self.open_page("History Page")
+        widget(self.at.button, "View History").click()
+        self.rerun("history")
+
+    def dashboard(self):
+        self.open_page("Dashboard Page")
+        widget(self.at.sidebar.radio, "Select Dashboard").set_value("KPI Dashboard")
+        self.rerun("dashboard_kpi")
+        for _ in range(self.pages):
+            self.at.sidebar.selectbox(key = "gender").set_value(self.rng.choice(["Male", "Female"]))
+            low = self.rng.randrange(0, 60)
+            self.at.sidebar.slider(key = "age").set_value((low, low + self.rng.randrange(5, 30)))
+            self.rerun("dashboard_kpi")
+        widget(self.at.sidebar.radio, "Select Dashboard").set_value("EDA Dashboard")
+
+    def run(self, rounds):
+        try:
+            self.login()
+            for _ in range(rounds):
+                self.data_hub()
+                self.single_prediction()
+                self.bulk_prediction()
+                self.history()
+                self.dashboard()
+        except Exception as e:
+            self.errors.append(f"{self.step}: {type(e).__name__}: {e}")
+
+
+def cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+# Highest current RSS of this process while a run is going, sampled in the background
+class RssSampler:
+    def __init__(self, interval = 0.05):
+        self.process = psutil.Process()
+        self.interval = interval
+        self.peak = self.process.memory_info().rss
+        self.done = threading.Event()
+        self.thread = threading.Thread(target = self._run, daemon = True)
+
+    def _run(self):
+        while not self.done.wait(self.interval):
+            self.peak = max(self.peak, self.process.memory_info().rss)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.done.set()
+        self.thread.join()
+        self.peak = max(self.peak, self.process.memory_info().rss)
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Concurrent sessions against the app through AppTest: rerun latency per step, CPU and memory growth")
+    parser.add_argument("--sessions", type = int, nargs = "+", default = [1, 4, 8])
+    parser.add_argument("--rounds", type = int, default = 2, help = "Times each session goes through every page after login")
+    parser.add_argument("--pages", type = int, default = 3, help = "Data Hub pages and KPI filter changes per round")
+    parser.add_argument("--bulk-rows", type = int, default = 2000)
+    parser.add_argument("--test-rows", type = int, default = 100000, help = "Rows of the generated data/Test.csv")
+    parser.add_argument("--username", default = "test_user")
+    parser.add_argument("--password", default = "user123")
+    parser.add_argument("--output", help = "Write the results to this JSON file")
+    args = parser.parse_args()
+
+    # The app reads config.yaml, data/ and models/ relative to the working directory
+    output = os.path.abspath(args.output) if args.output else None
+    cwd = os.getcwd()
+    work_dir = tempfile.mkdtemp()
+    script_path = prepare_workspace(work_dir, args.test_rows)
+    os.chdir(work_dir)
+    bulk_frame = schema.clean_columns(synthetic.census_frame(args.bulk_rows, seed = 4, raw = True))
+    start_shared_runtime()
+    results = []
+
+    # One unmeasured session first, so model loads and shared caches are not
+    # counted as the memory of the first session count
+    with patch_config_options({"global.appTest": True}):
+        Session(script_path, bulk_frame, args.pages, 0, args.username, args.password).run(1)
+
+    for count in args.sessions:
+        # Memory is measured from here, after the workspace, models and earlier runs
+        sessions = threads = None
+        gc.collect()
+        rss_before = psutil.Process().memory_info().rss
+        sessions = [Session(script_path, bulk_frame, args.pages, seed, args.username, args.password) for seed in range(count)]
+        threads = [threading.Thread(target = session.run, args = (args.rounds,)) for session in sessions]
+        cpu_start, wall_start = cpu_seconds(), time.perf_counter()
+        with patch_config_options({"global.appTest": True}), RssSampler() as rss:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        wall = time.perf_counter() - wall_start
+        cpu = cpu_seconds() - cpu_start
+
+        latencies = {}
+        for session in sessions:
+            for step, timings in session.latencies.items():
+                latencies.setdefault(step, []).extend(timings)
+        reruns = sum(len(timings) for timings in latencies.values())
+        errors = [error for session in sessions for error in session.errors]
+
+        # Growth of the current RSS over this run alone, not the process high-water mark
+        rss_before_mb = rss_before / 1e6
+        rss_growth_mb = (rss.peak - rss_before) / 1e6
+        print(f"\n{count} sessions: {reruns} reruns in {wall:.1f}s ({reruns / wall:.1f}/s), "
+              f"CPU {cpu:.1f}s ({cpu / wall:.0%} of one core), RSS {rss_before_mb:.0f} MB before, "
+              f"+{rss_growth_mb:.0f} MB at peak ({rss_growth_mb / count:.1f} MB per session), {len(errors)} errors")
+        print(f"{'step':>22} {'reruns':>7} {'p50_s':>7} {'p90_s':>7} {'p99_s':>7} {'max_s':>7}")
+        steps = {}
+        for step, timings in latencies.items():
+            p50, p90, p99 = np.percentile(timings, [50, 90, 99])
+            steps[step] = {"reruns": len(timings), "p50_s": p50, "p90_s": p90, "p99_s": p99, "max_s": max(timings)}
+            print(f"{step:>22} {len(timings):>7} {p50:>7.2f} {p90:>7.2f} {p99:>7.2f} {max(timings):>7.2f}")
+        for error in sorted(set(errors))[:10]:
+            print(f"  error: {error[:200]}")
+        results.append({"sessions": count, "reruns": reruns, "wall_s": wall, "cpu_s": cpu, "rss_before_mb": rss_before_mb,
+                        "rss_growth_mb": rss_growth_mb, "rss_growth_per_session_mb": rss_growth_mb / count,
+                        "errors": errors, "steps": steps})
+
+    os.chdir(cwd)
+    shutil.rmtree(work_dir, ignore_errors = True)
+    if output:
+        with open(output, "w") as f:
+            json.dump({"rounds": args.rounds, "pages": args.pages, "bulk_rows": args.bulk_rows,
+                       "test_rows": args.test_rows, "results": results}, f, indent = 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import page_index
+
+
+# Old Data Hub behaviour: parse every chunk up to the requested page
+def naive_page(file_path, chunk_size, page_number):
+    for idx, chunk in enumerate(pd.read_csv(file_path, chunksize = chunk_size)):
+        if idx == page_number:
+            return chunk
+    return None
+
+
+# Write a census-shaped CSV with the given number of rows
+def write_csv(file_path, rows):
+    rng = np.random.default_rng(0)
+    pd.DataFrame({
+        "ID": [f"ID_TZ{i:07d}" for i in range(rows)],
+        "age": rng.integers(0, 91, rows),
+        "gender": rng.choice([" Female", " Male"], rows),
+        "education": rng.choice([" High school graduate", " Children", " Bachelors degree(BA AB BS)"], rows),
+        "wage_per_hour": rng.integers(0, 2000, rows),
+        "gains": rng.integers(0, 99999, rows),
+        "importance_of_record": rng.uniform(30, 3000, rows).round(2),
+    }).to_csv(file_path, index = False)
+
+
+# Pages read through the index must match pandas on the awkward cases: literal,
+# escaped and multi-line quotes, whitespace-only lines and every line ending,
+# with blocks small enough to split records and quotes across reads
+def check_equivalence():
+    rng = np.random.default_rng(1)
+    fields = ["1", "ab", 'x"y', '"q,1"', '"a""b"', '"l\nm"', '"e""\n"', "", "z\"\""]
+    block_size = page_index.block_size
+    try:
+        for trial in range(300):
+            newline = ["\n", "\r\n", "\r"][trial % 3]
+            # pandas itself drops the leading empty field of a row that follows a
+            # blank line in a CR-only file, so those files get no blank lines
+            blank_share = 0 if newline == "\r" else 0.1
+            lines = ["a,b,c"] + [rng.choice(["", "  ", "\t"]) if rng.random() < blank_share else ",".join(rng.choice(fields, 3))
+                                 for _ in range(rng.integers(0, 12))]
+            data = (newline.join(lines) + rng.choice([newline, ""])).encode()
+            # A quoted "\n" inside a CR-only file would make it look like an LF file
+            if newline == "\r":
+                data = data.replace(b"\n", b" ")
+            try:
+                expected = pd.read_csv(io.BytesIO(data), dtype = str, keep_default_na = False)
+            except pd.errors.ParserError:
+                continue
+            page_index.block_size = int(rng.choice([1, 3, 7, 64]))
+            chunk_size = int(rng.integers(1, 4))
+            index = page_index.build_page_index(io.BytesIO(data), chunk_size)
+            assert index["n_rows"] == len(expected), f"row count differs for {data!r}"
+            for page, offset in enumerate(index["offsets"]):
+                chunk = pd.read_csv(io.BytesIO(data[offset:]), header = None, names = expected.columns, nrows = chunk_size,
+                                    dtype = str, keep_default_na = False)
+                wanted = expected.iloc[page * chunk_size:(page + 1) * chunk_size].reset_index(drop = True)
+                assert chunk.equals(wanted), f"page {page} differs for {data!r}"
+    finally:
+        page_index.block_size = block_size
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Data Hub paging latency: chunk iteration vs page index")
+    parser.add_argument("--rows", type = int, default = 1_000_000)
+    parser.add_argument("--chunk-size", type = int, default = 5000)
+    args = parser.parse_args()
+
+    check_equivalence()
+    with tempfile.TemporaryDirectory() as tmp:
+        page_index.cache_dir = os.path.join(tmp, "cache")
+        file_path = os.path.join(tmp, "bench.csv")
+        write_csv(file_path, args.rows)
+
+        build_time = timed(page_index.load_page_index, file_path, args.chunk_size)
+        print(f"rows={args.rows} chunk_size={args.chunk_size} index_build={build_time:.3f}s")
+
+        last_page = (args.rows - 1) // args.chunk_size
+        print(f"{'page':>8} {'naive_s':>10} {'indexed_s':>10}")
+        for page_number in sorted({0, last_page // 4, last_page // 2, last_page}):
+            naive = timed(naive_page, file_path, args.chunk_size, page_number)
+            indexed = timed(page_index.read_page, file_path, args.chunk_size, page_number)
+            print(f"{page_number:>8} {naive:>10.4f} {indexed:>10.4f}")
+
+
+if __name__ == "__main__":
+    main()
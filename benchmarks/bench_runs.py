@@ -0,0 +1,53 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import bulk_runs
+import synthetic
+
+
+# A scored frame as a bulk run stores it
+def scored_frame(n, seed):
+    df = synthetic.census_frame(n, seed = seed)
+    df.insert(1, "Prediction_Date", "2024-01-01")
+    df["Model_used"] = "XGBoost"
+    df["income_above_limit"] = "Below limit"
+    df["Probability"] = 90.0
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Loading every bulk run: incremental reload against reading all runs again")
+    parser.add_argument("--runs", type = int, default = 10)
+    parser.add_argument("--run-rows", type = int, default = 50000)
+    args = parser.parse_args()
+
+    columns = ["age", "gender", "education", "income_above_limit"]
+    print(f"runs={args.runs} run_rows={args.run_rows}")
+    print(f"{'runs':>5} {'full_ms':>9} {'incremental_ms':>15} {'unchanged_ms':>13}")
+    with tempfile.TemporaryDirectory() as directory:
+        bulk_runs.runs_dir = directory
+        for i in range(args.runs):
+            bulk_runs.save_run("bench", scored_frame(args.run_rows, seed = i), "XGBoost")
+
+            # The previous load is what the incremental path builds on
+            start = time.perf_counter()
+            df = bulk_runs.load_all_runs("bench", columns)
+            incremental = time.perf_counter() - start
+
+            start = time.perf_counter()
+            bulk_runs.load_all_runs("bench", columns)
+            unchanged = time.perf_counter() - start
+
+            start = time.perf_counter()
+            full = bulk_runs.read_runs("bench", columns = columns)
+            full_seconds = time.perf_counter() - start
+            assert len(df) == len(full) == (i + 1) * args.run_rows
+            print(f"{i + 1:>5} {full_seconds * 1000:>9.1f} {incremental * 1000:>15.1f} {unchanged * 1000:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import schema
+import scoring
+import synthetic
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Sharded predict_proba scaling from 1 to N workers")
+    parser.add_argument("--rows", type = int, default = 200_000)
+    parser.add_argument("--max-workers", type = int, default = scoring.default_workers)
+    parser.add_argument("--repeats", type = int, default = 3)
+    args = parser.parse_args()
+
+    models, _ = synthetic.load_models()
+    features = schema.model_input(schema.clean_columns(synthetic.census_frame(args.rows, raw = True)))
+    print(f"rows={args.rows} cpus={os.cpu_count()}")
+    print(f"{'model':>14} {'executor':>8} {'workers':>7} {'seconds':>8} {'rows/s':>10} {'speedup':>7}")
+
+    for name, model in models.items():
+        reference = model.predict_proba(features)
+        for executor in ["thread", "process"]:
+            baseline = None
+            for workers in range(1, args.max_workers + 1):
+                # Warm-up call starts the pool and checks results match the unsharded call
+                result = scoring.predict_proba(model, features, workers, executor)
+                assert np.allclose(result, reference), "sharded result differs from predict_proba"
+
+                timings = []
+                for _ in range(args.repeats):
+                    start = time.perf_counter()
+                    scoring.predict_proba(model, features, workers, executor)
+                    timings.append(time.perf_counter() - start)
+                elapsed = min(timings)
+                baseline = baseline or elapsed
+                print(f"{name:>14} {executor:>8} {workers:>7} {elapsed:>8.3f} {args.rows / elapsed:>10,.0f} {baseline / elapsed:>7.2f}")
+    scoring.shutdown_pools()
+
+
+if __name__ == "__main__":
+    main()
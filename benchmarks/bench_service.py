@@ -0,0 +1,88 @@
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import serve
+import synthetic
+
+
+def run_server(port, max_batch_size, max_wait, ready):
+    models, encoder = synthetic.load_models()
+    server = serve.make_server(models["XGBoost"], encoder, port = port, max_batch_size = max_batch_size, max_wait = max_wait)
+    ready.set()
+    server.serve_forever()
+
+
+# Each client sends single-row requests back to back over one keep-alive connection
+def run_client(port, payloads, latencies):
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    for payload in payloads:
+        start = time.perf_counter()
+        connection.request("POST", "/predict", payload, {"Content-Type": "application/json"})
+        response = connection.getresponse()
+        response.read()
+        assert response.status == 200, response.status
+        latencies.append(time.perf_counter() - start)
+    connection.close()
+
+
+def measure(port, max_batch_size, max_wait, clients, requests_per_client, records):
+    context = multiprocessing.get_context("spawn")
+    ready = context.Event()
+    server = context.Process(target = run_server, args = (port, max_batch_size, max_wait, ready), daemon = True)
+    server.start()
+    ready.wait()
+    time.sleep(0.2)
+
+    payloads = [json.dumps(record) for record in records]
+    # Warm-up so connection set-up and first-call costs are not measured
+    run_client(port, payloads[:20], [])
+
+    latencies = []
+    threads = [
+        threading.Thread(target = run_client, args = (port, payloads[i::clients][:requests_per_client], latencies))
+        for i in range(clients)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    connection.request("GET", "/health")
+    health = json.loads(connection.getresponse().read())
+    server.terminate()
+    server.join()
+
+    latencies = np.array(latencies) * 1000
+    return np.percentile(latencies, 50), np.percentile(latencies, 99), len(latencies) / elapsed, health["rows"] / max(health["batches"], 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Latency and throughput of the scoring service with and without micro-batching")
+    parser.add_argument("--clients", type = int, default = 16)
+    parser.add_argument("--requests", type = int, default = 100, help = "requests per client")
+    parser.add_argument("--port", type = int, default = 8765)
+    args = parser.parse_args()
+
+    df = synthetic.census_frame(args.clients * args.requests, seed = 3)
+    records = json.loads(df.to_json(orient = "records"))
+    print(f"clients={args.clients} requests={args.clients * args.requests} cpus={os.cpu_count()}")
+    print(f"{'max_batch':>9} {'max_wait_ms':>11} {'p50_ms':>8} {'p99_ms':>8} {'req/s':>8} {'avg_batch':>9}")
+
+    for max_batch_size, max_wait in [(1, 0.0), (16, 0.002), (64, 0.005)]:
+        p50, p99, throughput, avg_batch = measure(args.port, max_batch_size, max_wait, args.clients, args.requests, records)
+        print(f"{max_batch_size:>9} {max_wait * 1000:>11.1f} {p50:>8.1f} {p99:>8.1f} {throughput:>8.0f} {avg_batch:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import schema
+import scoring
+import synthetic
+
+
+# The previous make_single_prediction: one-row frame, predict_proba, then a copied and extended history frame
+def frame_prediction(model, encoder, values):
+    df = pd.DataFrame([[values[feature] for feature in schema.expected_features]], columns = schema.expected_features)
+    probability = model.predict_proba(schema.model_input(df))
+    pred = int((probability[:, 1] >= 0.5).astype(int)[0])
+    prediction = encoder.inverse_transform([pred])[0]
+    history_df = df.copy()
+    history_df.insert(1, "Prediction_Date", "2024-01-01")
+    history_df.insert(2, "Prediction_Time", "00:00")
+    return probability, prediction
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Single prediction latency: DataFrame path against the fast path and its cache")
+    parser.add_argument("--requests", type = int, default = 2000)
+    parser.add_argument("--distinct", type = int, default = 500, help = "distinct records the requests are drawn from")
+    args = parser.parse_args()
+
+    models, encoder = synthetic.load_models()
+    records = synthetic.census_frame(args.distinct, seed = 11).to_dict("records")
+    rng = np.random.default_rng(0)
+    requests = [records[i] for i in rng.integers(0, len(records), args.requests)]
+
+    print(f"requests={args.requests} distinct={args.distinct}")
+    print(f"{'model':>14} {'path':>10} {'mean_ms':>8} {'p99_ms':>8}")
+    for name, model in models.items():
+        for path in ["frame", "fast"]:
+            timings = []
+            for values in requests:
+                start = time.perf_counter()
+                if path == "frame":
+                    frame_prediction(model, encoder, values)
+                else:
+                    scoring.predict_single(model, encoder, values, name)
+                timings.append(time.perf_counter() - start)
+            timings = np.array(timings) * 1000
+            print(f"{name:>14} {path:>10} {timings.mean():>8.3f} {np.percentile(timings, 99):>8.3f}")
+
+    stats = scoring.single_prediction_stats()
+    print(f"cache hit rate {stats['hit_rate']:.1%} ({stats['hits']} hits, {stats['misses']} misses)")
+    for stage, timing in stats["stages"].items():
+        print(f"  {stage:>10} {timing['mean_ms']:.3f} ms over {timing['count']} calls")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Run in a fresh interpreter so every import is cold. Streamlit itself is
+# imported first, as the server has it loaded before the app script runs.
+cold_start = """
+import json, sys, time
+sys.path.insert(0, {app_dir!r})
+from streamlit.testing.v1 import AppTest
+heavy = ["pandas", "plotly", "pyarrow", "sklearn", "xgboost", "matplotlib", "seaborn"]
+results = {{}}
+at = AppTest.from_file({app_path!r}, default_timeout = 600)
+start = time.perf_counter()
+at.run()
+results["login_screen"] = time.perf_counter() - start
+results["loaded"] = [name for name in heavy if name in sys.modules]
+at.sidebar.text_input[0].input({username!r})
+at.sidebar.text_input[1].input({password!r})
+at.sidebar.button[0].click()
+start = time.perf_counter()
+at.run()
+results["Home Page"] = time.perf_counter() - start
+for page in {pages!r}:
+    at.sidebar.selectbox[0].set_value(page)
+    start = time.perf_counter()
+    at.run()
+    results[page] = time.perf_counter() - start
+results["exceptions"] = len(at.exception)
+print(json.dumps(results))
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Cold start of the app: time to the login screen and to each page's first view")
+    parser.add_argument("--app", default = os.path.join(package_dir, "app.py"), help = "app.py to start, e.g. from another checkout")
+    parser.add_argument("--cwd", default = package_dir, help = "Directory with config.yaml, assets/, models/ and data/")
+    parser.add_argument("--username", default = "test_user")
+    parser.add_argument("--password", default = "user123")
+    parser.add_argument("--pages", nargs = "+", default = ["Data Page", "Predict Page", "History Page", "Dashboard Page"])
+    parser.add_argument("--repeats", type = int, default = 3)
+    args = parser.parse_args()
+
+    app_path = os.path.abspath(args.app)
+    code = cold_start.format(app_dir = os.path.dirname(app_path), app_path = app_path, username = args.username,
+                             password = args.password, pages = args.pages)
+    runs = []
+    for _ in range(args.repeats):
+        output = subprocess.run([sys.executable, "-c", code], cwd = args.cwd, capture_output = True, text = True, check = True).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f"Heavy modules loaded for the login screen: {', '.join(runs[0]['loaded']) or 'none'}")
+    print(f"Exceptions raised: {runs[0]['exceptions']}")
+    print(f"{'step':>16} {'best_s':>7} {'median_s':>8}")
+    for step in ["login_screen", "Home Page"] + args.pages:
+        timings = sorted(run[step] for run in runs)
+        print(f"{step:>16} {timings[0]:>7.2f} {timings[len(timings) // 2]:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import joblib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import columnar_cache
+import page_index
+import scoring
+import synthetic
+
+
+# Runs in a fresh process so its peak RSS covers scoring only
+def score_file(cache, model_path, encoder_path, input_path, output_path, chunk_size, results):
+    page_index.cache_dir = columnar_cache.cache_dir = cache
+    model, encoder = joblib.load(model_path), joblib.load(encoder_path)
+    rows, elapsed = scoring.stream_bulk_prediction(input_path, model, encoder, output_path, chunk_size)
+    results.put((rows, elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Streaming bulk prediction throughput and peak memory")
+    parser.add_argument("--rows", type = int, default = 1_000_000)
+    parser.add_argument("--chunk-size", type = int, default = 50000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        models, encoder = synthetic.load_models()
+        model_path, encoder_path = os.path.join(tmp, "model.joblib"), os.path.join(tmp, "encoder.joblib")
+        joblib.dump(models["XGBoost"], model_path)
+        joblib.dump(encoder, encoder_path)
+
+        input_path = os.path.join(tmp, "upload.csv")
+        synthetic.write_census_csv(input_path, args.rows, chunk_rows = 100_000)
+
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        worker = context.Process(target = score_file, args = (os.path.join(tmp, "cache"), model_path, encoder_path, input_path,
+                                                              os.path.join(tmp, "scored.csv"), args.chunk_size, results))
+        worker.start()
+        rows, elapsed = results.get()
+        worker.join()
+
+        peak_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+        print(f"rows={rows} input={os.path.getsize(input_path) / 1e6:.0f}MB chunk_size={args.chunk_size}")
+        print(f"seconds={elapsed:.1f} rows_per_sec={rows / elapsed:,.0f} scoring_peak_rss={peak_rss:.0f}MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import schema
+import synthetic
+import tree_engine
+
+
+# Best of several timings, each long enough to be measured reliably
+def best_time(function, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Compiled tree engine against the fitted pipelines")
+    parser.add_argument("--batch-sizes", type = int, nargs = "+", default = [1, 100, 100_000])
+    parser.add_argument("--repeats", type = int, default = 5)
+    args = parser.parse_args()
+
+    models, _ = synthetic.load_models()
+    features = schema.model_input(schema.clean_columns(synthetic.census_frame(max(args.batch_sizes), seed = 7, raw = True)))
+    # Measure the NumPy traversal at every size; by default larger batches are routed to the pipeline
+    routed_above = tree_engine.max_compiled_rows
+    tree_engine.max_compiled_rows = None
+    print(f"{'model':>14} {'batch':>7} {'pipeline_ms':>11} {'compiled_ms':>11} {'speedup':>7} {'max_abs_diff':>12}")
+
+    for name, model in models.items():
+        start = time.perf_counter()
+        compiled = tree_engine.compile_pipeline(model)
+        print(f"{name}: compiled in {time.perf_counter() - start:.2f}s")
+        for batch_size in args.batch_sizes:
+            batch = features.iloc[:batch_size]
+            difference = np.abs(model.predict_proba(batch) - compiled.predict_proba(batch)).max()
+            repeats = args.repeats if batch_size > 1000 else args.repeats * 20
+            stock = best_time(lambda: model.predict_proba(batch), repeats)
+            fast = best_time(lambda: compiled.predict_proba(batch), repeats)
+            print(f"{name:>14} {batch_size:>7} {stock * 1000:>11.2f} {fast * 1000:>11.2f} {stock / fast:>7.2f} {difference:>12.2e}")
+    print(f"By default CompiledPipeline hands batches above {routed_above} rows to the fitted pipeline.")
+
+
+if __name__ == "__main__":
+    main()
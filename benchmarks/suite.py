@@ -0,0 +1,239 @@
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import bulk_runs
+import eda_plots
+import history_store
+import kpi_cube
+import page_index
+import running_stats
+import schema
+import scoring
+import synthetic
+
+package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# Inputs shared by the cases at one row count, built on first use and not timed
+class Inputs:
+    def __init__(self, rows, work_dir, chunk_size):
+        self.rows = rows
+        self.work_dir = work_dir
+        self.chunk_size = chunk_size
+        self._built = {}
+
+    def get(self, name):
+        if name not in self._built:
+            self._built[name] = getattr(self, f"_{name}")()
+        return self._built[name]
+
+    def _raw(self):
+        return synthetic.census_frame(self.rows, seed = 1, raw = True)
+
+    def _clean(self):
+        return schema.clean_columns(self.get("raw"))
+
+    def _csv(self):
+        file_path = os.path.join(self.work_dir, f"census_{self.rows}.csv")
+        synthetic.write_census_csv(file_path, self.rows)
+        return file_path
+
+    def _models(self):
+        return synthetic.load_models()
+
+    # Scored rows as a bulk run saves them, with labels from the synthetic income model
+    def _scored(self):
+        clean = self.get("clean")
+        labels = synthetic.income_labels(clean)
+        above = np.random.default_rng(2).uniform(0.5, 1.0, self.rows)
+        probability = np.column_stack([1 - above, above])
+        return scoring.add_prediction_columns(clean, labels, probability, scoring.bulk_model_name, datetime.date.today())
+
+    def _cube(self):
+        return kpi_cube.index(kpi_cube.build(self.get("scored")))
+
+
+# Each case takes the inputs and returns what to time; setup runs before
+# every repeat and is not timed
+cases = {}
+
+
+def case(name):
+    def register(function):
+        cases[name] = function
+        return function
+    return register
+
+
+@case("clean_columns")
+def clean_columns_case(inputs):
+    raw = inputs.get("raw")
+    return lambda: schema.clean_columns(raw), None
+
+
+@case("page_index_build")
+def page_index_build_case(inputs):
+    file_path = inputs.get("csv")
+    return lambda: page_index.build_page_index(file_path, inputs.chunk_size), None
+
+
+@case("page_read_last")
+def page_read_last_case(inputs):
+    file_path = inputs.get("csv")
+    page_index.cache_dir = os.path.join(inputs.work_dir, "cache")
+    last_page = (inputs.rows - 1) // inputs.chunk_size
+    page_index.read_page(file_path, inputs.chunk_size, last_page)
+    return lambda: page_index.read_page(file_path, inputs.chunk_size, last_page), None
+
+
+@case("bulk_prediction")
+def bulk_prediction_case(inputs):
+    models, encoder = inputs.get("models")
+    clean = inputs.get("clean")
+    return lambda: scoring.bulk_prediction(models["XGBoost"], clean, encoder), None
+
+
+@case("history_write")
+def history_write_case(inputs):
+    scored = inputs.get("scored")
+
+    # A new, empty store for every repeat
+    def setup():
+        if history_store._connection is not None:
+            history_store._connection.close()
+            history_store._connection = None
+        history_store.db_path = os.path.join(inputs.work_dir, f"history_{time.perf_counter_ns()}.db")
+        history_store.legacy_csv = os.path.join(inputs.work_dir, "no_history.csv")
+
+    return lambda: history_store.add_predictions(scored), setup
+
+
+@case("bulk_run_write")
+def bulk_run_write_case(inputs):
+    scored = inputs.get("scored")
+    bulk_runs.runs_dir = os.path.join(inputs.work_dir, "bulk_runs")
+    return lambda: bulk_runs.save_run("uploaded", scored, scoring.bulk_model_name), None
+
+
+@case("kpi_cube_build")
+def kpi_cube_build_case(inputs):
+    scored = inputs.get("scored")
+    return lambda: kpi_cube.index(kpi_cube.build(scored)), None
+
+
+@case("kpi_filter")
+def kpi_filter_case(inputs):
+    cube = inputs.get("cube")
+
+    def answer():
+        selected = kpi_cube.select(cube, (20, 60), "Male", "Single")
+        kpi_cube.label_counts(cube, selected)
+        kpi_cube.gender_counts(cube, selected)
+        for dimension in ["education", "industry_code_main", "country_of_birth_own"]:
+            kpi_cube.breakdown(cube, selected, dimension)
+
+    return answer, None
+
+
+@case("correlation_update")
+def correlation_update_case(inputs):
+    scored = inputs.get("scored")
+    return lambda: running_stats.CorrelationAccumulator().update(scored).corr(), None
+
+
+@case("eda_box_stats")
+def eda_box_stats_case(inputs):
+    scored = inputs.get("scored")
+    columns = ["age", "working_week_per_year", "industry_code", "occupation_code", "total_employed", "mig_year",
+               "losses", "importance_of_record", "gains", "wage_per_hour", "stocks_status"]
+    return lambda: eda_plots.box_stats(scored, columns), None
+
+
+@case("eda_scatter_sample")
+def eda_scatter_sample_case(inputs):
+    scored = inputs.get("scored")
+    columns = ["employment_stat", "wage_per_hour", "mig_year", "importance_of_record", "income_above_limit"]
+    return lambda: eda_plots.stratified_sample(scored[columns], "income_above_limit"), None
+
+
+def run_case(function, setup, repeats):
+    timings = []
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+        gc.collect()
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd = package_dir, capture_output = True,
+                              text = True, check = True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Print each case's median against a saved result, matched by case and rows
+def compare(results, baseline):
+    before = {(result["case"], result["rows"]): result for result in baseline["results"]}
+    print(f"\nAgainst {baseline['meta'].get('commit')} ({baseline['meta'].get('timestamp')})")
+    print(f"{'case':>20} {'rows':>9} {'before_s':>9} {'after_s':>9} {'speedup':>8}")
+    for result in results:
+        old = before.get((result["case"], result["rows"]))
+        if old is not None:
+            print(f"{result['case']:>20} {result['rows']:>9} {old['median_s']:>9.4f} {result['median_s']:>9.4f} "
+                  f"{old['median_s'] / max(result['median_s'], 1e-12):>7.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Benchmark suite: cleaning, paging, scoring, history and dashboard work at several sizes, as JSON")
+    parser.add_argument("--rows", type = int, nargs = "+", default = [10000, 100000, 1000000])
+    parser.add_argument("--cases", nargs = "+", choices = list(cases), default = list(cases))
+    parser.add_argument("--repeats", type = int, default = 3)
+    parser.add_argument("--chunk-size", type = int, default = 5000, help = "Rows per Data Hub page")
+    parser.add_argument("--output", help = "Write the results to this JSON file")
+    parser.add_argument("--compare", help = "JSON file of an earlier run to compare against")
+    args = parser.parse_args()
+
+    meta = {"commit": git_commit(), "timestamp": datetime.datetime.now().isoformat(timespec = "seconds"),
+            "python": platform.python_version(), "platform": platform.platform(), "cpu_count": os.cpu_count(),
+            "repeats": args.repeats, "chunk_size": args.chunk_size}
+    results = []
+    print(f"{'case':>20} {'rows':>9} {'best_s':>9} {'median_s':>9} {'rows_per_s':>12}")
+    with tempfile.TemporaryDirectory() as work_dir:
+        for rows in args.rows:
+            inputs = Inputs(rows, work_dir, args.chunk_size)
+            for name in args.cases:
+                function, setup = cases[name](inputs)
+                timings = run_case(function, setup, args.repeats)
+                median = statistics.median(timings)
+                results.append({"case": name, "rows": rows, "best_s": min(timings), "median_s": median,
+                                "rows_per_s": rows / median if median > 0 else None, "timings_s": timings})
+                print(f"{name:>20} {rows:>9} {min(timings):>9.4f} {median:>9.4f} {rows / median:>12,.0f}")
+            del inputs
+            gc.collect()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"meta": meta, "results": results}, f, indent = 1)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import schema
+
+
+# Skewed category weights: the entry form lists the common values first
+def _weights(count):
+    weights = 1.0 / np.arange(1, count + 1) ** 1.5
+    return weights / weights.sum()
+
+
+def _categorical(rng, options, rows):
+    labels = np.array(options, dtype = object)
+    return labels[rng.choice(len(labels), rows, p = _weights(len(labels)))]
+
+
+# Mostly zero with a long positive tail, like the census money columns
+def _sparse(rng, rows, share, low, high):
+    values = rng.integers(low, high + 1, rows)
+    return np.where(rng.random(rows) < share, values, 0)
+
+
+# Vectorized census-shaped frame with the 28 expected features. raw=True mimics
+# the CSV files instead: leading spaces, "?" for missing and the dropped columns.
+def census_frame(rows, seed = 0, raw = False, start_id = 0):
+    rng = np.random.default_rng(seed)
+    data = {"ID": np.char.add("ID_TZ", np.char.zfill(np.arange(start_id, start_id + rows).astype(str), 7)).astype(object)}
+
+    numeric = {
+        "age": rng.integers(0, 91, rows),
+        "employment_stat": rng.choice(3, rows, p = [0.5, 0.45, 0.05]),
+        "wage_per_hour": _sparse(rng, rows, 0.06, 200, 2500),
+        "working_week_per_year": np.where(rng.random(rows) < 0.45, 0, np.where(rng.random(rows) < 0.75, 52, rng.integers(1, 52, rows))),
+        "industry_code": rng.integers(0, 52, rows),
+        "occupation_code": rng.integers(0, 47, rows),
+        "total_employed": rng.integers(0, 7, rows),
+        "vet_benefit": rng.choice(3, rows, p = [0.01, 0.23, 0.76]),
+        "gains": _sparse(rng, rows, 0.04, 100, 99999),
+        "losses": _sparse(rng, rows, 0.02, 155, 4608),
+        "stocks_status": _sparse(rng, rows, 0.1, 1, 99999),
+        "mig_year": rng.choice([94, 95], rows),
+        "importance_of_record": np.round(np.clip(rng.lognormal(7.3, 0.5, rows), 37.87, 18656.3), 2),
+    }
+
+    for col in schema.expected_features[1:]:
+        if col in schema.category_options:
+            data[col] = _categorical(rng, schema.category_options[col], rows)
+        else:
+            data[col] = numeric[col]
+    df = pd.DataFrame(data)
+
+    if raw:
+        for col in schema.category_options:
+            values = (" " + df[col]).to_numpy(dtype = object)
+            values[rng.random(rows) < 0.02] = " ?"
+            df[col] = values
+        for col in schema.columns_to_drop:
+            df[col] = np.array([" Not in universe", " ?"], dtype = object)[rng.integers(0, 2, rows)]
+    return df
+
+
+# Write a raw census CSV of any size without holding it in memory
+def write_census_csv(file_path, rows, chunk_rows = 500_000, seed = 0):
+    for start in range(0, rows, chunk_rows):
+        chunk = census_frame(min(chunk_rows, rows - start), seed = seed + start, raw = True, start_id = start)
+        chunk.to_csv(file_path, mode = "a" if start else "w", header = not start, index = False)
+
+
+# Income label correlated with education, age and capital gains, ~6% above limit
+def income_labels(df, seed = 0):
+    rng = np.random.default_rng(seed)
+    education = df["education"].astype(str).str.strip()
+    degree = education.str.contains("Bachelors|Masters|Doctorate|Prof school").to_numpy()
+    age = df["age"].to_numpy()
+    score = -4.2 + 1.8 * degree + 0.9 * ((age > 30) & (age < 65)) + 2.5 * (df["gains"].to_numpy() > 5000)
+    above = rng.random(len(df)) < 1 / (1 + np.exp(-score))
+    return np.where(above, "Above limit", "Below limit")
+
+
+# Load the shipped models, or fit look-alike pipelines on synthetic data when
+# models/ only holds Git LFS pointers
+def load_models(rows = 20000):
+    import joblib
+    try:
+        return {
+            "XGBoost": joblib.load("models/xgboost_model.joblib"),
+            "Random Forest": joblib.load("models/random_forest_model.joblib"),
+        }, joblib.load("models/encoder.joblib")
+    except Exception:
+        pass
+
+    from sklearn.compose import ColumnTransformer
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.impute import SimpleImputer
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import LabelEncoder, OneHotEncoder, StandardScaler
+    from xgboost import XGBClassifier
+
+    df = schema.clean_columns(census_frame(rows, seed = 1, raw = True))
+    encoder = LabelEncoder().fit(["Above limit", "Below limit"])
+    target = encoder.transform(income_labels(df))
+    features = schema.model_input(df)
+
+    categorical = list(schema.category_options)
+    numerical = [col for col in features.columns if col not in categorical]
+
+    def pipeline(classifier):
+        preprocessor = ColumnTransformer([
+            ("num", Pipeline([("imputer", SimpleImputer(strategy = "median")), ("scaler", StandardScaler())]), numerical),
+            ("cat", Pipeline([("imputer", SimpleImputer(strategy = "most_frequent")),
+                              ("encoder", OneHotEncoder(handle_unknown = "ignore"))]), categorical),
+        ])
+        return Pipeline([("preprocessor", preprocessor), ("classifier", classifier)]).fit(features, target)
+
+    return {
+        "XGBoost": pipeline(XGBClassifier(n_estimators = 200, max_depth = 6, n_jobs = 1)),
+        "Random Forest": pipeline(RandomForestClassifier(n_estimators = 100, max_depth = 12, n_jobs = 1, random_state = 0)),
+    }, encoder
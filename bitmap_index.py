@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+
+
+# In-memory index over a frame, built once per data version, that answers
+# filters and grouped counts without copying the frame. The rows are kept
+# sorted by one ranged column, so a range of it is two binary searches and a
+# contiguous run of rows. Each filtered categorical column is stored as
+# integer codes with one bitmap (a boolean array over the rows) per category.
+# Filters are combined by intersecting bitmaps and counts are bincounts of the
+# codes of the selected rows. Columns only grouped on keep their codes without
+# bitmaps. Row numbers are positions in the sorted order, not in the frame.
+# With a weight column every row counts as that many, e.g. the cells of a KPI
+# cube.
+class BitmapIndex:
+    def __init__(self, df, bitmapped, sort_by, grouped = (), weight = None):
+        self.rows = len(df)
+        values = pd.to_numeric(df[sort_by], errors = "coerce").to_numpy(dtype = np.float64, na_value = np.nan)
+        order = np.argsort(values, kind = "stable")
+        self.values = values[order]
+        self.weights = None if weight is None else df[weight].to_numpy(dtype = np.float64)[order]
+        self.codes = {}
+        self.categories = {}
+        self.positions = {}
+        self.bitmaps = {}
+        for column in list(bitmapped) + list(grouped):
+            codes, categories = pd.factorize(df[column], sort = True)
+            self.codes[column] = codes[order]
+            self.categories[column] = np.asarray(categories, dtype = object)
+            self.positions[column] = {value: code for code, value in enumerate(self.categories[column])}
+            if column in bitmapped:
+                self.bitmaps[column] = [self.codes[column] == code for code in range(len(categories))]
+
+    # Row numbers where the sorted column lies within [low, high] and each
+    # bitmapped column in equal has the given value. Only the bitmaps' run of
+    # rows in the range is intersected. Missing values never match.
+    def select(self, low = -np.inf, high = np.inf, equal = None):
+        start, stop = np.searchsorted(self.values, low, side = "left"), np.searchsorted(self.values, high, side = "right")
+        selected = np.ones(stop - start, dtype = bool)
+        for column, value in (equal or {}).items():
+            code = self.positions[column].get(value)
+            if code is None:
+                return np.zeros(0, dtype = np.int64)
+            selected &= self.bitmaps[column][code][start:stop]
+        return start + np.flatnonzero(selected)
+
+    # The selected rows where a categorical column has the value
+    def where(self, rows, column, value):
+        code = self.positions[column].get(value)
+        return rows[:0] if code is None else rows[self.codes[column][rows] == code]
+
+    # Largest value of the sorted column, NaN when it has none
+    def maximum(self):
+        present = self.values[~np.isnan(self.values)]
+        return present[-1] if len(present) else np.nan
+
+    # Rows (or total weight) of the selected rows per combination of the
+    # categorical columns in by, as a Series without the empty combinations
+    def counts(self, rows, by):
+        codes = [self.codes[column][rows] for column in by]
+        present = np.all([c >= 0 for c in codes], axis = 0)
+        shape = tuple(len(self.categories[column]) for column in by)
+        keys = np.ravel_multi_index([c[present] for c in codes], shape)
+        weights = None if self.weights is None else self.weights[rows][present]
+        totals = np.bincount(keys, weights = weights, minlength = int(np.prod(shape)))
+        found = np.flatnonzero(totals)
+        totals = totals[found] if self.weights is None else totals[found].round().astype(np.int64)
+        if len(by) == 1:
+            index = pd.Index(self.categories[by[0]][found], name = by[0])
+        else:
+            positions = np.unravel_index(found, shape)
+            index = pd.MultiIndex.from_arrays([self.categories[column][p] for column, p in zip(by, positions)], names = by)
+        return pd.Series(totals, index = index, name = "count")
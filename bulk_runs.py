@@ -0,0 +1,425 @@
+import datetime
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import columnar_cache
+import kpi_cube
+import perf_metrics
+import running_stats
+import schema
+
+# Every bulk run is kept as its own Parquet partition under
+# runs_dir/<dataset>/date=<YYYY-MM-DD>/run=<run id>.parquet, listed in
+# runs_dir/<dataset>/manifest.json
+runs_dir = os.path.join("data", "bulk_runs")
+
+# CSVs the bulk results used to overwrite, imported once as a run of their own
+legacy_csvs = {
+    "uploaded": os.path.join("data", "uploaded_data_history.csv"),
+    "inbuilt": os.path.join("data", "inbuilt_data_history.csv"),
+}
+
+# Columns the History page filters on, by filter name
+filter_columns = {
+    "date_from": "Prediction_Date",
+    "date_to": "Prediction_Date",
+    "models": "Model_used",
+    "labels": "income_above_limit",
+    "id_prefix": "ID",
+    "probability": "Probability",
+}
+
+_manifest_lock = threading.RLock()
+
+# Datasets whose legacy CSV this process has already dealt with
+_legacy_checked = set()
+
+# Every run of a dataset loaded so far, as (columns, run ids, frame). Only the
+# latest column selection of each dataset is kept.
+_loaded_runs = {}
+_loaded_lock = threading.Lock()
+
+
+def _dataset_dir(dataset):
+    return os.path.join(runs_dir, dataset)
+
+
+def _manifest_path(dataset):
+    return os.path.join(_dataset_dir(dataset), "manifest.json")
+
+
+# KPI cube and numeric column statistics of a run, stored next to its partition
+def _cube_path(run_path):
+    return run_path[:-len(".parquet")] + ".cube.parquet"
+
+
+def _stats_path(run_path):
+    return run_path[:-len(".parquet")] + ".corr.npz"
+
+
+def new_run_id():
+    return f"{datetime.datetime.now():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:6]}"
+
+
+def _read_manifest(dataset):
+    try:
+        with open(_manifest_path(dataset)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+
+# Replace the manifest in one step so readers never see it half written
+def _write_manifest(dataset, entries):
+    file_path = _manifest_path(dataset)
+    os.makedirs(os.path.dirname(file_path), exist_ok = True)
+    temp_path = f"{file_path}.{threading.get_ident()}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(entries, f, indent = 1)
+    os.replace(temp_path, file_path)
+
+
+def _add_to_manifest(dataset, entry):
+    with _manifest_lock:
+        entries = _read_manifest(dataset)
+        entries.append(entry)
+        _write_manifest(dataset, entries)
+
+
+# Writes one run chunk by chunk to a temporary file, which becomes the run's
+# partition and is added to the manifest only once the run is committed
+class RunWriter:
+    def __init__(self, dataset, model_name, run_id = None, date = None):
+        self.dataset = dataset
+        self.model_name = model_name
+        self.run_id = run_id or new_run_id()
+        self.date = (date or datetime.date.today()).isoformat()
+        self.started_at = time.time()
+        self.rows = 0
+        self.path = os.path.join(_dataset_dir(dataset), f"date={self.date}", f"run={self.run_id}.parquet")
+        self.writer = columnar_cache.ChunkWriter(f"{self.path}.partial", strict = True)
+        self.cube = kpi_cube.empty()
+        self.correlation = running_stats.CorrelationAccumulator()
+
+    # The KPI cube and correlation statistics are updated chunk by chunk alongside the partition
+    @perf_metrics.timed("bulk_run_write")
+    def write(self, df):
+        self.writer.write(df)
+        self.cube = kpi_cube.merge([self.cube, kpi_cube.build(df)])
+        self.correlation.update(df)
+        self.rows += len(df)
+
+    # Save the partition and its cube and record them; an empty run leaves nothing behind
+    @perf_metrics.timed("bulk_run_commit")
+    def commit(self, seconds = None, source = None):
+        if not self.writer.save(self.path):
+            return None
+        kpi_cube.save(self.cube, _cube_path(self.path))
+        self.correlation.save(_stats_path(self.path))
+        entry = {
+            "run_id": self.run_id,
+            "date": self.date,
+            "path": os.path.relpath(self.path, _dataset_dir(self.dataset)),
+            "rows": self.rows,
+            "model": self.model_name,
+            "source": source,
+            "started_at": self.started_at,
+            "seconds": round(time.time() - self.started_at if seconds is None else seconds, 3),
+        }
+        _add_to_manifest(self.dataset, entry)
+        return entry
+
+    def abort(self):
+        self.writer.abort()
+
+
+# Save an already scored frame as a run
+def save_run(dataset, df, model_name, seconds = None, source = None):
+    writer = RunWriter(dataset, model_name)
+    try:
+        writer.write(df)
+    except BaseException:
+        writer.abort()
+        raise
+    return writer.commit(seconds, source)
+
+
+# Score a whole dataset chunk by chunk into a new run, with memory bounded by
+# the chunk size. progress(rows_done, total_rows, elapsed) is called after each chunk.
+# model_name defaults to scoring.bulk_model_name.
+def stream_run(dataset, source, model, encoder, chunk_size = 50000, model_name = None,
+               progress = None, workers = 1, executor = "thread"):
+    # Imported here so the pages that only read runs do not load the scoring stack
+    import scoring
+
+    model_name = model_name or scoring.bulk_model_name
+    total_rows = columnar_cache.count_rows(source, chunk_size)
+    writer = RunWriter(dataset, model_name)
+    start = time.perf_counter()
+    try:
+        for scored in scoring.iter_scored_chunks(source, model, encoder, chunk_size, model_name, workers, executor):
+            writer.write(scored)
+            if progress is not None:
+                progress(writer.rows, total_rows, time.perf_counter() - start)
+    except BaseException:
+        writer.abort()
+        raise
+    return writer.commit(time.perf_counter() - start, getattr(source, "name", str(source)))
+
+
+# Outcome of a dataset's legacy CSV import, kept next to its manifest so the
+# import is attempted once, whether it worked, was skipped or failed
+def _legacy_status_path(dataset):
+    return os.path.join(_dataset_dir(dataset), "legacy_import.json")
+
+
+def _write_legacy_status(dataset, file_path, status, error = None):
+    os.makedirs(_dataset_dir(dataset), exist_ok = True)
+    with open(_legacy_status_path(dataset), "w") as f:
+        json.dump({"source": file_path, "status": status, "error": error, "at": time.time()}, f)
+
+
+# The CSV was appended to by many runs, so its columns need not look the same
+# from one chunk to the next (a column empty at first, text later). Every chunk
+# is given the same types: the schema's numbers and the probability as float64
+# (text that is not a number becomes NaN), everything else as strings.
+def _legacy_chunk(chunk):
+    for column in chunk.columns:
+        if column in schema.numeric_dtypes or column == "Probability":
+            chunk[column] = pd.to_numeric(chunk[column], errors = "coerce").astype("float64")
+        else:
+            chunk[column] = chunk[column].astype("string")
+    return chunk
+
+
+# Bring in the CSV the results used to be written to, once; it is left in place.
+# Files without prediction columns (e.g. an unfetched Git LFS pointer) are skipped.
+def _import_legacy(dataset):
+    file_path = legacy_csvs.get(dataset)
+    if file_path is None or not os.path.exists(file_path) or os.path.exists(_legacy_status_path(dataset)):
+        return
+    if any(entry.get("source") == file_path for entry in _read_manifest(dataset)):
+        _write_legacy_status(dataset, file_path, "imported")
+        return
+    try:
+        header = pd.read_csv(file_path, nrows = 0).columns
+    except (ValueError, OSError) as e:
+        _write_legacy_status(dataset, file_path, "failed", str(e))
+        return
+    if not {"Model_used", "income_above_limit"}.issubset(header):
+        _write_legacy_status(dataset, file_path, "skipped", "not a prediction history")
+        return
+
+    modified = os.path.getmtime(file_path)
+    writer = RunWriter(dataset, None, run_id = "legacy", date = datetime.date.fromtimestamp(modified))
+    writer.started_at = modified
+    model_names = set()
+    try:
+        for chunk in pd.read_csv(file_path, chunksize = 50000, dtype = str):
+            chunk = _legacy_chunk(chunk)
+            model_names.update(chunk["Model_used"].dropna().unique())
+            writer.write(chunk)
+        writer.model_name = ", ".join(sorted(model_names)) or None
+        writer.commit(0, file_path)
+    except (ValueError, OSError) as e:
+        writer.abort()
+        _write_legacy_status(dataset, file_path, "failed", str(e))
+        return
+    except BaseException:
+        writer.abort()
+        raise
+    _write_legacy_status(dataset, file_path, "imported")
+
+
+# Runs of a dataset as recorded in the manifest, newest first. The legacy CSV
+# is looked at on the first call in a process only.
+def runs(dataset):
+    with _manifest_lock:
+        if dataset not in _legacy_checked:
+            _legacy_checked.add(dataset)
+            _import_legacy(dataset)
+        entries = _read_manifest(dataset)
+    return sorted(entries, key = lambda entry: entry["started_at"], reverse = True)
+
+
+def latest_run(dataset):
+    entries = runs(dataset)
+    return entries[0] if entries else None
+
+
+def _run_path(dataset, run):
+    entry = run if isinstance(run, dict) else next((e for e in runs(dataset) if e["run_id"] == run), None)
+    if entry is None:
+        raise KeyError(f"No bulk run {run} for {dataset} data")
+    return os.path.join(_dataset_dir(dataset), entry["path"])
+
+
+# One run, or only some of its columns, read from its own partition
+def read_run(dataset, run, columns = None):
+    return pq.read_table(_run_path(dataset, run), columns = columns, memory_map = True).to_pandas()
+
+
+# KPI cube of one run. Runs saved before cubes were kept get theirs built from
+# the partition's columns on first use.
+def read_cube(dataset, run):
+    run_path = _run_path(dataset, run)
+    cube_path = _cube_path(run_path)
+    if not os.path.exists(cube_path):
+        cube = kpi_cube.build(pq.read_table(run_path, columns = kpi_cube.source_columns, memory_map = True).to_pandas())
+        temp_path = f"{cube_path}.{threading.get_ident()}.tmp"
+        kpi_cube.save(cube, temp_path)
+        os.replace(temp_path, cube_path)
+    return kpi_cube.load(cube_path)
+
+
+# KPI cube of several runs (all of them by default) added together
+def load_cube(dataset, run_ids = None):
+    entries = [entry for entry in runs(dataset) if run_ids is None or entry["run_id"] in run_ids]
+    return kpi_cube.merge([read_cube(dataset, entry) for entry in entries])
+
+
+# Correlation statistics of one run's numeric columns, built from the partition
+# batch by batch on first use for runs saved before they were kept
+def read_correlation(dataset, run):
+    run_path = _run_path(dataset, run)
+    stats_path = _stats_path(run_path)
+    if not os.path.exists(stats_path):
+        parquet_file = pq.ParquetFile(run_path, memory_map = True)
+        numeric = [field.name for field in parquet_file.schema_arrow
+                   if pa.types.is_integer(field.type) or pa.types.is_floating(field.type)]
+        correlation = running_stats.CorrelationAccumulator()
+        for batch in parquet_file.iter_batches(columns = numeric):
+            correlation.update(batch.to_pandas())
+        temp_path = f"{stats_path}.{threading.get_ident()}.tmp"
+        correlation.save(temp_path)
+        os.replace(temp_path, stats_path)
+    return running_stats.CorrelationAccumulator.load(stats_path)
+
+
+# Correlation statistics of several runs (all of them by default) combined
+def load_correlation(dataset, run_ids = None):
+    correlation = running_stats.CorrelationAccumulator()
+    for entry in runs(dataset):
+        if run_ids is None or entry["run_id"] in run_ids:
+            correlation.merge(read_correlation(dataset, entry))
+    return correlation
+
+
+# First rows of a run, decoding only its first row group
+def read_run_head(dataset, run, n = 5, columns = None):
+    parquet_file = pq.ParquetFile(_run_path(dataset, run), memory_map = True)
+    if parquet_file.metadata.num_row_groups == 0:
+        return parquet_file.schema_arrow.empty_table().to_pandas()
+    return parquet_file.read_row_group(0, columns = columns).slice(0, n).to_pandas()
+
+
+# Version of a dataset's results, which changes with every new run
+def version(dataset):
+    return tuple(entry["run_id"] for entry in runs(dataset))
+
+
+# Every run of a dataset stacked in the order the runs were saved. Runs are only
+# ever added, so once loaded a new run is picked up by reading its partition
+# alone and appending it; if runs were removed, everything is read again.
+# Each caller gets its own copy, so one session cannot change another's data.
+def load_all_runs(dataset, columns = None):
+    runs(dataset)
+    with _manifest_lock:
+        entries = _read_manifest(dataset)
+    run_ids = tuple(entry["run_id"] for entry in entries)
+    columns_key = tuple(columns) if columns else None
+
+    with _loaded_lock:
+        loaded_columns, loaded_ids, frame = _loaded_runs.get(dataset, (None, (), None))
+        if loaded_columns != columns_key or run_ids[:len(loaded_ids)] != loaded_ids:
+            loaded_ids, frame = (), None
+        new_entries = entries[len(loaded_ids):]
+        if new_entries:
+            frames = ([frame] if frame is not None else []) + [read_run(dataset, entry, columns) for entry in new_entries]
+            frame = pd.concat(frames, ignore_index = True)
+            _loaded_runs[dataset] = (columns_key, run_ids, frame)
+        elif frame is None:
+            _loaded_runs.pop(dataset, None)
+        return frame.copy() if frame is not None else pd.DataFrame(columns = columns)
+
+
+# Several runs stacked, reading only the partitions and columns asked for
+def read_runs(dataset, run_ids = None, columns = None):
+    entries = [entry for entry in runs(dataset) if run_ids is None or entry["run_id"] in run_ids]
+    frames = [read_run(dataset, entry, columns) for entry in entries]
+    return pd.concat(frames, ignore_index = True) if frames else pd.DataFrame(columns = columns)
+
+
+def _freeze(filters):
+    return tuple(sorted((key, tuple(value) if isinstance(value, (list, tuple)) else value)
+                        for key, value in (filters or {}).items() if value))
+
+
+# Row numbers of a run matching the History page filters, in the order asked for.
+# Only the columns filtered or sorted on are read, and the last few results are
+# kept so paging through one query does not repeat it.
+@functools.lru_cache(maxsize = 16)
+def _matching_rows(file_path, frozen_filters, sort_by, descending):
+    filters = dict(frozen_filters)
+    needed = [column for key, column in filter_columns.items() if key in filters] + ([sort_by] if sort_by else [])
+    needed = list(dict.fromkeys(needed))
+    table = pq.read_table(file_path, columns = needed, memory_map = True)
+
+    def text(column):
+        return pc.cast(table[column], pa.string())
+
+    mask = None
+    conditions = []
+    if "date_from" in filters:
+        conditions.append(pc.greater_equal(text("Prediction_Date"), str(filters["date_from"])))
+    if "date_to" in filters:
+        conditions.append(pc.less_equal(text("Prediction_Date"), str(filters["date_to"])))
+    if "models" in filters:
+        conditions.append(pc.is_in(text("Model_used"), value_set = pa.array(filters["models"], pa.string())))
+    if "labels" in filters:
+        conditions.append(pc.is_in(text("income_above_limit"), value_set = pa.array(filters["labels"], pa.string())))
+    if "id_prefix" in filters:
+        conditions.append(pc.starts_with(text("ID"), filters["id_prefix"]))
+    if "probability" in filters:
+        low, high = filters["probability"]
+        conditions.append(pc.and_(pc.greater_equal(table["Probability"], low), pc.less_equal(table["Probability"], high)))
+    for condition in conditions:
+        mask = condition if mask is None else pc.and_(mask, condition)
+
+    rows = np.arange(table.num_rows) if mask is None else np.flatnonzero(mask.fill_null(False).to_numpy(zero_copy_only = False))
+    if sort_by is not None:
+        values = table[sort_by].take(pa.array(rows))
+        if pa.types.is_dictionary(values.type):
+            values = pc.cast(values, values.type.value_type)
+        rows = rows[pc.array_sort_indices(values, order = "descending" if descending else "ascending").to_numpy()]
+    elif descending:
+        rows = rows[::-1]
+    return rows
+
+
+# One page of a run with the History page filters applied (see
+# history_store._filter_sql), sorted on sort_by or kept in file order.
+# Returns the page and the number of matching rows. Without filters or
+# sorting only the row groups of the page are read.
+def query_run(dataset, run, filters = None, sort_by = None, descending = False, page = 0, page_size = 50):
+    file_path = _run_path(dataset, run)
+    frozen_filters = _freeze(filters)
+    if not frozen_filters and sort_by is None:
+        total = int(columnar_cache._group_starts(file_path)[-1])
+        start, stop = page * page_size, min((page + 1) * page_size, total)
+        rows = np.arange(start, max(start, stop))
+        if descending:
+            rows = total - 1 - rows
+    else:
+        matching = _matching_rows(file_path, frozen_filters, sort_by, descending)
+        total = len(matching)
+        rows = matching[page * page_size:(page + 1) * page_size]
+    return columnar_cache.read_rows(file_path, rows), total
@@ -0,0 +1,349 @@
+import io
+import os
+import threading
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+import page_index
+import perf_metrics
+
+# Parquet copies of datasets share the page index cache directory
+cache_dir = page_index.cache_dir
+
+# Rows per Parquet row group; a page read only decodes the groups it overlaps
+row_group_size = 65536
+
+# Oldest unused cache files are pruned beyond this count
+max_cached_files = 20
+
+# String columns are dictionary-encoded when at most this share of values is distinct
+dictionary_ratio = 0.5
+
+# Match the strings pandas.read_csv treats as missing
+null_values = ["", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+               "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null"]
+
+_conversion_lock = threading.Lock()
+_conversions_running = set()
+_row_group_memo = {}
+
+
+def _cache_file(source):
+    return os.path.join(cache_dir, f"{page_index.content_hash(source)}.parquet")
+
+
+def _is_excel(source):
+    name = source if isinstance(source, (str, os.PathLike)) else getattr(source, "name", "")
+    return str(name).endswith(".xlsx")
+
+
+# Path of the Parquet copy if it has already been built, otherwise None
+def cached_path(source):
+    file_path = _cache_file(source)
+    return file_path if os.path.exists(file_path) else None
+
+
+# Convert a pandas frame to Arrow, dictionary-encoding repetitive string columns.
+# Non-string objects (dates, mixed values) are stored as the text a CSV holds.
+def _frame_to_table(df):
+    df = df.copy()
+    for col in df.select_dtypes(include = ["object"]).columns:
+        values = df[col]
+        if pd.api.types.infer_dtype(values, skipna = True) not in ("string", "empty"):
+            values = values.map(lambda x: x if pd.isna(x) else str(x))
+        if values.nunique() <= dictionary_ratio * max(len(values), 1):
+            values = values.astype("category")
+        df[col] = values
+    return pa.Table.from_pandas(df, preserve_index = False)
+
+
+def _write_table(table, file_path):
+    os.makedirs(cache_dir, exist_ok = True)
+    temp_path = f"{file_path}.{threading.get_ident()}.tmp"
+    pq.write_table(table, temp_path, row_group_size = row_group_size)
+    os.replace(temp_path, file_path)
+    _prune_cache()
+
+
+# Keep the cache directory bounded by dropping the least recently used copies
+def _prune_cache():
+    cached = [os.path.join(cache_dir, name) for name in os.listdir(cache_dir) if name.endswith(".parquet")]
+    if len(cached) > max_cached_files:
+        cached.sort(key = os.path.getmtime)
+        for file_path in cached[:len(cached) - max_cached_files]:
+            try:
+                os.remove(file_path)
+            except OSError:
+                pass
+
+
+# Stream a CSV into Parquet batch by batch so memory stays bounded by the block size
+def _convert_csv(source, file_path):
+    read_options = pa_csv.ReadOptions(block_size = 32 * 1024 * 1024)
+    convert_options = pa_csv.ConvertOptions(null_values = null_values, strings_can_be_null = True,
+                                            true_values = ["True", "TRUE", "true"],
+                                            false_values = ["False", "FALSE", "false"])
+
+    with page_index._open_source(source) as stream:
+        reader = pa_csv.open_csv(stream, read_options = read_options, convert_options = convert_options)
+
+        # pandas leaves dates and times as text, so the cache does too
+        temporal = {field.name: pa.string() for field in reader.schema if pa.types.is_temporal(field.type)}
+        if temporal:
+            stream.seek(0)
+            convert_options.column_types = temporal
+            reader = pa_csv.open_csv(stream, read_options = read_options, convert_options = convert_options)
+
+        first_batch = reader.read_next_batch()
+        dictionary_columns = [
+            field.name for field in reader.schema
+            if pa.types.is_string(field.type)
+            and len(first_batch) > 0
+            and pc.count_distinct(first_batch[field.name]).as_py() <= dictionary_ratio * len(first_batch)
+        ]
+        schema = pa.schema([
+            pa.field(field.name, pa.dictionary(pa.int32(), pa.string())) if field.name in dictionary_columns else field
+            for field in reader.schema
+        ])
+
+        def encode(batch):
+            columns = [
+                batch[field.name].dictionary_encode() if field.name in dictionary_columns else batch[field.name]
+                for field in reader.schema
+            ]
+            return pa.RecordBatch.from_arrays(columns, schema = schema)
+
+        os.makedirs(cache_dir, exist_ok = True)
+        temp_path = f"{file_path}.{threading.get_ident()}.tmp"
+        try:
+            with pq.ParquetWriter(temp_path, schema) as writer:
+                writer.write_batch(encode(first_batch), row_group_size = row_group_size)
+                for batch in reader:
+                    writer.write_batch(encode(batch), row_group_size = row_group_size)
+        except pa.ArrowInvalid:
+            # A column changed type after the first block; let pandas infer over the whole file
+            os.remove(temp_path)
+            stream.seek(0)
+            _write_table(_frame_to_table(pd.read_csv(stream)), file_path)
+            return
+
+    os.replace(temp_path, file_path)
+    _prune_cache()
+
+
+# Build the Parquet copy of a CSV or Excel source once
+@perf_metrics.timed("file_convert")
+def convert(source):
+    file_path = _cache_file(source)
+    if os.path.exists(file_path):
+        return file_path
+
+    if _is_excel(source):
+        with page_index._open_source(source) as stream:
+            _write_table(_frame_to_table(pd.read_excel(stream)), file_path)
+    else:
+        _convert_csv(source, file_path)
+    return file_path
+
+
+# Convert in a daemon thread so the current rerun is not blocked on it
+def convert_in_background(source):
+    file_hash = page_index.content_hash(source)
+    with _conversion_lock:
+        if file_hash in _conversions_running:
+            return
+        _conversions_running.add(file_hash)
+
+    # Uploaded buffers are shared with the script thread, so convert a private copy
+    if not isinstance(source, (str, os.PathLike)):
+        source = io.BytesIO(source.getvalue())
+
+    def run():
+        try:
+            file_path = os.path.join(cache_dir, f"{file_hash}.parquet")
+            if not os.path.exists(file_path):
+                _convert_csv(source, file_path)
+        finally:
+            with _conversion_lock:
+                _conversions_running.discard(file_hash)
+
+    threading.Thread(target = run, daemon = True).start()
+
+
+# Writes a Parquet file chunk by chunk with a schema fixed by the first chunk.
+# As a cache copy (strict=False) it is best effort: a chunk whose types drift
+# from the first one abandons the copy and the file is converted on its next
+# read instead. As a primary output (strict=True) the error is raised.
+class ChunkWriter:
+    def __init__(self, temp_path = None, strict = False):
+        self.temp_path = temp_path or os.path.join(cache_dir, f"writer.{os.getpid()}.{threading.get_ident()}.{id(self)}.tmp")
+        self.strict = strict
+        self.writer = None
+        self.schema = None
+        self.failed = False
+
+    def write(self, df):
+        if self.failed:
+            return
+        try:
+            if self.writer is None:
+                self.schema = pa.schema([
+                    pa.field(field.name, pa.dictionary(pa.int32(), field.type.value_type))
+                    if pa.types.is_dictionary(field.type) else field
+                    for field in _frame_to_table(df).schema
+                ])
+                os.makedirs(os.path.dirname(self.temp_path) or ".", exist_ok = True)
+                self.writer = pq.ParquetWriter(self.temp_path, self.schema)
+            table = _frame_to_table(df[self.schema.names])
+            arrays = [column.cast(field.type) for column, field in zip(table.columns, self.schema)]
+            self.writer.write_table(pa.Table.from_arrays(arrays, schema = self.schema), row_group_size = row_group_size)
+        except (pa.ArrowException, KeyError) as e:
+            self.abort()
+            if self.strict:
+                raise ValueError(f"Chunk does not match the columns and types of the first chunk: {e}") from e
+
+    # Close the file and move it to its final location
+    def save(self, file_path):
+        if self.failed or self.writer is None:
+            self.abort()
+            return False
+        self.writer.close()
+        self.writer = None
+        os.replace(self.temp_path, file_path)
+        return True
+
+    # Move the finished copy into the cache slot of the file it mirrors
+    def commit(self, file_path):
+        if self.save(_cache_file(file_path)):
+            _prune_cache()
+
+    def abort(self):
+        self.failed = True
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+
+# Write a frame that was just saved to file_path straight into its cache slot
+def store_frame(file_path, df):
+    _write_table(_frame_to_table(df), _cache_file(file_path))
+
+
+def _open_parquet(file_path):
+    os.utime(file_path)
+    return pq.ParquetFile(file_path, memory_map = True)
+
+
+# Read the whole dataset, or only the requested columns, from the cache
+@perf_metrics.timed("file_load")
+def read_frame(source, columns = None):
+    file_path = convert(source)
+    os.utime(file_path)
+    table = pq.read_table(file_path, columns = columns, memory_map = True)
+    return table.to_pandas()
+
+
+# Read the first n rows from the first row group only
+def read_head(source, n = 5, columns = None):
+    file_path = convert(source)
+    parquet_file = _open_parquet(file_path)
+    if parquet_file.metadata.num_row_groups == 0:
+        return parquet_file.schema_arrow.empty_table().to_pandas()
+    return parquet_file.read_row_group(0, columns = columns).slice(0, n).to_pandas()
+
+
+# First row of each row group of a Parquet file, plus its total row count
+def _group_starts(file_path):
+    if file_path not in _row_group_memo:
+        metadata = pq.ParquetFile(file_path, memory_map = True).metadata
+        row_counts = [metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)]
+        _row_group_memo[file_path] = np.concatenate(([0], np.cumsum(row_counts, dtype = np.int64)))
+    return _row_group_memo[file_path]
+
+
+# Read the given rows of a Parquet file, in the order given, decoding only the
+# row groups they fall in. The frame is indexed by row number.
+def read_rows(file_path, row_numbers, columns = None):
+    row_numbers = np.asarray(row_numbers, dtype = np.int64)
+    parquet_file = _open_parquet(file_path)
+    if len(row_numbers) == 0:
+        table = parquet_file.schema_arrow.empty_table()
+        return (table.select(columns) if columns else table).to_pandas()
+    group_starts = _group_starts(file_path)
+    groups = np.searchsorted(group_starts, row_numbers, side = "right") - 1
+    needed = np.unique(groups)
+    table = parquet_file.read_row_groups(needed.tolist(), columns = columns)
+
+    # Position of each needed group's first row once the groups are read back to back
+    sizes = group_starts[needed + 1] - group_starts[needed]
+    read_starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    positions = row_numbers - group_starts[groups] + read_starts[np.searchsorted(needed, groups)]
+    chunk = table.take(positions).to_pandas()
+    chunk.index = row_numbers
+    return chunk
+
+
+# Read one page by decoding only the row groups it overlaps. CSVs that are
+# not cached yet are served through the byte-offset page index while the
+# Parquet copy is built in the background.
+@perf_metrics.timed("file_load")
+def read_page(source, chunk_size, page_number, columns = None):
+    if _is_excel(source):
+        file_path = convert(source)
+    else:
+        file_path = cached_path(source)
+        if file_path is None:
+            convert_in_background(source)
+            chunk = page_index.read_page(source, chunk_size, page_number)
+            return chunk if chunk is None or columns is None else chunk[columns]
+
+    group_starts = _group_starts(file_path)
+
+    start = page_number * chunk_size
+    stop = min(start + chunk_size, int(group_starts[-1]))
+    if page_number < 0 or start >= stop:
+        return None
+
+    first_group = int(np.searchsorted(group_starts, start, side = "right")) - 1
+    last_group = int(np.searchsorted(group_starts, stop, side = "left")) - 1
+    table = _open_parquet(file_path).read_row_groups(range(first_group, last_group + 1), columns = columns)
+    chunk = table.slice(start - int(group_starts[first_group]), stop - start).to_pandas()
+    chunk.index = pd.RangeIndex(start, stop)
+    return chunk
+
+
+def _is_parquet(source):
+    return isinstance(source, (str, os.PathLike)) and str(source).endswith(".parquet")
+
+
+# Parquet file to stream from: Parquet inputs as they are, Excel always
+# converted, CSVs only once cached
+def _streaming_path(source):
+    if _is_parquet(source):
+        return source
+    return convert(source) if _is_excel(source) else cached_path(source)
+
+
+# Total data rows without loading the dataset
+def count_rows(source, chunk_size):
+    file_path = _streaming_path(source)
+    if file_path is not None:
+        return pq.ParquetFile(file_path, memory_map = True).metadata.num_rows
+    return page_index.load_page_index(source, chunk_size)["n_rows"]
+
+
+# Yield the dataset chunk by chunk so only one chunk is in memory at a time
+def iter_chunks(source, chunk_size, columns = None):
+    file_path = _streaming_path(source)
+    if file_path is not None:
+        parquet_file = pq.ParquetFile(file_path, memory_map = True) if _is_parquet(source) else _open_parquet(file_path)
+        for batch in parquet_file.iter_batches(batch_size = chunk_size, columns = columns):
+            yield batch.to_pandas()
+    else:
+        with page_index._open_source(source) as stream:
+            yield from pd.read_csv(stream, chunksize = chunk_size, usecols = columns)
@@ -0,0 +1,49 @@
+import re
+from functools import lru_cache
+import pandas as pd
+
+# ISO 3166-1 alpha-3 code of each country of birth label in the census data,
+# keyed by the normalised label. Several labels share a code (England and
+# Scotland); former and outlying territories map to their nearest present one.
+iso3_codes = {
+    "us": "USA", "el salvador": "SLV", "mexico": "MEX", "philippines": "PHL", "cambodia": "KHM",
+    "china": "CHN", "hungary": "HUN", "puerto rico": "PRI", "england": "GBR", "dominican republic": "DOM",
+    "japan": "JPN", "canada": "CAN", "ecuador": "ECU", "italy": "ITA", "cuba": "CUB", "peru": "PER",
+    "taiwan": "TWN", "south korea": "KOR", "poland": "POL", "nicaragua": "NIC", "germany": "DEU",
+    "guatemala": "GTM", "india": "IND", "ireland": "IRL", "honduras": "HND", "france": "FRA",
+    "trinadad tobago": "TTO", "thailand": "THA", "iran": "IRN", "vietnam": "VNM", "portugal": "PRT",
+    "laos": "LAO", "panama": "PAN", "scotland": "GBR", "columbia": "COL", "jamaica": "JAM",
+    "greece": "GRC", "haiti": "HTI", "yugoslavia": "SRB", "outlying u s guam usvi etc": "GUM",
+    "holand netherlands": "NLD", "hong kong": "HKG",
+}
+
+
+# Lower case words only, so "Trinadad&Tobago", " trinadad & tobago" and
+# "Trinadad-Tobago" are the same label
+def _normalise(label):
+    return " ".join(re.findall(r"[a-z]+", str(label).lower()))
+
+
+# ISO-3 code of a country label, None when it is not a country (e.g. "?");
+# each distinct label is only normalised once
+@lru_cache(maxsize = 1024)
+def iso3(label):
+    return iso3_codes.get(_normalise(label))
+
+
+# One row per country from prediction counts per country label and income
+# label: its ISO-3 code, the labels it was counted under, the predictions per
+# income label, the total and the share above the limit. Labels that are not
+# countries are left out and counted in the frame's attrs["unmapped"].
+def aggregate(cells, column, label_column, above = "Above limit", below = "Below limit"):
+    counts = cells.assign(iso3 = cells[column].map(iso3))
+    mapped = counts[counts["iso3"].notna()]
+    by_country = mapped.pivot_table(index = "iso3", columns = label_column, values = "count", aggfunc = "sum", fill_value = 0)
+    by_country = by_country.reindex(columns = [above, below], fill_value = 0).astype("int64")
+    by_country.columns = ["above", "below"]
+    by_country["total"] = by_country["above"] + by_country["below"]
+    by_country["above_rate"] = by_country["above"] / by_country["total"].where(by_country["total"] > 0)
+    names = mapped.groupby("iso3")[column].agg(lambda labels: ", ".join(sorted(set(map(str, labels)))))
+    countries = by_country.join(names.rename("country")).reset_index()
+    countries.attrs["unmapped"] = int(counts.loc[counts["iso3"].isna(), "count"].sum())
+    return countries[["iso3", "country", "above", "below", "total", "above_rate"]]
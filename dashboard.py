@@ -1,26 +1,71 @@
 import streamlit as st
-import pandas as pd
-import seaborn as sns
-import matplotlib.pyplot as plt
 import plotly.express as px
 import plotly.graph_objects as go
-import os
+import bulk_runs
+import countries
+import eda_plots
+import kpi_cube
+import perf_metrics
+import schema
 
 
 def show_dashboard():
     # Radio widget to select dashboard choice
     dashboard_choice = st.sidebar.radio("Select Dashboard", ["EDA Dashboard", "KPI Dashboard"])
 
-    # Load history data
-    @st.cache_data
-    def load_dashboard_data():
-        if os.path.exists("data/uploaded_data_history.csv"):
-            data = pd.read_csv("data/uploaded_data_history.csv")
+    # Show the latest bulk run on uploaded data, or every run together
+    runs_choice = st.sidebar.radio("Bulk runs", ["Latest run", "All runs"], key = "dashboard_runs")
+
+    # Large runs are drawn from box plot summaries and a sample of the scatter matrix points
+    render_choice = st.sidebar.radio("EDA rendering", ["Summaries and samples", "Every row"], key = "eda_rendering")
+    scatter_points = st.sidebar.number_input("Scatter matrix points", min_value = 500, max_value = 100000,
+                                             value = eda_plots.max_scatter_points, step = 500, key = "scatter_points")
+
+    # Load the latest bulk run from its partition; a new run changes the cache key
+    @st.cache_data(max_entries = 4)
+    def load_dashboard_data(run_id):
+        return bulk_runs.read_run("uploaded", run_id)
+
+    # KPI cube of the given runs, which are also its version, with its bitmap index
+    @st.cache_data(max_entries = 4)
+    def load_kpi_cube(run_ids):
+        with perf_metrics.span("dashboard_aggregation"):
+            cube = bulk_runs.load_cube("uploaded", run_ids)
+            return cube, kpi_cube.index(cube)
+
+    # Correlation of the numeric columns of the given runs, read from their running statistics
+    @st.cache_data(max_entries = 4)
+    def load_correlation(run_ids):
+        with perf_metrics.span("dashboard_aggregation"):
+            return bulk_runs.load_correlation("uploaded", run_ids).corr()
+
+    # Box plot summaries and scatter matrix sample of the given runs; the frame
+    # itself is not hashed, the runs it was loaded from stand for it
+    @st.cache_data(max_entries = 4)
+    def load_box_stats(run_ids, columns, _df):
+        with perf_metrics.span("dashboard_aggregation"):
+            return eda_plots.box_stats(_df, columns)
+
+    @st.cache_data(max_entries = 4)
+    def load_scatter_sample(run_ids, columns, max_points, _df):
+        with perf_metrics.span("dashboard_aggregation"):
+            return eda_plots.stratified_sample(_df[columns], columns[-1], max_points)
+
+    df = None
+    latest_run = bulk_runs.latest_run("uploaded")
+    if latest_run is None:
+        st.error("## No Data Available")
+    else:
+        # Runs shown, which also version the cached loads
+        run_ids = (latest_run["run_id"],) if runs_choice == "Latest run" else bulk_runs.version("uploaded")
+        if dashboard_choice == "KPI Dashboard":
+            # The KPI dashboard is answered from prediction counts, not raw rows
+            df, cube_index = load_kpi_cube(run_ids)
+        elif runs_choice == "Latest run":
+            df = load_dashboard_data(latest_run["run_id"])
         else:
-            st.error("## No Data Available")
-        return data
-        
-    df = load_dashboard_data()
+            # Runs loaded before stay in memory; only new runs are read
+            df = bulk_runs.load_all_runs("uploaded")
 
     # Use the loaded data for dashboard based on user’s selected dashboard
     if df is not None and not df.empty:
@@ -41,43 +86,54 @@ def show_dashboard():
             col1, col2, col3 = st.columns(3)
             with col1:
                 # Box plot for age, working_week_per_year, etc.
-                fig1 = px.box(df[["age", "working_week_per_year", "industry_code", "occupation_code", "total_employed", "mig_year"]],
-                            title = "Box plots of Key Features", template = "plotly_dark", color_discrete_sequence = ["green", "lightgreen"])
+                box_columns = ["age", "working_week_per_year", "industry_code", "occupation_code", "total_employed", "mig_year"]
+                box_stats = load_box_stats(run_ids, box_columns, df) if render_choice != "Every row" else None
+                with perf_metrics.span("figure_build"):
+                    if render_choice == "Every row":
+                        fig1 = px.box(df[box_columns],
+                                    title = "Box plots of Key Features", template = "plotly_dark", color_discrete_sequence = ["green", "lightgreen"])
+                    else:
+                        fig1 = eda_plots.box_figure(box_stats, title = "Box plots of Key Features", template = "plotly_dark")
                 st.plotly_chart(fig1)
 
             with col2:
                 # Box plot for other important features
-                fig2 = px.box(df[["losses", "importance_of_record", "gains", "wage_per_hour", "stocks_status"]],
-                                title = "Box plots of Economic Factors", color_discrete_sequence = ["green", "lightgreen"])
+                box_columns = ["losses", "importance_of_record", "gains", "wage_per_hour", "stocks_status"]
+                box_stats = load_box_stats(run_ids, box_columns, df) if render_choice != "Every row" else None
+                with perf_metrics.span("figure_build"):
+                    if render_choice == "Every row":
+                        fig2 = px.box(df[box_columns],
+                                        title = "Box plots of Economic Factors", color_discrete_sequence = ["green", "lightgreen"])
+                    else:
+                        fig2 = eda_plots.box_figure(box_stats, title = "Box plots of Economic Factors")
                 st.plotly_chart(fig2)
 
             with col3:
                 # Gender vs Income
-                fig4 = px.histogram(df, x = "gender", color = "income_above_limit", barmode = "stack",
-                                    title = "Income Distribution by Gender", color_discrete_sequence = ["green", "lightgreen"])
+                with perf_metrics.span("figure_build"):
+                    fig4 = px.histogram(df, x = "gender", color = "income_above_limit", barmode = "stack",
+                                        title = "Income Distribution by Gender", color_discrete_sequence = ["green", "lightgreen"])
                 st.plotly_chart(fig4)
 
 
             # Align heatmap to the centre
             left, middle, right = st.columns([1, 10, 1])
             with middle:
-                # Select only numerical columns from the DataFrame
-                numerical_cols = df.select_dtypes(include = ["number"])
-
-                # Compute the correlation matrix
-                corr = numerical_cols.corr()
+                # Correlation matrix of the numerical columns, kept up to date as runs are written
+                corr = load_correlation(run_ids)
 
                 # Heatmap Plot using Plotly
-                heatmap_fig = go.Figure(data = go.Heatmap(z = corr.values,
-                                                        x = corr.columns,
-                                                        y = corr.columns,
-                                                        colorscale = "Viridis",
-                                                        text = corr.values,  # Add the correlation values as text
-                                                        texttemplate = "%{text:.2f}",
-                                                        showscale = False  # Format the text to 2 decimal places)
-                                                        ))
-
-                heatmap_fig.update_layout(title = "Correlation Heatmap", width = 800, height = 600)
+                with perf_metrics.span("figure_build"):
+                    heatmap_fig = go.Figure(data = go.Heatmap(z = corr.values,
+                                                            x = corr.columns,
+                                                            y = corr.columns,
+                                                            colorscale = "Viridis",
+                                                            text = corr.values,  # Add the correlation values as text
+                                                            texttemplate = "%{text:.2f}",
+                                                            showscale = False  # Format the text to 2 decimal places)
+                                                            ))
+
+                    heatmap_fig.update_layout(title = "Correlation Heatmap", width = 800, height = 600)
                 st.plotly_chart(heatmap_fig, use_container_width = True)
 
 
@@ -85,41 +141,43 @@ def show_dashboard():
             col1, col2 = st.columns(2)
             with col1:
                     # Calculate proportion of income limit by education
-                    income_limit_proportion_by_education = (
-                        df.groupby(by=["education", "income_above_limit"])
-                        .size().unstack().apply(lambda x: x / x.sum() * 100, axis=1)
-                        .sort_values(by = "Below limit", ascending = True)
-                    )
+                    with perf_metrics.span("dashboard_aggregation"):
+                        income_limit_proportion_by_education = (
+                            df.groupby(by=["education", "income_above_limit"], observed = True)
+                            .size().unstack().apply(lambda x: x / x.sum() * 100, axis=1)
+                            .sort_values(by = "Below limit", ascending = True)
+                        )
                     # Create the plot using Plotly
-                    fig = go.Figure()
-
-                    # Add 'Above limit' trace
-                    fig.add_trace(go.Bar(
-                        x = income_limit_proportion_by_education.index,
-                        y = income_limit_proportion_by_education["Above limit"],
-                        name = "Above limit",
-                        marker = dict(color = "green", line=dict(width=1))
-                        ))
-
-                    # Add 'Below limit' trace
-                    fig.add_trace(go.Bar(
-                        x = income_limit_proportion_by_education.index,
-                        y = income_limit_proportion_by_education["Below limit"],
-                        name = "Below limit",
-                        marker = dict(color = "lightgreen", line = dict(width = 1))
-                        ))
-
-                    # Update layout
-                    fig.update_layout(
-                        title = "Proportion of Income Limit by Education",
-                        xaxis_title = "Education",
-                        yaxis_title = "Proportion (%)",
-                        barmode = "stack",
-                        height = 550,  
-                        width = 800,   
-                        bargap = 0.1, 
-                        bargroupgap = 0.1 
-                    )
+                    with perf_metrics.span("figure_build"):
+                        fig = go.Figure()
+
+                        # Add 'Above limit' trace
+                        fig.add_trace(go.Bar(
+                            x = income_limit_proportion_by_education.index,
+                            y = income_limit_proportion_by_education["Above limit"],
+                            name = "Above limit",
+                            marker = dict(color = "green", line=dict(width=1))
+                            ))
+
+                        # Add 'Below limit' trace
+                        fig.add_trace(go.Bar(
+                            x = income_limit_proportion_by_education.index,
+                            y = income_limit_proportion_by_education["Below limit"],
+                            name = "Below limit",
+                            marker = dict(color = "lightgreen", line = dict(width = 1))
+                            ))
+
+                        # Update layout
+                        fig.update_layout(
+                            title = "Proportion of Income Limit by Education",
+                            xaxis_title = "Education",
+                            yaxis_title = "Proportion (%)",
+                            barmode = "stack",
+                            height = 550,  
+                            width = 800,   
+                            bargap = 0.1, 
+                            bargroupgap = 0.1 
+                        )
 
                     # Show the plot
                     st.plotly_chart(fig)
@@ -128,8 +186,9 @@ def show_dashboard():
 
             with col2:
                 # Marital Status vs Income
-                fig6 = px.histogram(df, x = "marital_status", color = "income_above_limit", barmode = "stack",
-                                    title = "Income Distribution by Marital Status", color_discrete_sequence = ["green", "lightgreen"])
+                with perf_metrics.span("figure_build"):
+                    fig6 = px.histogram(df, x = "marital_status", color = "income_above_limit", barmode = "stack",
+                                        title = "Income Distribution by Marital Status", color_discrete_sequence = ["green", "lightgreen"])
                 st.plotly_chart(fig6)
 
 
@@ -139,23 +198,32 @@ def show_dashboard():
                 # Define the columns to be used
                 selected_columns = ["employment_stat", "wage_per_hour", "mig_year", "importance_of_record", "income_above_limit"]
 
+                # Points drawn, sampled per income label so rare labels keep their points
+                if render_choice == "Every row":
+                    scatter_df = df[selected_columns]
+                    title = "Pair Plot using Plotly"
+                else:
+                    scatter_df = load_scatter_sample(run_ids, selected_columns, int(scatter_points), df)
+                    title = f"Pair Plot using Plotly ({len(scatter_df):,} of {len(df):,} rows)"
+
                 # Create a scatter matrix
-                fig = px.scatter_matrix(
-                    df[selected_columns],
-                    dimensions = selected_columns[:-1], 
-                    color = "income_above_limit", 
-                    title = "Pair Plot using Plotly",
-                    labels = {col: col.replace("_", " ").capitalize() for col in selected_columns},  # Custom labels
-                    color_discrete_sequence = ["green", "lightgreen"]
-                )
-
-                # Update the layout
-                fig.update_layout(
-                    width = 1000,
-                    height = 800,
-                    title_font_size = 18,
-                    hoverlabel = dict(font_size = 12)
-                )
+                with perf_metrics.span("figure_build"):
+                    fig = px.scatter_matrix(
+                        scatter_df,
+                        dimensions = selected_columns[:-1], 
+                        color = "income_above_limit", 
+                        title = title,
+                        labels = {col: col.replace("_", " ").capitalize() for col in selected_columns},  # Custom labels
+                        color_discrete_sequence = ["green", "lightgreen"]
+                    )
+
+                    # Update the layout
+                    fig.update_layout(
+                        width = 1000,
+                        height = 800,
+                        title_font_size = 18,
+                        hoverlabel = dict(font_size = 12)
+                    )
                 st.plotly_chart(fig, use_container_width = True)
 
 
@@ -173,109 +241,124 @@ def show_dashboard():
             age = st.sidebar.slider("Age", 0, int(df["age"].max()), (0, int(df["age"].max())), key = "age")
 
             # Gender selectbox
-            gender = st.sidebar.selectbox("Gender", options = ["Female", "Male"], key = "gender")
+            gender = st.sidebar.selectbox("Gender", options = schema.category_options["gender"], key = "gender")
 
             # Tax status selectbox
-            tax_status = st.sidebar.selectbox("Tax Status", options = [
-                "Head of household", "Single", "Nonfiler", "Joint both 65+", "Joint both under 65", "Joint one under 65 & one 65+"], key = "tax_status")
+            tax_status = st.sidebar.selectbox("Tax Status", options = schema.category_options["tax_status"], key = "tax_status")
 
-            # Filter the data based on sidebar input
-            filtered_df = df[(df["age"] >= age[0]) & (df["age"] <= age[1]) & 
-                            (df["gender"] == gender) & 
-                            (df["tax_status"] == tax_status)]
+            # Select the cube's cells based on sidebar input, by intersecting its bitmaps
+            with perf_metrics.span("dashboard_aggregation"):
+                selected = kpi_cube.select(cube_index, age, gender, tax_status)
 
-            # Check if the filtered DataFrame is empty
-            if filtered_df.empty:
+            # Check if no cell is selected
+            if len(selected) == 0:
                 st.warning("No data available for the selected filters. Please adjust your filters.")
             else:
                 # Metrics
+                with perf_metrics.span("dashboard_aggregation"):
+                    income_counts = kpi_cube.label_counts(cube_index, selected)
+                    gender_counts = kpi_cube.gender_counts(cube_index, selected)
                 col1, col2, col3, col4 = st.columns(4)
                 with col1:
-                    st.metric("Above Limit Count", filtered_df[filtered_df["income_above_limit"] == "Above limit"].shape[0])
+                    st.metric("Above Limit Count", int(income_counts.get("Above limit", 0)))
 
                 with col2:
-                    st.metric("Below Limit Count", filtered_df[filtered_df["income_above_limit"] == "Below limit"].shape[0])
+                    st.metric("Below Limit Count", int(income_counts.get("Below limit", 0)))
 
                 with col3:
-                    st.metric("Male Count", filtered_df[filtered_df["gender"] == "Male"].shape[0])
+                    st.metric("Male Count", int(gender_counts.get("Male", 0)))
 
                 with col4:
-                    st.metric("Female Count", filtered_df[filtered_df["gender"] == "Female"].shape[0])
+                    st.metric("Female Count", int(gender_counts.get("Female", 0)))
                     
 
                 # Split layout into two columns for visualizations -- Row 1
                 left, right = st.columns(2)
                 with left:
                     # Create Pie chart
-                    income_counts = filtered_df["income_above_limit"].value_counts()
-                    pie_fig = px.pie(values = income_counts, names = income_counts.index,
-                                    title = "Percentage Count of Income Limit",
-                                    color_discrete_sequence = ["blue", "lightblue"],
-                                    hole = 0.45,
-                                    width = 650,
-                                    height = 400)
+                    with perf_metrics.span("figure_build"):
+                        pie_fig = px.pie(values = income_counts, names = income_counts.index,
+                                        title = "Percentage Count of Income Limit",
+                                        color_discrete_sequence = ["blue", "lightblue"],
+                                        hole = 0.45,
+                                        width = 650,
+                                        height = 400)
                     
                     st.plotly_chart(pie_fig)
 
                 with right:
+                    # One row per country: the census labels are mapped to ISO-3 codes and their counts added up
+                    with perf_metrics.span("dashboard_aggregation"):
+                        country_counts = countries.aggregate(kpi_cube.cells(cube_index, selected, "country_of_birth_own"),
+                                                             "country_of_birth_own", kpi_cube.label_column)
+
                     # Plotly Express Choropleth for country of birth
-                    fig_map = px.choropleth(
-                        filtered_df, 
-                        locations = "country_of_birth_own", 
-                        locationmode = "country names",
-                        color = "income_above_limit", 
-                        hover_name = "country_of_birth_own", 
-                        color_continuous_scale = px.colors.sequential.Plasma,
-                        title = "Income Disparity by Country of Birth",
-                        width = 650,
-                        height = 400)
+                    with perf_metrics.span("figure_build"):
+                        fig_map = px.choropleth(
+                            country_counts, 
+                            locations = "iso3", 
+                            locationmode = "ISO-3",
+                            color = "above_rate", 
+                            hover_name = "country", 
+                            hover_data = {"iso3": False, "above": True, "below": True, "total": True, "above_rate": ":.1%"},
+                            labels = {"above_rate": "Above limit", "above": "Above limit count", "below": "Below limit count", "total": "Predictions"},
+                            color_continuous_scale = px.colors.sequential.Plasma,
+                            title = "Income Disparity by Country of Birth",
+                            width = 650,
+                            height = 400)
+
+                        # Small countries and territories (Hong Kong, Guam) only appear at the finer resolution
+                        fig_map.update_geos(resolution = 50)
                     
                     # Display the map in Streamlit
                     st.plotly_chart(fig_map)
+                    if country_counts.attrs["unmapped"]:
+                        st.caption(f"{country_counts.attrs['unmapped']:,} predictions have no country of birth on the map.")
 
 
                 # Split layout into two columns for visualizations -- Row 1
                 left, right = st.columns(2)      
                 with left:
                     # Calculate proportion of income limit by education
-                    income_limit_proportion_by_education = (
-                        filtered_df.groupby(by=["education", "income_above_limit"])
-                        .size().unstack().apply(lambda x: x / x.sum() * 100, axis=1)
-                        .sort_values(by="Below limit", ascending=True)
-                    )
+                    with perf_metrics.span("dashboard_aggregation"):
+                        income_limit_proportion_by_education = (
+                            kpi_cube.breakdown(cube_index, selected, "education").apply(lambda x: x / x.sum() * 100, axis=1)
+                            .sort_values(by="Below limit", ascending=True)
+                        )
 
                     # Check if "Above limit" column exists in the DataFrame
                     if "Above limit" in income_limit_proportion_by_education.columns:
                         # Create the plot using Plotly
-                        fig = go.Figure()
-
-                        # Add 'Above limit' trace
-                        fig.add_trace(go.Bar(
-                            x = income_limit_proportion_by_education.index,
-                            y = income_limit_proportion_by_education["Above limit"],
-                            name = "Above limit",
-                            marker = dict(color = "blue", line = dict(width = 1))
-                            ))
-
-                        # Add 'Below limit' trace
-                        fig.add_trace(go.Bar(
-                            x = income_limit_proportion_by_education.index,
-                            y = income_limit_proportion_by_education["Below limit"],
-                            name = "Below limit",
-                            marker = dict(color = "lightblue", line = dict(width = 1))
-                            ))
-
-                        # Update layout
-                        fig.update_layout(
-                            title = "Proportion of Income Limit by Education",
-                            xaxis_title = "Education",
-                            yaxis_title = "Proportion (%)",
-                            barmode = "stack",
-                            height = 550,  
-                            width = 800,   
-                            bargap = 0.1, 
-                            bargroupgap = 0.1 
-                        )
+                        with perf_metrics.span("figure_build"):
+                            fig = go.Figure()
+
+                            # Add 'Above limit' trace
+                            fig.add_trace(go.Bar(
+                                x = income_limit_proportion_by_education.index,
+                                y = income_limit_proportion_by_education["Above limit"],
+                                name = "Above limit",
+                                marker = dict(color = "blue", line = dict(width = 1))
+                                ))
+
+                            # Add 'Below limit' trace
+                            fig.add_trace(go.Bar(
+                                x = income_limit_proportion_by_education.index,
+                                y = income_limit_proportion_by_education["Below limit"],
+                                name = "Below limit",
+                                marker = dict(color = "lightblue", line = dict(width = 1))
+                                ))
+
+                            # Update layout
+                            fig.update_layout(
+                                title = "Proportion of Income Limit by Education",
+                                xaxis_title = "Education",
+                                yaxis_title = "Proportion (%)",
+                                barmode = "stack",
+                                height = 550,  
+                                width = 800,   
+                                bargap = 0.1, 
+                                bargroupgap = 0.1 
+                            )
 
                         # Show the plot
                         st.plotly_chart(fig)
@@ -286,44 +369,45 @@ def show_dashboard():
 
                 with right:
                     # Calculate proportion of income limit by education
-                    income_limit_proportion_by_industry = (
-                        filtered_df.groupby(by=["industry_code_main", "income_above_limit"])
-                        .size().unstack().apply(lambda x: x / x.sum() * 100, axis = 1)
-                        .sort_values(by = "Below limit", ascending = True)
-                    )
+                    with perf_metrics.span("dashboard_aggregation"):
+                        income_limit_proportion_by_industry = (
+                            kpi_cube.breakdown(cube_index, selected, "industry_code_main").apply(lambda x: x / x.sum() * 100, axis = 1)
+                            .sort_values(by = "Below limit", ascending = True)
+                        )
 
                     # Check if "Above limit" column exists in the DataFrame
                     if "Above limit" in income_limit_proportion_by_industry.columns:
                         # Create the plot using Plotly
-                        fig = go.Figure()
-
-                        # Add 'Above limit' trace
-                        fig.add_trace(go.Bar(
-                            x = income_limit_proportion_by_industry.index,
-                            y = income_limit_proportion_by_industry["Above limit"],
-                            name = "Above limit",
-                            marker = dict(color = "blue", line = dict(width = 1))
-                            ))
-
-                        # Add 'Below limit' trace
-                        fig.add_trace(go.Bar(
-                            x = income_limit_proportion_by_industry.index,
-                            y = income_limit_proportion_by_industry["Below limit"],
-                            name = "Below limit",
-                            marker = dict(color = "lightblue", line = dict(width = 1))
-                            ))
-
-                        # Update layout
-                        fig.update_layout(
-                            title = "Proportion of Income Limit by Industry",
-                            xaxis_title = "Industry",
-                            yaxis_title = "Proportion (%)",
-                            barmode = "stack",
-                            height = 500,  
-                            width = 850,   
-                            bargap = 0.1, 
-                            bargroupgap = 0.1 
-                        )
+                        with perf_metrics.span("figure_build"):
+                            fig = go.Figure()
+
+                            # Add 'Above limit' trace
+                            fig.add_trace(go.Bar(
+                                x = income_limit_proportion_by_industry.index,
+                                y = income_limit_proportion_by_industry["Above limit"],
+                                name = "Above limit",
+                                marker = dict(color = "blue", line = dict(width = 1))
+                                ))
+
+                            # Add 'Below limit' trace
+                            fig.add_trace(go.Bar(
+                                x = income_limit_proportion_by_industry.index,
+                                y = income_limit_proportion_by_industry["Below limit"],
+                                name = "Below limit",
+                                marker = dict(color = "lightblue", line = dict(width = 1))
+                                ))
+
+                            # Update layout
+                            fig.update_layout(
+                                title = "Proportion of Income Limit by Industry",
+                                xaxis_title = "Industry",
+                                yaxis_title = "Proportion (%)",
+                                barmode = "stack",
+                                height = 500,  
+                                width = 850,   
+                                bargap = 0.1, 
+                                bargroupgap = 0.1 
+                            )
 
                         # Show the plot
                         st.plotly_chart(fig)
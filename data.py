@@ -1,7 +1,9 @@
 import streamlit as st
 import pandas as pd
-import numpy as np
 import time
+import columnar_cache
+import page_index
+from schema import clean_columns
 
 def show_data():
     user_choice = st.sidebar.radio("### Select a page", options = ["Data Understanding", "Data Hub"], key = "option_selected")
@@ -65,45 +67,25 @@ def show_data():
         st.info("### *Welcome To Data Hub*")
         st.markdown("#### **Uploaded data will be available for prediction in the predict page**") 
 
-        # Load csv data in chunks
+        # Load csv data in chunks from the Parquet cache, or the byte-offset page index until it is built.
+        # The file's version is part of the cache key, so a changed file is not served stale.
         @st.cache_data
-        def load_data_in_chunks(file_path, chunk_size, start_chunk):
+        def load_data_in_chunks(file_path, chunk_size, start_chunk, version = None):
             try:
-                chunks = pd.read_csv(file_path, chunksize = chunk_size)
-                for idx, chunk in enumerate(chunks):
-                    if idx == start_chunk:
-                        return chunk
+                return columnar_cache.read_page(file_path, chunk_size, start_chunk)
             except Exception as e:
                 st.error(f"Error loading data: {str(e)}")
             return None
         
-        # Load excel data in chunks
+        # Load excel data in chunks from its Parquet copy
         @st.cache_data
-        def load_xlsx_in_chunks(file_path, chunk_size, start_chunk):
+        def load_xlsx_in_chunks(file_path, chunk_size, start_chunk, version = None):
             try:
-                chunks = pd.read_excel(file_path, chunksize=chunk_size)
-                for idx, chunk in enumerate(chunks):
-                    if idx == start_chunk:
-                        return chunk
+                return columnar_cache.read_page(file_path, chunk_size, start_chunk)
             except Exception as e:
                 st.error(f"Error loading Excel data: {str(e)}")
             return None
 
-        # Clean dataset
-        def clean_columns(data_chunk):
-            columns_to_drop = ["class", "education_institute", "unemployment_reason", "is_labor_union",
-                            "occupation_code_main", "under_18_family", "veterans_admin_questionnaire",
-                            "migration_code_change_in_msa", "migration_prev_sunbelt", 
-                            "migration_code_move_within_reg", "migration_code_change_in_reg",
-                            "residence_1_year_ago", "old_residence_reg", "old_residence_state"]
-
-            data_chunk = data_chunk.drop(columns = columns_to_drop, axis=1)
-            for col in data_chunk.select_dtypes(include = ["category", "object"]).columns:
-                data_chunk[col] = data_chunk[col].str.strip()
-            data_chunk.replace("?", np.nan, inplace = True)
-            data_chunk["is_hispanic"] = data_chunk["is_hispanic"].replace("NA", "All other")
-            return data_chunk
-
         # Data preview section
         with st.expander("## **Explore the dataset used for testing here**", expanded = False):
 
@@ -112,7 +94,7 @@ def show_data():
             chunk_size_1 = 5000
             # Allow user select page number to access chunked data
             page_number = st.sidebar.number_input("Select Page", min_value = 0, value = 0, step = 1, key = "page_num_1")
-            data_chunk = load_data_in_chunks("data/Test.csv", chunk_size_1, page_number)
+            data_chunk = load_data_in_chunks("data/Test.csv", chunk_size_1, page_number, page_index.source_version("data/Test.csv"))
             
             if data_chunk is not None:
                 st.write(f"Displaying page {page_number + 1} (Rows {page_number * chunk_size_1 + 1} to {(page_number + 1) * chunk_size_1})")
@@ -149,6 +131,8 @@ def show_data():
                 st.session_state.data_loaded = False
 
             if upload_file is not None:
+                # Keep the file itself so bulk prediction can stream all of it, not just the current page
+                st.session_state["uploaded_file"] = upload_file
                 st.sidebar.info("**Explore Uploaded Data Here 👇**")
                 try:
                     if upload_file.name.endswith(".csv"):
@@ -158,7 +142,7 @@ def show_data():
                             # Allow the user to choose the chunk size
                             chunk_size = st.sidebar.slider("Choose chunk size (rows per chunk)", 1000, 10000, 5000, key = "chunk_size_2")
                             page_number = st.sidebar.number_input("Select Page", min_value = 0, value = 0, step = 1, key = "page_num_2")
-                            data_chunk = load_data_in_chunks(upload_file, chunk_size, page_number)
+                            data_chunk = load_data_in_chunks(upload_file, chunk_size, page_number, page_index.source_version(upload_file))
 
                             if data_chunk is not None:
                                 st.write(f"Displaying page {page_number + 1} (Rows {page_number * chunk_size + 1} to {(page_number + 1) * chunk_size})")
@@ -166,7 +150,7 @@ def show_data():
                                 st.session_state["uploaded_data"] = data
                                 st.dataframe(data)
                         else:
-                            data = pd.read_csv(upload_file)
+                            data = columnar_cache.read_frame(upload_file)
                             data = clean_columns(data)
                             st.session_state["uploaded_data"] = data
                             st.subheader("Data Preview")
@@ -179,7 +163,7 @@ def show_data():
                             # Allow the user to choose the chunk size
                             chunk_size = st.sidebar.slider("Choose chunk size (rows per chunk)", 1000, 10000, 5000, key = "chunk_size_3")
                             page_number = st.sidebar.number_input("Select Page", min_value = 0, value = 0, step = 1, key = "page_num_3")
-                            data_chunk = load_xlsx_in_chunks(upload_file, chunk_size, page_number)
+                            data_chunk = load_xlsx_in_chunks(upload_file, chunk_size, page_number, page_index.source_version(upload_file))
 
                             if data_chunk is not None:
                                 st.write(f"Displaying page {page_number + 1} (Rows {page_number * chunk_size + 1} to {(page_number + 1) * chunk_size})")
@@ -187,7 +171,7 @@ def show_data():
                                 st.session_state["uploaded_data"] = data
                                 st.dataframe(data)
                         else:
-                            data = pd.read_excel(upload_file)
+                            data = columnar_cache.read_frame(upload_file)
                             data = clean_columns(data)
                             st.session_state["uploaded_data"] = data
                             st.subheader("Data Preview")
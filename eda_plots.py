@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+# Most outliers drawn per box; the whiskers and quartiles summarise the rest
+max_box_outliers = 200
+
+# Most points drawn in the scatter matrix
+max_scatter_points = 5000
+
+# Points kept from each class even when it is rare, so every class stays visible
+min_stratum_points = 100
+
+
+# Quartiles, whisker ends (the furthest values within 1.5 IQR of the box, as
+# Plotly draws them) and a sample of the outliers of each column
+def box_stats(df, columns, max_outliers = max_box_outliers, seed = 0):
+    rng = np.random.default_rng(seed)
+    stats = {}
+    for column in columns:
+        values = pd.to_numeric(df[column], errors = "coerce").to_numpy(dtype = np.float64, na_value = np.nan)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            continue
+        q1, median, q3 = np.percentile(values, [25, 50, 75])
+        low, high = q1 - 1.5 * (q3 - q1), q3 + 1.5 * (q3 - q1)
+        inside = values[(values >= low) & (values <= high)]
+        outliers = values[(values < low) | (values > high)]
+        if len(outliers) > max_outliers:
+            # The most extreme values stay so the axis covers the same range
+            sample = rng.choice(outliers, max_outliers - 2, replace = False)
+            outliers = np.concatenate(([outliers.min(), outliers.max()], sample))
+        stats[column] = {"q1": q1, "median": median, "q3": q3, "lowerfence": inside.min(), "upperfence": inside.max(),
+                         "outliers": outliers, "count": len(values)}
+    return stats
+
+
+# Box plot drawn from box_stats, one box per column
+def box_figure(stats, title, color = "green", **layout):
+    fig = go.Figure()
+    for column, box in stats.items():
+        fig.add_trace(go.Box(x = [column], q1 = [box["q1"]], median = [box["median"]], q3 = [box["q3"]],
+                             lowerfence = [box["lowerfence"]], upperfence = [box["upperfence"]],
+                             name = column, marker_color = color, showlegend = False))
+        if len(box["outliers"]):
+            fig.add_trace(go.Scatter(x = [column] * len(box["outliers"]), y = box["outliers"], mode = "markers",
+                                     marker = dict(color = color, size = 4), name = column, showlegend = False,
+                                     hovertemplate = "%{y}<extra>outlier</extra>"))
+    fig.update_layout(title = title, xaxis_title = "variable", yaxis_title = "value", **layout)
+    return fig
+
+
+# Sample at most max_points rows: every class first gets up to min_points
+# rows, so rare classes stay visible, and the rest of the points are shared
+# out in proportion to the rows each class has left
+def stratified_sample(df, by, max_points = max_scatter_points, min_points = min_stratum_points, seed = 0):
+    if len(df) <= max_points:
+        return df
+    rng = np.random.default_rng(seed)
+    codes, _ = pd.factorize(df[by], use_na_sentinel = False)
+    counts = np.bincount(codes)
+    floors = np.minimum(counts, min(min_points, max_points // len(counts)))
+    spare = counts - floors
+    shares = floors + np.floor(spare * (max_points - floors.sum()) / max(spare.sum(), 1)).astype(int)
+    keep = [rng.choice(np.flatnonzero(codes == code), share, replace = False) for code, share in enumerate(shares)]
+    return df.iloc[np.sort(np.concatenate(keep))]
+
+
+# Size of the JSON a figure is sent to the browser as
+def payload_bytes(fig):
+    return len(fig.to_json())
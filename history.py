@@ -1,54 +1,138 @@
 import streamlit as st
-import pandas as pd
-import os
+import math
+import bulk_runs
+import history_store
+
+# Page sizes offered on the History page
+page_sizes = [25, 50, 100, 250]
+
+# Predictions the models make
+prediction_labels = ["Below limit", "Above limit"]
+
+# Sort choices as (column, descending); None keeps the order predictions were saved in
+sort_options = {
+    "Newest first": (None, True),
+    "Oldest first": (None, False),
+    "Probability (high to low)": ("Probability", True),
+    "Probability (low to high)": ("Probability", False),
+    "ID": ("ID", False),
+}
 
 def show_history():
-    # History of Single predictions
-    def data_history():
-        if os.path.exists("data/history.csv"):
-            history_df = pd.read_csv("data/history.csv")
-        else:
-            history_df = pd.DataFrame()
+    # Models in the single prediction history; the row count is the store's
+    # version, since rows are only ever added
+    @st.cache_data(max_entries = 4)
+    def single_history_models(version):
+        return history_store.distinct_values("Model_used")
+
+    # Filter, sort and page size widgets; both histories take the same filters
+    def history_filters(key, models):
+        with st.expander("Filter and sort"):
+            col1, col2 = st.columns(2)
+            with col1:
+                dates = st.date_input("Prediction date range", value = (), key = f"{key}_dates")
+                selected_models = st.multiselect("Model", options = models, key = f"{key}_models")
+                id_prefix = st.text_input("ID starts with", key = f"{key}_id_prefix")
+            with col2:
+                selected_labels = st.multiselect("Prediction", options = prediction_labels, key = f"{key}_labels")
+                probability = st.slider("Probability (%)", 0.0, 100.0, (0.0, 100.0), key = f"{key}_probability")
+                sort = st.selectbox("Sort by", options = list(sort_options), key = f"{key}_sort")
+            page_size = st.selectbox("Rows per page", options = page_sizes, index = 1, key = f"{key}_page_size")
+
+        filters = {
+            "date_from": dates[0].isoformat() if len(dates) > 0 else None,
+            "date_to": dates[-1].isoformat() if len(dates) > 1 else None,
+            "models": selected_models,
+            "labels": selected_labels,
+            "id_prefix": id_prefix.strip(),
+            "probability": probability if probability != (0.0, 100.0) else None,
+        }
+        return {name: value for name, value in filters.items() if value}, sort_options[sort], page_size
+
+    # Current page of a query, back to the first page whenever the query changes
+    def current_page(key, query_key):
+        if st.session_state.get(f"{key}_query") != query_key:
+            st.session_state[f"{key}_query"] = query_key
+            st.session_state[f"{key}_page"] = 0
+            st.session_state[f"{key}_cursors"] = [None]
+        return st.session_state[f"{key}_page"]
+
+    def move_page(key, step):
+        st.session_state[f"{key}_page"] += step
+
+    # Previous / Next buttons and the page position
+    def page_controls(key, page, total, page_size):
+        pages = max(math.ceil(total / page_size), 1)
+        col1, col2, col3 = st.columns([1, 1, 4])
+        with col1:
+            st.button("Previous", key = f"{key}_previous", on_click = move_page, args = (key, -1), disabled = page == 0)
+        with col2:
+            st.button("Next", key = f"{key}_next", on_click = move_page, args = (key, 1), disabled = page >= pages - 1)
+        with col3:
+            st.caption(f"Page {page + 1:,} of {pages:,} ({total:,} predictions)")
+
+    # A history is only shown once asked for, and stays up while paging
+    def view_button(key):
+        if st.button("View History", key = f"{key}_view"):
+            st.session_state[f"{key}_visible"] = True
+        return st.session_state.get(f"{key}_visible", False)
+
+    # One page of single predictions from the store. Pages are fetched by keyset,
+    # so the cursor each page ends on is kept to fetch the page after it.
+    def single_history_page():
+        filters, (sort_by, descending), page_size = history_filters("single", single_history_models(history_store.count()))
+        page = current_page("single", (tuple(sorted(filters.items())), sort_by, descending, page_size))
+        cursors = st.session_state["single_cursors"]
+
+        history_df, next_cursor = history_store.query(filters, sort_by or "seq", descending, page_size, cursors[page])
+        del cursors[page + 1:]
+        cursors.append(next_cursor)
+
+        st.dataframe(history_df, hide_index = True)
+        page_controls("single", page, history_store.count(filters), page_size)
+        return history_df
+
+    # One page of a bulk run, reading only the row groups the page falls in
+    def bulk_history_page(run):
+        models = [model for model in (run["model"] or "").split(", ") if model]
+        filters, (sort_by, descending), page_size = history_filters("bulk", models)
+        page = current_page("bulk", (run["run_id"], tuple(sorted(filters.items())), sort_by, descending, page_size))
+
+        history_df, total = bulk_runs.query_run("uploaded", run, filters, sort_by, descending, page, page_size)
+        st.dataframe(history_df)
+        page_controls("bulk", page, total, page_size)
         return history_df
 
-    # Predictions history on uploaded data
-    @st.cache_data
-    def load_uploaded_data_history():
-        if os.path.exists("data/uploaded_data_history.csv"):
-            uploaded_data_history_df = pd.read_csv("data/uploaded_data_history.csv")
-        else:
-            uploaded_data_history_df = pd.DataFrame()
-        return uploaded_data_history_df
-        
 
     # View prediction history based on user's choice
     def view_prediction_history():
         user_choice = st.sidebar.radio("### Display Prediction History",
                                     options = ["Single Prediction", "Bulk Prediction (For uploaded data)"], key = "user_choice")
         df = None
-        
+
         # Display the chosen data history
         if user_choice == "Single Prediction":
             st.info("### 🔓 Income Above Limit Unlocked")
             st.subheader("Single Prediction History")
-            if st.button("View History"):
-                df = st.dataframe(data_history().iloc[::-1])
-                
+            if view_button("single"):
+                df = single_history_page()
+
         elif user_choice == "Bulk Prediction (For uploaded data)":
             st.info("### 🔓 Income Above Limit Unlocked")
             st.subheader("Bulk Prediction History (For Uploaded Data)")
-            if st.button("View History"):
-                # Load the historical data
-                df = load_uploaded_data_history()
+            runs = bulk_runs.runs("uploaded")
+            if not runs:
+                st.warning("### No prediction history found")
+                return df
 
-                if df is not None:
-                    # Display data in streamlit
-                    st.dataframe(df)
-                    # Save df to session state
-                    st.session_state["dashboard_data"] = df
+            # Every run from the manifest, newest first
+            st.dataframe([{name: run[name] for name in ["run_id", "date", "rows", "model", "source", "seconds"]} for run in runs],
+                         hide_index = True)
+            run_id = st.selectbox("Bulk run", options = [run["run_id"] for run in runs], key = "bulk_run_id")
+            if view_button("bulk"):
+                df = bulk_history_page(next(run for run in runs if run["run_id"] == run_id))
 
         return df
 
     # Execute function
     view_prediction_history()
-
@@ -0,0 +1,517 @@
+import atexit
+import glob
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import numpy as np
+import pandas as pd
+import perf_metrics
+import schema
+
+# Journals are locked by the process writing them; without fcntl (Windows) the
+# journals of other processes are left alone rather than replayed while in use
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Single prediction history, and the CSV it used to be appended to
+db_path = os.path.join("data", "history.db")
+legacy_csv = os.path.join("data", "history.csv")
+
+# Columns of a history row, in the order the CSV history used
+columns = ["ID", "Prediction_Date", "Prediction_Time"] + schema.model_features + ["Model_used", "income_above_limit", "Probability"]
+
+# Columns with an index for looking up and filtering the history
+indexed_columns = ["Prediction_Date", "Model_used", "income_above_limit", "ID", "Probability"]
+
+# Filters matching at least this share of the rows page through the sort order
+# instead of their own index; the share is estimated on probe_rows rows
+broad_share = 0.05
+probe_rows = 200
+
+# Rows per insert while importing the CSV history
+import_chunk_rows = 50000
+
+# Queued predictions are written once this many are waiting, or this many
+# seconds after the first of them was queued
+writer_batch_rows = 256
+writer_flush_seconds = 0.25
+
+# Longest a read waits for queued predictions to be written
+read_flush_timeout = 5
+
+# How long a batch is retried while another connection holds the database
+# locked; other errors are not retried
+busy_retry_seconds = 60
+
+# A writer's journal is emptied once it holds this many bytes
+journal_sync_bytes = 1024 * 1024
+
+_column_sql = ", ".join(f'"{column}"' for column in columns)
+_insert_sql = f"INSERT INTO single_predictions ({_column_sql}) VALUES ({', '.join('?' for _ in columns)})"
+
+# One connection per process, shared by every session thread under the lock
+_connection = None
+_connection_lock = threading.RLock()
+
+
+# Each process journals the batches its writer is about to store to a file of
+# its own, holding an exclusive lock on it while it runs. The store keeps the id
+# of the last entry written from each journal, so a later process can store the
+# rest of a journal whose writer died, without writing anything twice.
+def journal_path(name):
+    return f"{db_path}.queue.{name}"
+
+
+# Predictions the store would not take, kept instead of silently lost
+def rejected_path():
+    return f"{db_path}.rejected"
+
+
+def _column_type(column):
+    if column in schema.integer_features:
+        return "INTEGER"
+    return "REAL" if column in schema.numeric_dtypes or column == "Probability" else "TEXT"
+
+
+# Rows are numbered in insert order, so newest first is a walk down the primary
+# key; each index ends in seq so filtered queries come out newest first too
+def _create_schema(connection):
+    column_types = ", ".join(f'"{column}" {_column_type(column)}' for column in columns)
+    connection.execute(f"CREATE TABLE IF NOT EXISTS single_predictions (seq INTEGER PRIMARY KEY, {column_types})")
+    for column in indexed_columns:
+        connection.execute(f'CREATE INDEX IF NOT EXISTS idx_{column.lower()} ON single_predictions ("{column}", seq)')
+    connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+
+# Open the store on first use, creating it and importing the CSV history once
+def _connect():
+    global _connection
+    with _connection_lock:
+        if _connection is None:
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok = True)
+            connection = sqlite3.connect(db_path, check_same_thread = False, timeout = 30)
+            connection.execute("PRAGMA journal_mode = WAL")
+            # Commits do not sync the write-ahead log; queued batches are synced to
+            # their journal instead, once per batch, and replayed after a power loss
+            connection.execute("PRAGMA synchronous = NORMAL")
+            with connection:
+                _create_schema(connection)
+            _import_csv(connection, legacy_csv)
+            _replay_journals(connection)
+            _connection = connection
+        return _connection
+
+
+def _journal_acked(connection, name):
+    row = connection.execute("SELECT value FROM meta WHERE key = ?", (f"journal_acked:{name}",)).fetchone()
+    return int(row[0]) if row else 0
+
+
+def _set_journal_acked(connection, name, journal_id):
+    connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (f"journal_acked:{name}", str(journal_id)))
+
+
+# Exclusive lock on an open journal, without waiting; False while another process holds it
+def _lock_journal(f):
+    if fcntl is None:
+        return False
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+
+def _reject(rows, error):
+    with open(rejected_path(), "a") as f:
+        for row in rows:
+            f.write(json.dumps({"error": str(error), "row": list(row)}, default = str) + "\n")
+
+
+# Store what the journals of dead writers hold beyond their last written id,
+# then delete them. A journal still locked belongs to a live process and is
+# skipped. A torn last line was never synced as part of a batch, so it is left out.
+def _replay_journals(connection):
+    for file_path in glob.glob(journal_path("*")):
+        name = file_path[len(journal_path("")):]
+        try:
+            f = open(file_path)
+        except OSError:
+            continue
+        with f:
+            if not _lock_journal(f):
+                continue
+            # Another process may have replayed and deleted it before the lock was ours
+            try:
+                if not os.path.samestat(os.stat(file_path), os.fstat(f.fileno())):
+                    continue
+            except OSError:
+                continue
+            entries = []
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    break
+            acked = _journal_acked(connection, name)
+            rows = [tuple(entry["row"]) for entry in entries if entry["id"] > acked]
+            try:
+                with connection:
+                    connection.executemany(_insert_sql, rows)
+            except sqlite3.Error:
+                # Keep the rows the store takes and set the others aside
+                for row in rows:
+                    try:
+                        with connection:
+                            connection.execute(_insert_sql, row)
+                    except sqlite3.Error as e:
+                        _reject([row], e)
+            with connection:
+                connection.execute("DELETE FROM meta WHERE key = ?", (f"journal_acked:{name}",))
+            os.remove(file_path)
+
+
+# sqlite3 only binds plain Python values; NumPy scalars would be stored as blobs
+def _plain(row):
+    return tuple(None if value is None or (isinstance(value, float) and np.isnan(value))
+                 else value.item() if isinstance(value, np.generic) else value for value in row)
+
+
+def _to_rows(df):
+    df = df.reindex(columns = columns).astype(object)
+    return [_plain(row) for row in df.itertuples(index = False, name = None)]
+
+
+def _import_csv(connection, file_path):
+    if not os.path.exists(file_path):
+        return 0
+    if connection.execute("SELECT 1 FROM meta WHERE key = ?", (f"imported:{os.path.abspath(file_path)}",)).fetchone():
+        return 0
+
+    # Skip files that are not a prediction history (e.g. an unfetched Git LFS pointer)
+    header = pd.read_csv(file_path, nrows = 0).columns
+    if not {"ID", "Model_used", "income_above_limit"}.issubset(header):
+        return 0
+
+    imported = 0
+    with connection:
+        for chunk in pd.read_csv(file_path, chunksize = import_chunk_rows,
+                                 dtype = {"ID": str, "Prediction_Date": str, "Prediction_Time": str}):
+            rows = _to_rows(chunk)
+            connection.executemany(_insert_sql, rows)
+            imported += len(rows)
+        connection.execute("INSERT INTO meta (key, value) VALUES (?, ?)", (f"imported:{os.path.abspath(file_path)}", str(imported)))
+    return imported
+
+
+# One-time import of a CSV history; the CSV itself is left in place and a
+# file that was already imported is skipped
+def import_csv(file_path = legacy_csv):
+    connection = _connect()
+    with _connection_lock:
+        return _import_csv(connection, file_path)
+
+
+def _row(record):
+    return _plain(record.get(column) for column in columns) if isinstance(record, dict) else _plain(record)
+
+
+# Append predictions given as a frame, dicts keyed by column, or tuples in column order
+@perf_metrics.timed("history_write")
+def add_predictions(records):
+    rows = _to_rows(records) if isinstance(records, pd.DataFrame) else [_row(record) for record in records]
+    connection = _connect()
+    with _connection_lock, connection:
+        connection.executemany(_insert_sql, rows)
+    return len(rows)
+
+
+# Store journaled (id, row) entries and mark them written in one transaction
+@perf_metrics.timed("history_write")
+def _add_journaled(name, entries):
+    connection = _connect()
+    with _connection_lock, connection:
+        connection.executemany(_insert_sql, [row for _, row in entries])
+        _set_journal_acked(connection, name, entries[-1][0])
+
+
+# Commit once with a synced write-ahead log, which makes every earlier commit durable too
+def _sync_commit(name, journal_id):
+    connection = _connect()
+    with _connection_lock:
+        connection.execute("PRAGMA synchronous = FULL")
+        try:
+            with connection:
+                _set_journal_acked(connection, name, journal_id)
+        finally:
+            connection.execute("PRAGMA synchronous = NORMAL")
+
+
+def _is_busy(error):
+    message = str(error).lower()
+    return "locked" in message or "busy" in message
+
+
+def add_prediction(record):
+    return add_predictions([record])
+
+
+# Writes predictions from every session on one background thread, so a
+# prediction only waits for the queue. Each batch is appended to this process's
+# journal and synced once before it is stored, so a stored batch survives a
+# power loss. Predictions still queued, at most writer_flush_seconds' worth,
+# are lost if the process dies. A batch is retried while the database is
+# locked; a record the store rejects is set aside in the rejected file so it
+# does not hold up the ones after it.
+class HistoryWriter:
+    def __init__(self, batch_rows = writer_batch_rows, flush_seconds = writer_flush_seconds):
+        self.batch_rows = batch_rows
+        self.flush_seconds = flush_seconds
+        self.journal_name = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.journal = open(journal_path(self.journal_name), "a")
+        _lock_journal(self.journal)
+        self.next_id = 1
+        self.pending = []
+        self.unwritten = 0
+        self.condition = threading.Condition()
+        self.batches = 0
+        self.rows = 0
+        self.dropped = 0
+        self.last_error = None
+        self.thread = threading.Thread(target = self._run, name = "history-writer", daemon = True)
+        self.thread.start()
+
+    def submit(self, record):
+        row = _row(record)
+        with self.condition:
+            self.pending.append(row)
+            self.unwritten += 1
+            self.condition.notify_all()
+
+    # Wait until everything submitted so far is written; False on timeout
+    def flush(self, timeout = None):
+        with self.condition:
+            return self.condition.wait_for(lambda: self.unwritten == 0, timeout)
+
+    def _next_batch(self):
+        with self.condition:
+            self.condition.wait_for(lambda: self.pending)
+            deadline = time.monotonic() + self.flush_seconds
+            while len(self.pending) < self.batch_rows:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            batch = self.pending[:self.batch_rows]
+            del self.pending[:self.batch_rows]
+            return batch
+
+    # Sync the numbered batch to the journal in one write
+    def _journal(self, entries):
+        self.journal.write("".join(json.dumps({"id": journal_id, "row": list(row)}, default = str) + "\n"
+                                   for journal_id, row in entries))
+        self.journal.flush()
+        os.fsync(self.journal.fileno())
+
+    def _write(self, entries):
+        deadline = time.monotonic() + busy_retry_seconds
+        while True:
+            try:
+                _add_journaled(self.journal_name, entries)
+                return
+            except Exception as e:
+                self.last_error = e
+                if not (isinstance(e, sqlite3.OperationalError) and _is_busy(e) and time.monotonic() < deadline):
+                    break
+                time.sleep(self.flush_seconds)
+
+        # Find the records at fault by writing the batch one record at a time
+        if len(entries) > 1:
+            for entry in entries:
+                self._write([entry])
+            return
+        self.dropped += 1
+        try:
+            _reject([entries[0][1]], self.last_error)
+            with _connection_lock, _connect() as connection:
+                _set_journal_acked(connection, self.journal_name, entries[0][0])
+        except Exception as e:
+            # The next batch written marks it done along with its own records
+            self.last_error = e
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            entries = list(zip(range(self.next_id, self.next_id + len(batch)), batch))
+            self.next_id += len(batch)
+            try:
+                self._journal(entries)
+            except OSError as e:
+                # The batch is still stored, only without surviving a power loss
+                self.last_error = e
+            self._write(entries)
+
+            # Empty a full journal once a synced commit has made its batches durable
+            try:
+                if self.journal.tell() >= journal_sync_bytes:
+                    _sync_commit(self.journal_name, entries[-1][0])
+                    self.journal.truncate(0)
+            except Exception as e:
+                self.last_error = e
+
+            with self.condition:
+                self.unwritten -= len(batch)
+                self.batches += 1
+                self.rows += len(batch)
+                self.condition.notify_all()
+
+
+_writer = None
+
+
+def writer():
+    global _writer
+    with _connection_lock:
+        if _writer is None:
+            # Journals left by dead processes are replayed before this one starts its own
+            _connect()
+            _writer = HistoryWriter()
+        return _writer
+
+
+# Queue a prediction for the background writer
+def submit_prediction(record):
+    writer().submit(record)
+
+
+# Write out queued predictions, e.g. before reading the history back
+def flush(timeout = None):
+    return _writer.flush(timeout) if _writer is not None else True
+
+
+# Give queued predictions a chance to reach the store before the process exits
+@atexit.register
+def _flush_at_exit():
+    flush(timeout = 10)
+
+
+# WHERE clause for the History page filters: date_from / date_to (ISO dates),
+# models and labels (lists), id_prefix, and probability (low, high) in percent
+def _filter_sql(filters):
+    clauses, parameters = [], []
+    filters = filters or {}
+    if filters.get("date_from"):
+        clauses.append('"Prediction_Date" >= ?')
+        parameters.append(str(filters["date_from"]))
+    if filters.get("date_to"):
+        clauses.append('"Prediction_Date" <= ?')
+        parameters.append(str(filters["date_to"]))
+    for column, key in [("Model_used", "models"), ("income_above_limit", "labels")]:
+        if filters.get(key):
+            clauses.append(f'"{column}" IN ({", ".join("?" for _ in filters[key])})')
+            parameters.extend(filters[key])
+    # A prefix is a range on the ID index rather than a scan
+    if filters.get("id_prefix"):
+        clauses.append('"ID" >= ? AND "ID" < ?')
+        parameters.extend([filters["id_prefix"], filters["id_prefix"] + "\U0010ffff"])
+    if filters.get("probability"):
+        clauses.append('"Probability" BETWEEN ? AND ?')
+        parameters.extend(filters["probability"])
+    return clauses, parameters
+
+
+# Rows are never deleted, so without filters the highest seq is the row count,
+# read from the primary key; with filters the matches are counted in SQLite
+def count(filters = None):
+    flush(read_flush_timeout)
+    connection = _connect()
+    clauses, parameters = _filter_sql(filters)
+    with _connection_lock:
+        if not clauses:
+            return connection.execute("SELECT COALESCE(MAX(seq), 0) FROM single_predictions").fetchone()[0]
+        return connection.execute(f"SELECT COUNT(*) FROM single_predictions WHERE {' AND '.join(clauses)}",
+                                  parameters).fetchone()[0]
+
+
+# Distinct values of an indexed column, e.g. to offer as filter options
+def distinct_values(column):
+    connection = _connect()
+    with _connection_lock:
+        rows = connection.execute(f'SELECT DISTINCT "{column}" FROM single_predictions WHERE "{column}" IS NOT NULL ORDER BY 1').fetchall()
+    return [row[0] for row in rows]
+
+
+# Whether filters match at least broad_share of the rows, estimated on
+# probe_rows rows spread evenly over the table so the probe costs the same at any size
+def _is_broad(connection, clauses, parameters):
+    with _connection_lock:
+        total = connection.execute("SELECT COALESCE(MAX(seq), 0) FROM single_predictions").fetchone()[0]
+        sample = np.unique(np.linspace(1, total, min(total, probe_rows)).astype(np.int64))
+        found = connection.execute(f"SELECT COUNT(*) FROM single_predictions WHERE seq IN ({', '.join(map(str, sample))}) "
+                                   f"AND {' AND '.join(clauses)}", parameters).fetchone()[0]
+    return found >= broad_share * max(sample.size, 1)
+
+
+# One page of filtered predictions sorted on sort_by (seq, or one of indexed_columns)
+# with seq breaking ties. Pages are fetched by keyset: pass the cursor returned
+# with one page as after to get the next, so a page costs the same however deep
+# it is. Returns the page and the cursor of its last row (None on the last page).
+def query(filters = None, sort_by = "seq", descending = True, limit = 50, after = None):
+    flush(read_flush_timeout)
+    connection = _connect()
+    clauses, parameters = _filter_sql(filters)
+    filter_clauses, filter_parameters = list(clauses), list(parameters)
+    direction, comparison = ("DESC", "<") if descending else ("ASC", ">")
+    if after is not None:
+        if sort_by == "seq":
+            clauses.append(f"seq {comparison} ?")
+            parameters.append(after[1])
+        else:
+            clauses.append(f'("{sort_by}", seq) {comparison} (?, ?)')
+            parameters.extend(after)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    order = f"seq {direction}" if sort_by == "seq" else f'"{sort_by}" {direction}, seq {direction}'
+
+    # Walk the rows in sort order so a page stops after its LIMIT instead of
+    # sorting every match, but only when the filters match a large share of the
+    # rows anyway: no filters, the label filter, a model filter when sorting by
+    # a column, or any filter the probe finds broad. Narrow filters, and an ID
+    # prefix always, are left to the planner, which reads their own
+    # (column, seq) index first.
+    active = {key for key, value in (filters or {}).items() if value}
+    broad_keys = {"labels"} if sort_by == "seq" else {"labels", "models"}
+    if not filter_clauses or active <= broad_keys:
+        walk = True
+    else:
+        walk = "id_prefix" not in active and _is_broad(connection, filter_clauses, filter_parameters)
+    if walk:
+        hint = "NOT INDEXED" if sort_by == "seq" else f"INDEXED BY idx_{sort_by.lower()}"
+    else:
+        hint = ""
+    with _connection_lock:
+        rows = connection.execute(f"SELECT seq, {_column_sql} FROM single_predictions {hint} {where} ORDER BY {order} LIMIT ?",
+                                  parameters + [limit + 1]).fetchall()
+    page = pd.DataFrame.from_records(rows[:limit], columns = ["seq"] + columns, index = "seq")
+    if len(rows) <= limit:
+        return page, None
+    last = rows[limit - 1]
+    return page, (last[0] if sort_by == "seq" else last[1 + columns.index(sort_by)], last[0])
+
+
+# Newest predictions first, indexed by seq. Passing the smallest seq of one
+# page as before_seq fetches the next page through the primary key, so every
+# page costs the same however deep it is.
+def read_latest(limit = 1000, before_seq = None):
+    flush(read_flush_timeout)
+    connection = _connect()
+    where = "WHERE seq < ?" if before_seq is not None else ""
+    parameters = (before_seq, limit) if before_seq is not None else (limit,)
+    with _connection_lock:
+        rows = connection.execute(f"SELECT seq, {_column_sql} FROM single_predictions {where} ORDER BY seq DESC LIMIT ?",
+                                  parameters).fetchall()
+    return pd.DataFrame.from_records(rows, columns = ["seq"] + columns, index = "seq")
@@ -0,0 +1,93 @@
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import bitmap_index
+
+# Prediction counts behind the KPI Dashboard. Every count is broken down by the
+# dashboard filters and the income label; each chart dimension gets its own
+# slice on top of that, so the cube stays small however many rows are scored.
+filter_dimensions = ["age", "gender", "tax_status"]
+label_column = "income_above_limit"
+chart_dimensions = ["education", "industry_code_main", "country_of_birth_own"]
+
+# Columns a cube is built from, and the columns it is stored with
+source_columns = filter_dimensions + chart_dimensions + [label_column]
+cube_columns = filter_dimensions + [label_column, "dimension", "value", "count"]
+
+# Slice without a chart dimension, for the metrics and the pie chart
+totals = "total"
+
+
+def empty():
+    return pd.DataFrame({column: pd.Series(dtype = "int64" if column == "count" else "object") for column in cube_columns})
+
+
+def _slice(df, dimension):
+    keys = filter_dimensions + [label_column] + ([dimension] if dimension != totals else [])
+    counts = df.groupby(keys, observed = True).size().reset_index(name = "count")
+    counts["dimension"] = dimension
+    counts["value"] = counts.pop(dimension).astype(str) if dimension != totals else ""
+    return counts[cube_columns]
+
+
+# Count the predictions of a scored frame; rows missing a filter or the label
+# are left out, as the dashboard's filters leave them out
+def build(df):
+    df = df[source_columns]
+    for column in ["gender", "tax_status", label_column]:
+        df = df.assign(**{column: df[column].astype(str).where(df[column].notna())})
+    df = df.assign(age = pd.to_numeric(df["age"], errors = "coerce"))
+    return merge([_slice(df, dimension) for dimension in [totals] + chart_dimensions])
+
+
+# Add up cubes, e.g. those of the chunks of one run or of several runs
+def merge(cubes):
+    cubes = [cube for cube in cubes if cube is not None and not cube.empty]
+    if not cubes:
+        return empty()
+    cube = pd.concat(cubes, ignore_index = True)
+    if len(cubes) > 1:
+        cube = cube.groupby(cube_columns[:-1], observed = True, sort = False)["count"].sum().reset_index()
+    return cube
+
+
+def save(cube, file_path):
+    pq.write_table(pa.Table.from_pandas(cube, preserve_index = False), file_path)
+
+
+def load(file_path):
+    return pq.read_table(file_path).to_pandas()
+
+
+# Bitmap index over a cube's cells for the dashboard filters, built once per
+# set of runs so each filter change is a lookup rather than a scan
+def index(cube):
+    return bitmap_index.BitmapIndex(cube, bitmapped = ["gender", "tax_status"], sort_by = "age",
+                                    grouped = ["dimension", label_column, "value"], weight = "count")
+
+
+# Cells of an indexed cube matching the dashboard filters, as row numbers
+def select(index, age_range, gender, tax_status):
+    return index.select(*age_range, equal = {"gender": gender, "tax_status": tax_status})
+
+
+# Predictions per income label
+def label_counts(index, selected):
+    return index.counts(index.where(selected, "dimension", totals), [label_column]).sort_values(ascending = False)
+
+
+# Predictions per gender
+def gender_counts(index, selected):
+    return index.counts(index.where(selected, "dimension", totals), ["gender"])
+
+
+# Predictions per value of a chart dimension and income label, one row each
+def cells(index, selected, dimension):
+    counts = index.counts(index.where(selected, "dimension", dimension), ["value", label_column])
+    return counts.reset_index().rename(columns = {"value": dimension})
+
+
+# Predictions per value of a chart dimension (rows) and income label (columns)
+def breakdown(index, selected, dimension):
+    counts = index.counts(index.where(selected, "dimension", dimension), ["value", label_column])
+    return counts.unstack().rename_axis(dimension).rename_axis(label_column, axis = 1)
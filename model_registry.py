@@ -0,0 +1,165 @@
+import glob
+import os
+import threading
+import time
+from collections import OrderedDict
+import joblib
+import page_index
+import perf_metrics
+
+# Saved artifacts by name; any other .joblib under models/ is registered by its file name
+model_dir = "models"
+artifact_paths = {
+    "XGBoost": os.path.join(model_dir, "xgboost_model.joblib"),
+    "Random Forest": os.path.join(model_dir, "random_forest_model.joblib"),
+    "encoder": os.path.join(model_dir, "encoder.joblib"),
+}
+
+# Artifacts loaded in the background when the app starts
+preload_names = ["XGBoost", "Random Forest", "encoder"]
+
+# Loaded artifacts are evicted least recently used first beyond this many bytes,
+# estimated from the size of each file on disk
+max_registry_bytes = 1024 * 1024 * 1024
+
+# Loaded artifacts keyed by (name, version), most recently used last
+_entries = OrderedDict()
+_registry_lock = threading.Lock()
+_load_locks = {}
+_load_timings = []
+_preload_thread = None
+
+# Called with (name, version) of each artifact the registry evicts
+_evict_listeners = []
+
+
+# Register extra artifacts dropped into models/ without touching the defaults
+def discover():
+    known = {os.path.normpath(path) for path in artifact_paths.values()}
+    for file_path in sorted(glob.glob(os.path.join(model_dir, "*.joblib"))):
+        if os.path.normpath(file_path) not in known:
+            artifact_paths.setdefault(os.path.splitext(os.path.basename(file_path))[0], file_path)
+    return dict(artifact_paths)
+
+
+# Load artifacts from another directory, keeping their file names
+def use_model_dir(directory):
+    global model_dir
+    model_dir = directory
+    for name, file_path in artifact_paths.items():
+        artifact_paths[name] = os.path.join(directory, os.path.basename(file_path))
+
+
+# Version of an artifact is the hash of its current contents
+def current_version(name):
+    return page_index.content_hash(artifact_paths[name])[:12]
+
+
+def _evict():
+    evicted = []
+    total = sum(entry["bytes"] for entry in _entries.values())
+    # The most recently used entry always stays, even if it alone exceeds the budget
+    while total > max_registry_bytes and len(_entries) > 1:
+        key, entry = _entries.popitem(last = False)
+        total -= entry["bytes"]
+        evicted.append(key)
+    return evicted
+
+
+# Register a callback for evictions, e.g. to release resources built around an artifact
+def on_evict(listener):
+    if listener not in _evict_listeners:
+        _evict_listeners.append(listener)
+
+
+# (name, version) of a loaded artifact object, or None if it is not from the registry
+def key_of(artifact):
+    with _registry_lock:
+        for key, entry in _entries.items():
+            if entry["artifact"] is artifact:
+                return key
+    return None
+
+
+# Return a loaded artifact, loading it once per version. Concurrent callers of
+# the same artifact wait for a single load instead of each deserializing it.
+def get(name, version = None):
+    if name not in artifact_paths:
+        discover()
+    version = version or current_version(name)
+    key = (name, version)
+
+    with _registry_lock:
+        if key in _entries:
+            _entries.move_to_end(key)
+            return _entries[key]["artifact"]
+        load_lock = _load_locks.setdefault(key, threading.Lock())
+
+    with load_lock:
+        with _registry_lock:
+            if key in _entries:
+                _entries.move_to_end(key)
+                return _entries[key]["artifact"]
+
+        file_path = artifact_paths[name]
+        if version != current_version(name):
+            raise KeyError(f"{name} version {version} is no longer loaded or on disk")
+        start = time.perf_counter()
+        artifact = joblib.load(file_path)
+        seconds = time.perf_counter() - start
+        perf_metrics.record("model_load", seconds)
+        size = os.path.getsize(file_path)
+
+        with _registry_lock:
+            _entries[key] = {"artifact": artifact, "bytes": size}
+            evicted = _evict()
+            _load_timings.append({"name": name, "version": version, "seconds": seconds, "bytes": size, "loaded_at": time.time()})
+            _load_locks.pop(key, None)
+
+        # Listeners run outside the registry lock so they may call back into it
+        for evicted_key in evicted:
+            for listener in list(_evict_listeners):
+                listener(evicted_key)
+        return artifact
+
+
+# Whether the current version of an artifact is already in memory
+def is_loaded(name):
+    if name not in artifact_paths:
+        return False
+    key = (name, current_version(name))
+    with _registry_lock:
+        return key in _entries
+
+
+# Load the configured artifacts in a background thread, once per process.
+# Failures are left for the first real get() to report. The thread is not a
+# daemon so interpreter shutdown never interrupts a model mid-load.
+def preload(names = None):
+    global _preload_thread
+    with _registry_lock:
+        if _preload_thread is not None:
+            return _preload_thread
+
+        def run():
+            for name in names or preload_names:
+                try:
+                    get(name)
+                except Exception:
+                    pass
+
+        _preload_thread = threading.Thread(target = run, name = "model-preload")
+        _preload_thread.start()
+        return _preload_thread
+
+
+# Load timings of every artifact loaded so far, oldest first
+def load_timings():
+    with _registry_lock:
+        return [dict(timing) for timing in _load_timings]
+
+
+# Artifacts currently in memory, least recently used first
+def loaded_entries():
+    with _registry_lock:
+        return [{"name": name, "version": version, "bytes": entry["bytes"]} for (name, version), entry in _entries.items()]
@@ -0,0 +1,231 @@
+import contextlib
+import hashlib
+import io
+import os
+import numpy as np
+import pandas as pd
+
+# Persistent page indexes live next to the datasets
+cache_dir = os.path.join("data", "cache")
+
+# Bytes scanned per read while building an index
+block_size = 16 * 1024 * 1024
+
+# Index files kept on disk before the least recently used are dropped
+max_index_files = 20
+
+# Bytes that make a line blank when nothing else is on it (tab, newline, carriage return, space)
+_whitespace = np.array([9, 10, 13, 32], dtype = np.uint8)
+
+# In-process memo of content hashes and loaded indexes
+_hash_memo = {}
+_index_memo = {}
+
+
+# Open a path or an uploaded file as a seekable binary stream
+def _open_source(source):
+    if isinstance(source, (str, os.PathLike)):
+        return open(source, "rb")
+    # Uploaded files are already in memory; reuse the buffer without closing it
+    source.seek(0)
+    return contextlib.nullcontext(source)
+
+
+# Cheap version of a source that changes whenever its contents may have:
+# path, size and mtime of a file, or id and size of an upload (None otherwise)
+def source_version(source):
+    if isinstance(source, (str, os.PathLike)):
+        try:
+            stat = os.stat(source)
+        except OSError:
+            return None
+        return (os.path.realpath(source), stat.st_size, stat.st_mtime_ns)
+    if getattr(source, "file_id", None) is not None:
+        return (source.file_id, source.size)
+    return None
+
+
+# Hash the file contents, memoized per source version so large files are hashed once
+def content_hash(source):
+    memo_key = source_version(source)
+    if memo_key in _hash_memo:
+        return _hash_memo[memo_key]
+
+    digest = hashlib.sha1()
+    with _open_source(source) as stream:
+        for block in iter(lambda: stream.read(block_size), b""):
+            digest.update(block)
+    file_hash = digest.hexdigest()
+
+    if memo_key is not None:
+        _hash_memo[memo_key] = file_hash
+    return file_hash
+
+
+# Find the quotes that open or close a quoted field, the way the pandas tokenizer does:
+# a quote opens one only at the start of a field, "" inside it is an escaped quote,
+# and any other quote is literal text. Returns the toggle positions and the carried state.
+def _quote_toggles(buffer, in_quotes, pending, previous_byte):
+    toggles = []
+    quotes = np.flatnonzero(buffer == 34)
+    skip = -1
+
+    # A quote that ended the previous block inside a field either closes it or escapes this one
+    if pending:
+        if buffer.size and buffer[0] == 34:
+            skip = 0
+        else:
+            toggles.append(-1)
+            in_quotes = 0
+        pending = False
+
+    for quote in quotes.tolist():
+        if quote == skip:
+            continue
+        if not in_quotes:
+            before = buffer[quote - 1] if quote else previous_byte
+            if before in (44, 10, 13):
+                toggles.append(quote)
+                in_quotes = 1
+        elif quote + 1 == buffer.size:
+            pending = True
+        elif buffer[quote + 1] == 34:
+            skip = quote + 1
+        else:
+            toggles.append(quote)
+            in_quotes = 0
+
+    return np.array(toggles, dtype = np.int64), in_quotes, pending
+
+
+# Scan the raw bytes once and record where every chunk_size-th data row starts
+def build_page_index(source, chunk_size):
+    page_offsets = []
+    header_end = None
+    record_count = 0         # non-blank records seen, header included
+    record_start = 0         # absolute offset where the current record begins
+    record_has_data = False  # whether the current record has anything but whitespace so far
+    in_quotes = 0            # quoted-field state carried over block boundaries
+    pending_quote = False    # block ended on a quote inside a quoted field
+    previous_byte = 10
+    position = 0
+
+    with _open_source(source) as stream:
+        # Files with old Mac line endings end their records with "\r" alone
+        head = stream.read(64 * 1024)
+        newline = 13 if b"\n" not in head and b"\r" in head else 10
+        stream.seek(0)
+
+        for block in iter(lambda: stream.read(block_size), b""):
+            buffer = np.frombuffer(block, dtype = np.uint8)
+            newlines = np.flatnonzero(buffer == newline)
+
+            # Newlines inside quoted fields do not end a record
+            if in_quotes or pending_quote or (buffer == 34).any():
+                toggles, next_in_quotes, pending_quote = _quote_toggles(buffer, in_quotes, pending_quote, previous_byte)
+                parity = (np.searchsorted(toggles, newlines) + in_quotes) % 2
+                newlines = newlines[parity == 0]
+                in_quotes = next_in_quotes
+
+            # Running count of non-whitespace bytes, to skip whitespace-only lines as pandas does
+            filled = np.concatenate(([0], np.cumsum(~np.isin(buffer, _whitespace), dtype = np.int64)))
+
+            if newlines.size:
+                ends = newlines + position
+                starts = np.concatenate(([record_start], ends[:-1] + 1))
+
+                local_starts = np.concatenate(([0], newlines[:-1] + 1))
+                non_blank = filled[newlines] > filled[local_starts]
+                non_blank[0] |= record_has_data
+                starts = starts[non_blank]
+
+                # Record numbers of the kept rows; record 0 is the header
+                record_numbers = record_count + np.arange(starts.size)
+                if header_end is None and starts.size:
+                    header_end = int(ends[non_blank][0]) + 1
+                data_rows = record_numbers - 1
+                page_offsets.append(starts[(data_rows >= 0) & (data_rows % chunk_size == 0)])
+
+                record_count += starts.size
+                record_start = int(ends[-1]) + 1
+                record_has_data = bool(filled[-1] > filled[newlines[-1] + 1])
+            else:
+                record_has_data = record_has_data or bool(filled[-1])
+
+            if buffer.size:
+                previous_byte = buffer[-1]
+            position += buffer.size
+
+    # A final record without a trailing newline still counts
+    if record_has_data:
+        if header_end is None:
+            header_end = position
+        elif (record_count - 1) % chunk_size == 0:
+            page_offsets.append(np.array([record_start]))
+        record_count += 1
+
+    offsets = np.concatenate(page_offsets) if page_offsets else np.empty(0, dtype = np.int64)
+    return {
+        "offsets": offsets.astype(np.int64),
+        "n_rows": max(record_count - 1, 0),
+        "header_end": header_end or 0,
+    }
+
+
+# Keep the index files bounded by dropping the least recently used ones
+def _prune_indexes():
+    stored = [os.path.join(cache_dir, name) for name in os.listdir(cache_dir) if name.endswith(".npz") and ".tmp" not in name]
+    if len(stored) > max_index_files:
+        stored.sort(key = os.path.getmtime)
+        for file_path in stored[:len(stored) - max_index_files]:
+            try:
+                os.remove(file_path)
+            except OSError:
+                pass
+
+
+# Fetch the page index from memory, then disk, and only build it when neither has it
+def load_page_index(source, chunk_size):
+    file_hash = content_hash(source)
+    memo_key = (file_hash, chunk_size)
+    if memo_key in _index_memo:
+        return _index_memo[memo_key]
+
+    index_path = os.path.join(cache_dir, f"{file_hash}_{chunk_size}.npz")
+    if os.path.exists(index_path):
+        with np.load(index_path) as stored:
+            page_index = {
+                "offsets": stored["offsets"],
+                "n_rows": int(stored["n_rows"]),
+                "header_end": int(stored["header_end"]),
+            }
+        # Mark the index as recently used for pruning
+        os.utime(index_path)
+    else:
+        page_index = build_page_index(source, chunk_size)
+        os.makedirs(cache_dir, exist_ok = True)
+        temp_path = index_path + ".tmp.npz"
+        np.savez(temp_path, **page_index)
+        os.replace(temp_path, index_path)
+        _prune_indexes()
+
+    _index_memo[memo_key] = page_index
+    return page_index
+
+
+# Read one page with a seek plus a single chunk parse
+def read_page(source, chunk_size, page_number):
+    page_index = load_page_index(source, chunk_size)
+    if page_number < 0 or page_number >= len(page_index["offsets"]):
+        return None
+
+    with _open_source(source) as stream:
+        header = stream.read(page_index["header_end"])
+        columns = pd.read_csv(io.BytesIO(header), nrows = 0).columns
+        stream.seek(int(page_index["offsets"][page_number]))
+        chunk = pd.read_csv(stream, header = None, names = columns, nrows = chunk_size)
+
+    # Keep the row labels pandas would have given this chunk
+    start_row = page_number * chunk_size
+    chunk.index = pd.RangeIndex(start_row, start_row + len(chunk))
+    return chunk
@@ -0,0 +1,141 @@
+import bisect
+import contextlib
+import functools
+import os
+import threading
+import time
+from collections import deque
+
+# Set PERF_METRICS=1 to time the hot stages of the app, batch scoring and the
+# HTTP service. Off by default: a disabled span is a shared empty context
+# manager and a disabled timed() leaves the function undecorated.
+enabled = os.environ.get("PERF_METRICS", "") not in ("", "0")
+
+# Upper bounds in seconds of the histogram buckets, the le labels in Prometheus
+buckets = [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+
+# Latest timings kept per stage for the rolling percentiles and rates
+window_size = 1000
+rate_seconds = 60
+
+# Prometheus text file the app refreshes, e.g. for node_exporter's textfile collector
+metrics_path = "data/cache/metrics.prom"
+export_seconds = 15
+metric_name = "incomegauge_stage_seconds"
+
+_stages = {}
+_lock = threading.Lock()
+_last_export = 0.0
+_off = contextlib.nullcontext()
+
+
+def _new_stage():
+    return {"count": 0, "sum": 0.0, "max": 0.0, "buckets": [0] * (len(buckets) + 1),
+            "recent": deque(maxlen = window_size)}
+
+
+# Add one timing of a stage, e.g. one measured elsewhere
+def record(stage, seconds):
+    if not enabled:
+        return
+    now = time.time()
+    with _lock:
+        timings = _stages.get(stage)
+        if timings is None:
+            timings = _stages[stage] = _new_stage()
+        timings["count"] += 1
+        timings["sum"] += seconds
+        timings["max"] = max(timings["max"], seconds)
+        timings["buckets"][bisect.bisect_left(buckets, seconds)] += 1
+        timings["recent"].append((now, seconds))
+
+
+@contextlib.contextmanager
+def _timed_span(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+
+
+# Time the block under the given stage:  with perf_metrics.span("predict_proba"): ...
+def span(stage):
+    return _timed_span(stage) if enabled else _off
+
+
+# Time every call of the decorated function under the given stage
+def timed(stage):
+    def decorate(function):
+        if not enabled:
+            return function
+
+        @functools.wraps(function)
+        def timed_function(*args, **kwargs):
+            with _timed_span(stage):
+                return function(*args, **kwargs)
+
+        return timed_function
+    return decorate
+
+
+def reset():
+    with _lock:
+        _stages.clear()
+
+
+def _percentile(ordered, fraction):
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+# Per stage: totals since start, and percentiles and calls a minute over the latest timings
+def snapshot():
+    now = time.time()
+    with _lock:
+        stages = {stage: (timings["count"], timings["sum"], timings["max"], list(timings["recent"]))
+                  for stage, timings in _stages.items()}
+    rows = []
+    for stage, (count, total, longest, recent) in sorted(stages.items()):
+        ordered = sorted(seconds for _, seconds in recent)
+        rows.append({"stage": stage, "count": count, "total_s": total, "mean_ms": total / count * 1000,
+                     "p50_ms": _percentile(ordered, 0.5) * 1000, "p95_ms": _percentile(ordered, 0.95) * 1000,
+                     "max_ms": longest * 1000,
+                     "per_minute": sum(1 for at, _ in recent if now - at <= rate_seconds) * 60 / rate_seconds})
+    return rows
+
+
+# Bucket counts of one stage, not cumulative, keyed by their upper bound
+def histogram(stage):
+    with _lock:
+        counts = list(_stages[stage]["buckets"]) if stage in _stages else [0] * (len(buckets) + 1)
+    return dict(zip([str(bound) for bound in buckets] + ["+Inf"], counts))
+
+
+# Every stage as a Prometheus histogram, in the text exposition format
+def prometheus_text():
+    with _lock:
+        stages = {stage: (timings["count"], timings["sum"], list(timings["buckets"])) for stage, timings in _stages.items()}
+    lines = [f"# HELP {metric_name} Time spent in each stage of the app.", f"# TYPE {metric_name} histogram"]
+    for stage, (count, total, counts) in sorted(stages.items()):
+        cumulative = 0
+        for bound, bucket_count in zip([repr(bound) for bound in buckets] + ["+Inf"], counts):
+            cumulative += bucket_count
+            lines.append(f'{metric_name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+        lines.append(f'{metric_name}_sum{{stage="{stage}"}} {total!r}')
+        lines.append(f'{metric_name}_count{{stage="{stage}"}} {count}')
+    return "\n".join(lines) + "\n"
+
+
+# Rewrite the Prometheus text file, at most once every export_seconds unless forced
+def export(file_path = None, force = False):
+    global _last_export
+    if not enabled or (not force and time.monotonic() - _last_export < export_seconds):
+        return False
+    _last_export = time.monotonic()
+    file_path = file_path or metrics_path
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok = True)
+    temp_path = f"{file_path}.{threading.get_ident()}.tmp"
+    with open(temp_path, "w") as f:
+        f.write(prometheus_text())
+    os.replace(temp_path, file_path)
+    return True
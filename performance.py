@@ -0,0 +1,47 @@
+import pandas as pd
+import streamlit as st
+import perf_metrics
+import model_registry
+import scoring
+
+
+def show_performance():
+    st.markdown("<h1 style='color: lightblue;'>⏱️ Performance</h1>", unsafe_allow_html = True)
+
+    if not perf_metrics.enabled:
+        st.info("Stage timings are off. Start the app with `PERF_METRICS=1 streamlit run app.py` to collect them.")
+        return
+
+    # Timings of this server process since it started, or since the last reset
+    stages = perf_metrics.snapshot()
+    if st.sidebar.button("Reset timings", key = "reset_perf_metrics"):
+        perf_metrics.reset()
+        stages = []
+
+    if not stages:
+        st.warning("No stage has been timed yet.")
+        return
+
+    st.write("#### Stages")
+    st.caption(f"Percentiles are over the latest {perf_metrics.window_size:,} timings of each stage; "
+               f"calls a minute over the last {perf_metrics.rate_seconds} seconds.")
+    st.dataframe(pd.DataFrame(stages).set_index("stage").round(2), use_container_width = True)
+
+    # Distribution of one stage over the histogram buckets
+    stage = st.selectbox("Stage", [row["stage"] for row in stages], key = "perf_stage")
+    histogram = pd.Series(perf_metrics.histogram(stage), name = "calls")
+    histogram.index = [f"≤ {bound} s" if bound != "+Inf" else f"> {perf_metrics.buckets[-1]} s" for bound in histogram.index]
+    st.bar_chart(histogram)
+
+    left, right = st.columns(2)
+    with left:
+        st.write("#### Single prediction cache")
+        st.write(scoring.single_prediction_stats())
+    with right:
+        st.write("#### Model loads")
+        st.dataframe(pd.DataFrame(model_registry.load_timings()), use_container_width = True)
+
+    with st.expander("Prometheus text"):
+        text = perf_metrics.prometheus_text()
+        st.code(text, language = "text")
+        st.download_button("Download metrics", text, file_name = "metrics.prom", mime = "text/plain")
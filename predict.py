@@ -1,21 +1,29 @@
 import streamlit as st
-import pandas as pd
-import numpy as np
 import datetime
-import joblib
-import os
+import time
+import bulk_runs
+import history_store
+import model_registry
+import schema
+import scoring
 
 def show_predictions():
+    # Fetch a model from the registry, which the app preloads in the background;
+    # the spinner only shows if it is not in memory yet
+    def load_model(model_name):
+        if model_registry.is_loaded(model_name):
+            return scoring.load_model(model_name)
+        with st.spinner(f"{model_name} Model Loading"):
+            return scoring.load_model(model_name)
+
     # Load XGBoost model and threshold
-    @st.cache_resource(show_spinner = "XGBoost Model Loading")
     def load_xgboost_model():
-        model = joblib.load("models/xgboost_model.joblib")
+        model = load_model("XGBoost")
         return model
 
     # Load Random Forest model and threshold
-    @st.cache_resource(show_spinner = "Random Forest Model Loading")
     def load_random_forest_model():
-        model = joblib.load("models/random_forest_model.joblib")
+        model = load_model("Random Forest")
         return model
 
     def select_model():
@@ -32,7 +40,7 @@ def show_predictions():
             pipeline = load_random_forest_model()
 
         if pipeline:
-            encoder = joblib.load("models/encoder.joblib")
+            encoder = scoring.load_encoder()
         else:
             encoder = None
 
@@ -46,38 +54,18 @@ def show_predictions():
 
     # Function to make a single prediction
     def make_single_prediction(pipeline, encoder):
-        data = [[st.session_state["ID"], st.session_state["age"], st.session_state["gender"], st.session_state["education"],
-                st.session_state["marital_status"], st.session_state["race"], st.session_state["is_hispanic"],
-                st.session_state["employment_commitment"], st.session_state["employment_stat"], st.session_state["wage_per_hour"],
-                st.session_state["working_week_per_year"], st.session_state["industry_code"], st.session_state["industry_code_main"],
-                st.session_state["occupation_code"], st.session_state["total_employed"], st.session_state["household_stat"],
-                st.session_state["household_summary"], st.session_state["vet_benefit"], st.session_state["tax_status"],
-                st.session_state["gains"], st.session_state["losses"], st.session_state["stocks_status"], st.session_state["citizenship"],
-                st.session_state["mig_year"], st.session_state["country_of_birth_own"], st.session_state["country_of_birth_father"],
-                st.session_state["country_of_birth_mother"], st.session_state["importance_of_record"]]]
-
-        columns = ["ID", "age", "gender", "education", "marital_status", "race", "is_hispanic", "employment_commitment",
-                "employment_stat", "wage_per_hour", "working_week_per_year", "industry_code", "industry_code_main",
-                "occupation_code", "total_employed", "household_stat", "household_summary", "vet_benefit", "tax_status",
-                "gains", "losses", "stocks_status", "citizenship", "mig_year", "country_of_birth_own", "country_of_birth_father",
-                "country_of_birth_mother", "importance_of_record"]
-
-        df = pd.DataFrame(data, columns=columns)
-
-        probability = pipeline.predict_proba(df.drop(columns = ["ID"]))
-        pred = (probability[:, 1] >= 0.5).astype(int)
-        pred = int(pred[0])
-        prediction = encoder.inverse_transform([pred])[0]
+        model_name = st.session_state["selected_model"]
+        values = {feature: st.session_state[feature] for feature in schema.expected_features}
+        probability, prediction = scoring.predict_single(pipeline, encoder, values,
+                                                         (model_name, model_registry.current_version(model_name)))
 
         # Save the prediction history
-        now = datetime.datetime.now()
-        history_df = df.copy()
-        history_df.insert(1, "Prediction_Date", now.date())
-        history_df.insert(2, "Prediction_Time", now.strftime("%H:%M"))
-        history_df["Model_used"] = st.session_state["selected_model"]
-        history_df["income_above_limit"] = prediction
-        history_df["Probability"] = np.where(pred == 0, np.round(probability[:, 0] * 100, 2), np.round(probability[:, 1] * 100, 2))
-        history_df.to_csv("./data/history.csv", mode = "a", header = not os.path.exists("./data/history.csv"), index = False)
+        with scoring.timed_stage("history"):
+            now = datetime.datetime.now()
+            pred = int(probability[0, 1] >= 0.5)
+            history_row = ([values["ID"], now.date().isoformat(), now.strftime("%H:%M")] + [values[feature] for feature in schema.model_features]
+                           + [model_name, prediction, round(float(probability[0, pred]) * 100, 2)])
+            history_store.submit_prediction(history_row)
 
         st.session_state["probability"] = probability
         st.session_state["prediction"] = prediction
@@ -92,85 +80,39 @@ def show_predictions():
             col1, col2, col3, col4 = st.columns(4)
 
             with col1:
-                st.selectbox("Gender", options = ["Female", "Male"], key = "gender")
+                st.selectbox("Gender", options = schema.category_options["gender"], key = "gender")
 
                 st.number_input("Age", min_value = 0, key = "age")
 
-                st.selectbox("Citizenship", options = [
-                    "Native", "Foreign born- Not a citizen of U S", "Foreign born- U S citizen by naturalization", "Native- Born abroad of American Parent(s)",
-                    "Native- Born in Puerto Rico or U S Outlying"], key = "citizenship")
+                st.selectbox("Citizenship", options = schema.category_options["citizenship"], key = "citizenship")
                
-                st.selectbox("Marital Status", options = [
-                    "Widowed", "Never married", "Married-civilian spouse present", "Divorced", "Married-spouse absent",
-                    "Separated", "Married-A F spouse present"], key = "marital_status")
+                st.selectbox("Marital Status", options = schema.category_options["marital_status"], key = "marital_status")
                 
-                st.selectbox("Race", options = [
-                    "White", "Black", "Asian or Pacific Islander", "Amer Indian Aleut or Eskimo", "Other"], key = "race")
+                st.selectbox("Race", options = schema.category_options["race"], key = "race")
                 
-                st.selectbox("Hispanic ethnicity", options = [
-                    "All other", "Mexican-American", "Central or South American", "Mexican (Mexicano)", "Puerto Rican", "Other Spanish",
-                    "Cuban", "Do not know", "Chicano"], key = "is_hispanic")
+                st.selectbox("Hispanic ethnicity", options = schema.category_options["is_hispanic"], key = "is_hispanic")
                 
-                st.selectbox("Employment Commitment", options = [
-                    "Not in labor force", "Children or Armed Forces", "Full-time schedules", "PT for econ reasons usually PT",
-                    "Unemployed full-time", "PT for non-econ reasons usually FT", "PT for econ reasons usually FT", "Unemployed part- time"], key = "employment_commitment")
+                st.selectbox("Employment Commitment", options = schema.category_options["employment_commitment"], key = "employment_commitment")
                                 
             with col2:
                 st.number_input("Employment Status", min_value = 0, max_value = 2, key = "employment_stat")
 
-                st.selectbox("Education Level", options = [
-                    "High school graduate", "12th grade no diploma", "Children", "Bachelors degree(BA AB BS)", "7th and 8th grade",
-                    "11th grade", "9th grade", "Masters degree(MA MS MEng MEd MSW MBA)", "10th grade", "Associates degree-academic program",
-                    "1st 2nd 3rd or 4th grade", "Some college but no degree", "Less than 1st grade", "Associates degree-occup /vocational",
-                    "Prof school degree (MD DDS DVM LLB JD)", "5th or 6th grade", "Doctorate degree(PhD EdD)"], key = "education")
+                st.selectbox("Education Level", options = schema.category_options["education"], key = "education")
 
-                st.selectbox("Household Summary", options = [
-                    "Householder", "Child 18 or older", "Child under 18 never married", "Spouse of householder", "Nonrelative of householder",
-                    "Other relative of householder", "Group Quarters- Secondary individual", "Child under 18 ever married"], key = "household_summary")
+                st.selectbox("Household Summary", options = schema.category_options["household_summary"], key = "household_summary")
                
-                st.selectbox("Industry Code Main", options = [
-                    "Not in universe or children", "Hospital services", "Retail trade", "Finance insurance and real estate", "Manufacturing-nondurable goods",
-                    "Transportation", "Business and repair services", "Medical except hospital", "Education","Construction",
-                    "Manufacturing-durable goods", "Public administration", "Agriculture", "Other professional services", "Mining",
-                    "Utilities and sanitary services", "Private household services", "Personal services except private HH",
-                    "Wholesale trade", "Communications", "Entertainment", "Social services", "Forestry and fisheries", "Armed Forces"], key = "industry_code_main")
+                st.selectbox("Industry Code Main", options = schema.category_options["industry_code_main"], key = "industry_code_main")
                 
-                st.selectbox("Country of Birth", options = [
-                    "US", "El-Salvador", "Mexico", "Philippines", "Cambodia", "China", "Hungary", "Puerto-Rico", "England", "Dominican-Republic",
-                    "Japan", "Canada", "Ecuador", "Italy", "Cuba", "Peru", "Taiwan", "South Korea", "Poland", "Nicaragua", "Germany", "Guatemala",
-                    "India", "Ireland", "Honduras", "France", "Trinadad&Tobago", "Thailand", "Iran", "Vietnam", "Portugal", "Laos", "Panama",
-                    "Scotland", "Columbia", "Jamaica", "Greece", "Haiti", "Yugoslavia", "Outlying-U S (Guam USVI etc)", "Holand-Netherlands",
-                    "Hong Kong"], key = "country_of_birth_own")
+                st.selectbox("Country of Birth", options = schema.category_options["country_of_birth_own"], key = "country_of_birth_own")
                 
-                st.selectbox("Father's Country of Birth", options = [
-                    "US", "India", "Poland", "Germany", "El-Salvador", "Mexico", "Puerto-Rico", "Philippines", "Greece", "Canada", "Ireland",
-                    "Cambodia", "Ecuador", "China", "Hungary", "Dominican-Republic", "Japan", "Italy", "Cuba", "Peru", "Jamaica",
-                    "South Korea", "Yugoslavia", "Nicaragua", "Columbia", "Guatemala", "France", "England", "Iran", "Honduras", "Haiti",
-                    "Trinadad&Tobago", "Outlying-U S (Guam USVI etc)", "Thailand", "Vietnam", "Hong Kong", "Portugal", "Laos", "Scotland", "Taiwan",
-                    "Holand-Netherlands", "Panama"], key = "country_of_birth_father")
+                st.selectbox("Father's Country of Birth", options = schema.category_options["country_of_birth_father"], key = "country_of_birth_father")
                 
-                st.selectbox("Mother's Country of Birth", options = [
-                    "US", "India", "Peru", "Germany", "El-Salvador", "Mexico", "Puerto-Rico", "Philippines", "Canada", "France", "Cambodia",
-                    "Italy", "Ecuador", "China", "Hungary", "Dominican-Republic", "Japan", "England", "Cuba", "Poland", "South Korea", "Yugoslavia",
-                    "Scotland", "Nicaragua", "Guatemala", "Holand-Netherlands", "Greece", "Ireland", "Honduras", "Haiti", "Outlying-U S (Guam USVI etc)",
-                    "Trinadad&Tobago", "Thailand", "Jamaica", "Iran", "Vietnam", "Columbia", "Portugal", "Laos", "Taiwan", "Hong Kong", "Panama"], key = "country_of_birth_mother")
+                st.selectbox("Mother's Country of Birth", options = schema.category_options["country_of_birth_mother"], key = "country_of_birth_mother")
                                        
             with col3:
-                st.selectbox("Household Status", options = [
-                    "Householder", "Nonfamily householder", "Child 18+ never marr Not in a subfamily", "Child <18 never marr not in subfamily",
-                    "Spouse of householder", "Child 18+ spouse of subfamily RP", "Secondary individual", "Child 18+ never marr RP of subfamily",
-                    "Other Rel 18+ spouse of subfamily RP", "Grandchild <18 never marr not in subfamily", "Other Rel <18 never marr child of subfamily RP",
-                    "Other Rel 18+ ever marr RP of subfamily", "Other Rel 18+ ever marr not in subfamily", "Child 18+ ever marr Not in a subfamily", "RP of unrelated subfamily",
-                    "Child 18+ ever marr RP of subfamily", "Other Rel 18+ never marr not in subfamily", "Child under 18 of RP of unrel subfamily",
-                    "Grandchild <18 never marr child of subfamily RP", "Grandchild 18+ never marr not in subfamily", "Other Rel <18 never marr not in subfamily",
-                    "In group quarters", "Grandchild 18+ ever marr not in subfamily", "Other Rel 18+ never marr RP of subfamily", "Child <18 never marr RP of subfamily",
-                    "Grandchild 18+ never marr RP of subfamily", "Spouse of RP of unrelated subfamily", "Grandchild 18+ ever marr RP of subfamily",
-                    "Child <18 ever marr not in subfamily", "Child <18 ever marr RP of subfamily", "Other Rel <18 ever marr RP of subfamily",
-                    "Grandchild 18+ spouse of subfamily RP", "Child <18 spouse of subfamily RP", "Other Rel <18 ever marr not in subfamily", "Other Rel <18 never married RP of subfamily",
-                    "Other Rel <18 spouse of subfamily RP", "Grandchild <18 ever marr not in subfamily", "Grandchild <18 never marr RP of subfamily"], key = "household_stat")
+                st.selectbox("Household Status", options = schema.category_options["household_stat"], key = "household_stat")
                 
-                st.selectbox("Tax Status", options = [
-                    "Head of household", "Single", "Nonfiler", "Joint both 65+", "Joint both under 65", "Joint one under 65 & one 65+"], key = "tax_status")
+                st.selectbox("Tax Status", options = schema.category_options["tax_status"], key = "tax_status")
                 
                 st.number_input("Wage per Hour", min_value = 0, key = "wage_per_hour")
 
@@ -203,22 +145,8 @@ def show_predictions():
                 make_single_prediction(pipeline, encoder)
 
 
-    # Bulk prediction function
-    def bulk_prediction(model, df, encoder):
-        prob_score = model.predict_proba(df.drop(columns = ["ID"]))
-        bulk_pred = (prob_score[:, 1] >= 0.5).astype(int)
-        bulk_prediction = encoder.inverse_transform(bulk_pred)
-        return bulk_prediction, prob_score
-
     # Function for bulk prediction
     def make_bulk_prediction(df, is_uploaded_data, encoder):
-        expected_features = [
-            "ID", "age", "gender", "education", "marital_status", "race", "is_hispanic", "employment_commitment", "employment_stat", "wage_per_hour",
-            "working_week_per_year", "industry_code", "industry_code_main", "occupation_code", "total_employed", "household_stat",
-            "household_summary", "vet_benefit", "tax_status", "gains", "losses", "stocks_status", "citizenship", "mig_year", "country_of_birth_own",
-            "country_of_birth_father", "country_of_birth_mother", "importance_of_record"
-        ]
-
         # Option to use previously uploaded data
         if st.checkbox("Use previously uploaded data"):
             if "uploaded_data" in st.session_state:
@@ -228,23 +156,53 @@ def show_predictions():
             else:
                 st.warning("No data found in the session. Please upload a file first.")
 
+        # Each bulk run is stored as its own partition of the dataset's results
+        dataset = "uploaded" if is_uploaded_data else "inbuilt"
+
+        # Option to score the whole uploaded file chunk by chunk rather than the page held in session
+        stream_whole_file = False
+        if "uploaded_file" in st.session_state:
+            stream_whole_file = st.checkbox("Score the entire uploaded file (streaming)", key = "stream_whole_file")
+            if stream_whole_file:
+                chunk_size = st.slider("Rows per chunk", 10000, 200000, 50000, step = 10000, key = "stream_chunk_size")
+
+        # Number of threads the scoring is sharded across
+        workers = st.number_input("Scoring workers", min_value = 1, max_value = scoring.default_workers,
+                                  value = scoring.default_workers, key = "scoring_workers")
+
         if st.button("Make Bulk Prediction"):
-            if all(feature in df.columns for feature in expected_features):
+            if stream_whole_file:
+                model = load_xgboost_model()
+                progress_bar = st.progress(0.0, text = "Scoring uploaded file...")
+
+                # Update the progress bar with rows scored and throughput after each chunk
+                def show_progress(rows_done, total_rows, elapsed):
+                    progress_bar.progress(min(rows_done / max(total_rows, 1), 1.0),
+                                          text = f"{rows_done:,} of {total_rows:,} rows scored ({rows_done / max(elapsed, 1e-9):,.0f} rows/sec)")
+
+                try:
+                    run = bulk_runs.stream_run(dataset, st.session_state["uploaded_file"], model, encoder, chunk_size,
+                                               progress = show_progress, workers = workers)
+                    if run is None:
+                        st.warning("The uploaded file has no rows to score.")
+                    else:
+                        st.success(f"Bulk Predictions made successfully. {run['rows']:,} rows scored in {run['seconds']:.1f}s.")
+                except ValueError as e:
+                    st.error(str(e))
+
+            elif all(feature in df.columns for feature in schema.expected_features):
                 # Load model
                 model = load_xgboost_model()
 
                 if model is not None:
-                    bulk_predict, probability_score = bulk_prediction(model, df, encoder)
-
-                    # Add relevant information and save to file
-                    bulk_history_df = df.copy()
-                    now = datetime.datetime.now()
-                    bulk_history_df.insert(1, "Prediction_Date", now.date())
-                    bulk_history_df["Model_used"] = "Gradient Boost Classifier"
-                    bulk_history_df["income_above_limit"] = bulk_predict
-                    bulk_history_df["Probability"] = np.where(bulk_predict == 0, np.round(probability_score[:, 0] * 100, 2), np.round(probability_score[:, 1] * 100, 2))
-                    history_file = "./data/uploaded_data_history.csv" if is_uploaded_data else "./data/inbuilt_data_history.csv"
-                    bulk_history_df.to_csv(history_file, mode = "w", header = True, index = False)
+                    start = time.perf_counter()
+                    bulk_predict, probability_score = scoring.bulk_prediction(model, df, encoder, workers)
+
+                    # Add relevant information and save as a new run
+                    bulk_history_df = scoring.add_prediction_columns(df, bulk_predict, probability_score,
+                                                                     scoring.bulk_model_name, datetime.datetime.now().date())
+                    bulk_runs.save_run(dataset, bulk_history_df, scoring.bulk_model_name, time.perf_counter() - start,
+                                       getattr(st.session_state.get("uploaded_file"), "name", None) if is_uploaded_data else None)
 
                     st.success("Bulk Predictions made successfully.")
                 else:
@@ -252,12 +210,11 @@ def show_predictions():
             else:
                 st.error("Uploaded data does not match expected features.")
 
-        # Button to preview prediction history
+        # Button to preview the latest run, reading only the start of its partition
         if st.button("Preview Prediction"):
-            history_file = "./data/uploaded_data_history.csv" if is_uploaded_data else "./data/inbuilt_data_history.csv"
-            if os.path.exists(history_file):
-                history_df = pd.read_csv(history_file)
-                st.dataframe(history_df.head())
+            run = bulk_runs.latest_run(dataset)
+            if run is not None:
+                st.dataframe(bulk_runs.read_run_head(dataset, run, 5))
             else:
                 st.warning("### No prediction history found")
 
@@ -283,6 +240,14 @@ def show_predictions():
             elif prediction == "Above limit":
                 st.sidebar.success(f"### The individual is unlikely to receive an income above the threshold.\nProbability: {probability[0][0] * 100:.2f}%")
 
+            # Cache hit rate and mean latency of each stage of the single predictions made in this process
+            stats = scoring.single_prediction_stats()
+            if stats["hits"] + stats["misses"]:
+                with st.sidebar.expander("Prediction performance"):
+                    st.write(f"Cache hit rate: {stats['hit_rate']:.0%} ({stats['hits']} of {stats['hits'] + stats['misses']})")
+                    for stage, timing in stats["stages"].items():
+                        st.write(f"{stage}: {timing['mean_ms']:.2f} ms")
+
         elif prediction_type == "Bulk Prediction":
             # Assume the uploaded data is stored in session state
             if "uploaded_data" in st.session_state:
@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+
+
+# Pairwise statistics of the numeric columns of a stream of frames, from which
+# the correlation matrix is read in O(k^2) however many rows went in. Like
+# DataFrame.corr(), each pair of columns only counts the rows where both are
+# present. Per pair it keeps the row count, the mean of each column, the sum
+# of squared deviations of each column and the sum of co-deviations; chunks
+# and accumulators are combined with Chan et al.'s parallel update, which
+# avoids the cancellation of raw sums of squares.
+class CorrelationAccumulator:
+    def __init__(self, columns = None):
+        self.columns = [] if columns is None else list(columns)
+        k = len(self.columns)
+        self.count = np.zeros((k, k))
+        self.mean = np.zeros((k, k))
+        self.squares = np.zeros((k, k))
+        self.comoments = np.zeros((k, k))
+
+    # Add a chunk of rows; its numeric columns not seen before are added too
+    def update(self, df):
+        numeric = df.select_dtypes(include = ["number"])
+        if numeric.shape[1] == 0:
+            return self
+        values = numeric.to_numpy(dtype = np.float64, na_value = np.nan)
+        present = ~np.isnan(values)
+
+        # Centre on the chunk means first so the sums below stay small
+        filled = np.where(present, values, 0.0)
+        centre = filled.sum(axis = 0) / np.maximum(present.sum(axis = 0), 1)
+        deviations = np.where(present, filled - centre, 0.0)
+        mask = present.astype(np.float64)
+
+        chunk = CorrelationAccumulator(numeric.columns)
+        chunk.count = mask.T @ mask
+        sums = deviations.T @ mask
+        with np.errstate(invalid = "ignore", divide = "ignore"):
+            pair_mean = np.where(chunk.count > 0, sums / chunk.count, 0.0)
+        chunk.mean = pair_mean + centre[:, None]
+        chunk.squares = (deviations ** 2).T @ mask - sums * pair_mean
+        chunk.comoments = deviations.T @ deviations - sums * pair_mean.T
+        return self.merge(chunk)
+
+    # Statistics over the union of columns, zero for pairs never seen
+    def _aligned(self, columns):
+        positions = [self.columns.index(column) if column in self.columns else -1 for column in columns]
+        aligned = CorrelationAccumulator(columns)
+        index = np.array(positions)
+        known = index >= 0
+        rows, cols = np.ix_(known, known)
+        for name in ["count", "mean", "squares", "comoments"]:
+            getattr(aligned, name)[rows, cols] = getattr(self, name)[np.ix_(index[known], index[known])]
+        return aligned
+
+    # Combine with another accumulator, in place
+    def merge(self, other):
+        columns = self.columns + [column for column in other.columns if column not in self.columns]
+        a = self if columns == self.columns else self._aligned(columns)
+        b = other if columns == other.columns else other._aligned(columns)
+
+        count = a.count + b.count
+        with np.errstate(invalid = "ignore", divide = "ignore"):
+            weight = np.where(count > 0, b.count / count, 0.0)
+            cross = np.where(count > 0, a.count * b.count / count, 0.0)
+        delta = b.mean - a.mean
+        self.columns = columns
+        self.mean = a.mean + delta * weight
+        self.squares = a.squares + b.squares + delta ** 2 * cross
+        self.comoments = a.comoments + b.comoments + delta * delta.T * cross
+        self.count = count
+        return self
+
+    # Pearson correlation of every pair of columns, NaN where a pair has no
+    # rows or a column does not vary, as DataFrame.corr() gives
+    def corr(self):
+        with np.errstate(invalid = "ignore", divide = "ignore"):
+            divisor = np.sqrt(self.squares * self.squares.T)
+            corr = np.where((self.count > 0) & (divisor > 0), self.comoments / divisor, np.nan)
+        return pd.DataFrame(np.clip(corr, -1, 1), index = self.columns, columns = self.columns)
+
+    def save(self, file_path):
+        with open(file_path, "wb") as f:
+            np.savez(f, columns = np.array(self.columns, dtype = str), count = self.count, mean = self.mean,
+                     squares = self.squares, comoments = self.comoments)
+
+    @classmethod
+    def load(cls, file_path):
+        with np.load(file_path) as data:
+            accumulator = cls(data["columns"].tolist())
+            for name in ["count", "mean", "squares", "comoments"]:
+                setattr(accumulator, name, data[name])
+        return accumulator
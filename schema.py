@@ -0,0 +1,184 @@
+import numpy as np
+import pandas as pd
+import perf_metrics
+
+# Raw census columns the models were not trained on
+columns_to_drop = ["class", "education_institute", "unemployment_reason", "is_labor_union",
+                   "occupation_code_main", "under_18_family", "veterans_admin_questionnaire",
+                   "migration_code_change_in_msa", "migration_prev_sunbelt",
+                   "migration_code_move_within_reg", "migration_code_change_in_reg",
+                   "residence_1_year_ago", "old_residence_reg", "old_residence_state"]
+
+# Features the models expect, in pipeline order
+expected_features = [
+    "ID", "age", "gender", "education", "marital_status", "race", "is_hispanic", "employment_commitment", "employment_stat", "wage_per_hour",
+    "working_week_per_year", "industry_code", "industry_code_main", "occupation_code", "total_employed", "household_stat",
+    "household_summary", "vet_benefit", "tax_status", "gains", "losses", "stocks_status", "citizenship", "mig_year", "country_of_birth_own",
+    "country_of_birth_father", "country_of_birth_mother", "importance_of_record"
+]
+
+# Columns the pipelines take, in order: every expected feature except ID
+model_features = [feature for feature in expected_features if feature != "ID"]
+
+# Known category values; also the options of the single prediction entry form
+category_options = {
+    "gender": [
+        "Female", "Male"],
+    "education": [
+        "High school graduate", "12th grade no diploma", "Children", "Bachelors degree(BA AB BS)", "7th and 8th grade",
+        "11th grade", "9th grade", "Masters degree(MA MS MEng MEd MSW MBA)", "10th grade", "Associates degree-academic program",
+        "1st 2nd 3rd or 4th grade", "Some college but no degree", "Less than 1st grade", "Associates degree-occup /vocational",
+        "Prof school degree (MD DDS DVM LLB JD)", "5th or 6th grade", "Doctorate degree(PhD EdD)"],
+    "marital_status": [
+        "Widowed", "Never married", "Married-civilian spouse present", "Divorced", "Married-spouse absent", "Separated",
+        "Married-A F spouse present"],
+    "race": [
+        "White", "Black", "Asian or Pacific Islander", "Amer Indian Aleut or Eskimo", "Other"],
+    "is_hispanic": [
+        "All other", "Mexican-American", "Central or South American", "Mexican (Mexicano)", "Puerto Rican", "Other Spanish",
+        "Cuban", "Do not know", "Chicano"],
+    "employment_commitment": [
+        "Not in labor force", "Children or Armed Forces", "Full-time schedules", "PT for econ reasons usually PT",
+        "Unemployed full-time", "PT for non-econ reasons usually FT", "PT for econ reasons usually FT", "Unemployed part- time"],
+    "industry_code_main": [
+        "Not in universe or children", "Hospital services", "Retail trade", "Finance insurance and real estate",
+        "Manufacturing-nondurable goods", "Transportation", "Business and repair services", "Medical except hospital", "Education",
+        "Construction", "Manufacturing-durable goods", "Public administration", "Agriculture", "Other professional services",
+        "Mining", "Utilities and sanitary services", "Private household services", "Personal services except private HH",
+        "Wholesale trade", "Communications", "Entertainment", "Social services", "Forestry and fisheries", "Armed Forces"],
+    "household_stat": [
+        "Householder", "Nonfamily householder", "Child 18+ never marr Not in a subfamily", "Child <18 never marr not in subfamily",
+        "Spouse of householder", "Child 18+ spouse of subfamily RP", "Secondary individual", "Child 18+ never marr RP of subfamily",
+        "Other Rel 18+ spouse of subfamily RP", "Grandchild <18 never marr not in subfamily",
+        "Other Rel <18 never marr child of subfamily RP", "Other Rel 18+ ever marr RP of subfamily",
+        "Other Rel 18+ ever marr not in subfamily", "Child 18+ ever marr Not in a subfamily", "RP of unrelated subfamily",
+        "Child 18+ ever marr RP of subfamily", "Other Rel 18+ never marr not in subfamily",
+        "Child under 18 of RP of unrel subfamily", "Grandchild <18 never marr child of subfamily RP",
+        "Grandchild 18+ never marr not in subfamily", "Other Rel <18 never marr not in subfamily", "In group quarters",
+        "Grandchild 18+ ever marr not in subfamily", "Other Rel 18+ never marr RP of subfamily",
+        "Child <18 never marr RP of subfamily", "Grandchild 18+ never marr RP of subfamily", "Spouse of RP of unrelated subfamily",
+        "Grandchild 18+ ever marr RP of subfamily", "Child <18 ever marr not in subfamily", "Child <18 ever marr RP of subfamily",
+        "Other Rel <18 ever marr RP of subfamily", "Grandchild 18+ spouse of subfamily RP", "Child <18 spouse of subfamily RP",
+        "Other Rel <18 ever marr not in subfamily", "Other Rel <18 never married RP of subfamily",
+        "Other Rel <18 spouse of subfamily RP", "Grandchild <18 ever marr not in subfamily",
+        "Grandchild <18 never marr RP of subfamily"],
+    "household_summary": [
+        "Householder", "Child 18 or older", "Child under 18 never married", "Spouse of householder", "Nonrelative of householder",
+        "Other relative of householder", "Group Quarters- Secondary individual", "Child under 18 ever married"],
+    "tax_status": [
+        "Head of household", "Single", "Nonfiler", "Joint both 65+", "Joint both under 65", "Joint one under 65 & one 65+"],
+    "citizenship": [
+        "Native", "Foreign born- Not a citizen of U S", "Foreign born- U S citizen by naturalization",
+        "Native- Born abroad of American Parent(s)", "Native- Born in Puerto Rico or U S Outlying"],
+    "country_of_birth_own": [
+        "US", "El-Salvador", "Mexico", "Philippines", "Cambodia", "China", "Hungary", "Puerto-Rico", "England",
+        "Dominican-Republic", "Japan", "Canada", "Ecuador", "Italy", "Cuba", "Peru", "Taiwan", "South Korea", "Poland", "Nicaragua",
+        "Germany", "Guatemala", "India", "Ireland", "Honduras", "France", "Trinadad&Tobago", "Thailand", "Iran", "Vietnam",
+        "Portugal", "Laos", "Panama", "Scotland", "Columbia", "Jamaica", "Greece", "Haiti", "Yugoslavia",
+        "Outlying-U S (Guam USVI etc)", "Holand-Netherlands", "Hong Kong"],
+    "country_of_birth_father": [
+        "US", "India", "Poland", "Germany", "El-Salvador", "Mexico", "Puerto-Rico", "Philippines", "Greece", "Canada", "Ireland",
+        "Cambodia", "Ecuador", "China", "Hungary", "Dominican-Republic", "Japan", "Italy", "Cuba", "Peru", "Jamaica", "South Korea",
+        "Yugoslavia", "Nicaragua", "Columbia", "Guatemala", "France", "England", "Iran", "Honduras", "Haiti", "Trinadad&Tobago",
+        "Outlying-U S (Guam USVI etc)", "Thailand", "Vietnam", "Hong Kong", "Portugal", "Laos", "Scotland", "Taiwan",
+        "Holand-Netherlands", "Panama"],
+    "country_of_birth_mother": [
+        "US", "India", "Peru", "Germany", "El-Salvador", "Mexico", "Puerto-Rico", "Philippines", "Canada", "France", "Cambodia",
+        "Italy", "Ecuador", "China", "Hungary", "Dominican-Republic", "Japan", "England", "Cuba", "Poland", "South Korea",
+        "Yugoslavia", "Scotland", "Nicaragua", "Guatemala", "Holand-Netherlands", "Greece", "Ireland", "Honduras", "Haiti",
+        "Outlying-U S (Guam USVI etc)", "Trinadad&Tobago", "Thailand", "Jamaica", "Iran", "Vietnam", "Columbia", "Portugal", "Laos",
+        "Taiwan", "Hong Kong", "Panama"],
+}
+
+# Census features that only hold whole numbers
+integer_features = [
+    "age", "employment_stat", "wage_per_hour", "working_week_per_year", "industry_code", "occupation_code",
+    "total_employed", "vet_benefit", "gains", "losses", "stocks_status", "mig_year",
+]
+
+# dtype each numeric feature is cleaned to. It depends on the schema alone, never
+# on the values of a chunk, so every chunk of a file gets the same types and a
+# missing or out-of-range value late in a file cannot change them: float32 holds
+# every value of the int16 census ranges exactly, float64 the wider ones
+numeric_dtypes = {
+    "age": "float32", "employment_stat": "float32", "wage_per_hour": "float32", "working_week_per_year": "float32",
+    "industry_code": "float32", "occupation_code": "float32", "total_employed": "float32", "vet_benefit": "float32",
+    "gains": "float64", "losses": "float32", "stocks_status": "float64", "mig_year": "float32",
+    "importance_of_record": "float64",
+}
+
+
+# Strip whitespace, turn "?" into NaN and fold is_hispanic "NA" into "All other",
+# working on the distinct values only so the cost per row is a single code lookup
+def _clean_labels(values, column):
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes, uniques = values.cat.codes.to_numpy(), values.cat.categories
+    else:
+        codes, uniques = pd.factorize(values)
+
+    labels = pd.Index([label.strip() if isinstance(label, str) else label for label in uniques], dtype = object)
+    labels = labels.where(labels != "?", np.nan)
+    if column == "is_hispanic":
+        labels = labels.where(labels != "NA", "All other")
+    return codes, labels
+
+
+# Categorical with the declared categories first; unseen values are kept as extra categories
+def _clean_categorical(values, column):
+    codes, labels = _clean_labels(values, column)
+    known = category_options[column]
+    known_set = set(known)
+    extras = [label for label in labels.dropna().unique() if label not in known_set]
+    categories = pd.Index(known + extras)
+
+    # Code -1 (missing) picks the trailing -1
+    new_codes = np.append(categories.get_indexer(labels), -1)[codes]
+    return pd.Categorical.from_codes(new_codes, dtype = pd.CategoricalDtype(categories))
+
+
+# Text columns outside the schema (ID, labels) stay object but get the same cleaning
+def _clean_text(values, column):
+    codes, labels = _clean_labels(values, column)
+    return np.append(labels.to_numpy(dtype = object), np.nan)[codes]
+
+
+# Numbers in the declared dtype; text that is not a number becomes NaN
+def _clean_numeric(values, column):
+    if values.dtype == object or isinstance(values.dtype, pd.CategoricalDtype):
+        codes, labels = _clean_labels(values, column)
+        numbers = pd.to_numeric(pd.Series(labels, dtype = object), errors = "coerce").to_numpy(dtype = "float64")
+        values = np.append(numbers, np.nan)[codes]
+    elif pd.api.types.is_extension_array_dtype(values.dtype):
+        values = values.to_numpy(dtype = "float64", na_value = np.nan)
+    else:
+        values = values.to_numpy()
+    return values.astype(numeric_dtypes[column])
+
+
+# Clean a raw census frame or chunk in one pass, returning compact dtypes
+@perf_metrics.timed("clean_columns")
+def clean_columns(data_chunk):
+    cleaned = {}
+    for col in data_chunk.columns:
+        if col in columns_to_drop:
+            continue
+        values = data_chunk[col]
+        if col in category_options:
+            cleaned[col] = _clean_categorical(values, col)
+        elif col in numeric_dtypes:
+            cleaned[col] = _clean_numeric(values, col)
+        elif values.dtype == object or isinstance(values.dtype, pd.CategoricalDtype):
+            cleaned[col] = _clean_text(values, col)
+        else:
+            cleaned[col] = values.to_numpy()
+    return pd.DataFrame(cleaned, index = data_chunk.index)
+
+
+# Frame handed to the pipelines: ID dropped and categoricals back to the object
+# columns the models were fitted on
+def model_input(df):
+    features = df.drop(columns = ["ID"])
+    categorical = features.select_dtypes(include = ["category"]).columns
+    if len(categorical):
+        features = features.astype({col: object for col in categorical})
+    return features
@@ -0,0 +1,307 @@
+import atexit
+import contextlib
+import datetime
+import multiprocessing
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import joblib
+import numpy as np
+import pandas as pd
+import columnar_cache
+import model_registry
+import perf_metrics
+import schema
+import tree_engine
+
+# Command line names of the saved pipelines
+model_choices = {"xgboost": "XGBoost", "random_forest": "Random Forest"}
+
+# Label the bulk history uses for the XGBoost pipeline
+bulk_model_name = "Gradient Boost Classifier"
+
+# Model_used labels for bulk runs of each pipeline
+bulk_model_names = {"XGBoost": bulk_model_name, "Random Forest": "Random Forest Classifier"}
+
+# Default number of scoring workers
+default_workers = os.cpu_count() or 1
+
+# Frames smaller than two shards of this size are scored in the calling thread
+min_shard_rows = 5000
+
+# Saved pipeline ("XGBoost" or "Random Forest"), loaded once through the registry.
+# backend="compiled" returns it compiled by tree_engine, with the same predict_proba.
+def load_model(name, backend = "pipeline"):
+    model = model_registry.get(name)
+    if backend == "compiled":
+        return tree_engine.compile_pipeline(model)
+    return model
+
+
+# Label encoder shared by both pipelines
+def load_encoder():
+    return model_registry.get("encoder")
+
+
+# Single predictions memoized by model and feature values, least recently used evicted first
+single_cache_size = 4096
+_single_cache = OrderedDict()
+_single_lock = threading.Lock()
+_single_stats = {"hits": 0, "misses": 0, "stages": {}}
+# Held weakly, so an evicted model is dropped and a new one at its address is tried afresh
+_uncompiled_models = weakref.WeakSet()
+
+
+def _record_stage(stage, seconds):
+    with _single_lock:
+        count, total = _single_stats["stages"].get(stage, (0, 0.0))
+        _single_stats["stages"][stage] = (count + 1, total + seconds)
+    perf_metrics.record(f"single_prediction_{stage}", seconds)
+
+
+# Time one stage of a single prediction into the running per-stage totals
+@contextlib.contextmanager
+def timed_stage(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record_stage(stage, time.perf_counter() - start)
+
+
+# Cache hit rate and mean milliseconds per stage of single predictions so far
+def single_prediction_stats():
+    with _single_lock:
+        lookups = _single_stats["hits"] + _single_stats["misses"]
+        return {
+            "hits": _single_stats["hits"],
+            "misses": _single_stats["misses"],
+            "hit_rate": _single_stats["hits"] / lookups if lookups else 0.0,
+            "stages": {stage: {"count": count, "mean_ms": total / count * 1000}
+                       for stage, (count, total) in _single_stats["stages"].items()},
+        }
+
+
+# Compiled engine for single rows, or None for pipelines it cannot compile
+def _single_engine(model):
+    if model in _uncompiled_models:
+        return None
+    try:
+        return tree_engine.compile_pipeline(model)
+    except ValueError:
+        _uncompiled_models.add(model)
+        return None
+
+
+# Score one record without building a DataFrame: the form values go straight
+# into a row in the pipeline's column order, which the compiled engine scores
+# as is. Pipelines the engine cannot compile get a one-row frame instead.
+# Results are memoized on (model_key, feature values), where model_key names
+# the model and its version; ID is not a feature, so it is not part of the key. Returns the class probabilities (1 x 2) and
+# the decoded label.
+def predict_single(model, encoder, values, model_key):
+    engine = _single_engine(model)
+    features = (engine.feature_names if engine is not None else None) or schema.model_features
+
+    with timed_stage("build"):
+        row = np.empty((1, len(features)), dtype = object)
+        for position, feature in enumerate(features):
+            row[0, position] = values[feature]
+        key = (model_key, tuple(row[0]))
+
+    with _single_lock:
+        cached = _single_cache.get(key)
+        if cached is not None:
+            _single_cache.move_to_end(key)
+            _single_stats["hits"] += 1
+            return cached
+        _single_stats["misses"] += 1
+
+    with timed_stage("inference"):
+        if engine is not None:
+            probability = engine.predict_proba(row)
+        else:
+            probability = model.predict_proba(pd.DataFrame([list(row[0])], columns = features))
+
+    with timed_stage("decode"):
+        pred = int(probability[0, 1] >= 0.5)
+        result = (probability, encoder.inverse_transform([pred])[0])
+
+    with _single_lock:
+        _single_cache[key] = result
+        if len(_single_cache) > single_cache_size:
+            _single_cache.popitem(last = False)
+    return result
+
+
+# Worker pools kept alive between calls. Thread pools are shared by every model
+# and keyed by worker count, with the model passed on each call. Process pools
+# are keyed by worker count and the registry (name, version) of their model,
+# which each worker loads from its file, so the pool never pins it in memory.
+# Models from outside the registry are sent to the workers instead, under the
+# key None, so at most one of them is held per worker count.
+_thread_pools = {}
+_process_pools = {}
+_pools_lock = threading.Lock()
+
+# Model held by each process-pool worker, received once when the worker starts
+_worker_model = None
+
+
+def _init_worker(model):
+    global _worker_model
+    _worker_model = model
+
+
+def _load_worker(file_path):
+    global _worker_model
+    _worker_model = joblib.load(file_path)
+
+
+def _predict_shard(features):
+    return _worker_model.predict_proba(features)
+
+
+# Thread workers share the model object; process workers each hold one copy
+# from start-up (spawned, since forking after OpenMP has started can deadlock)
+def _get_pool(model, workers, executor):
+    if executor != "process":
+        with _pools_lock:
+            if workers not in _thread_pools:
+                _thread_pools[workers] = ThreadPoolExecutor(max_workers = workers, thread_name_prefix = "scoring")
+            return _thread_pools[workers]
+
+    registry_key = model_registry.key_of(model)
+    key = (workers, registry_key)
+    with _pools_lock:
+        if key in _process_pools:
+            model_ref, pool = _process_pools[key]
+            if model_ref() is model:
+                return pool
+            # Another model under the same key: its workers hold the wrong copy
+            pool.shutdown(wait = False)
+        if registry_key is None:
+            initializer, initargs = _init_worker, (model,)
+        else:
+            initializer, initargs = _load_worker, (model_registry.artifact_paths[registry_key[0]],)
+        pool = ProcessPoolExecutor(max_workers = workers, mp_context = multiprocessing.get_context("spawn"),
+                                   initializer = initializer, initargs = initargs)
+        _process_pools[key] = (weakref.ref(model), pool)
+        return pool
+
+
+# Stop the process pools built around a model the registry has evicted; calls
+# already submitted still finish
+def _drop_model_pools(registry_key):
+    with _pools_lock:
+        for key in [key for key in _process_pools if key[1] == registry_key]:
+            _, pool = _process_pools.pop(key)
+            pool.shutdown(wait = False)
+
+
+model_registry.on_evict(_drop_model_pools)
+
+
+@atexit.register
+def shutdown_pools():
+    with _pools_lock:
+        pools = list(_thread_pools.values()) + [pool for _, pool in _process_pools.values()]
+        for pool in pools:
+            pool.shutdown(wait = False, cancel_futures = True)
+        _thread_pools.clear()
+        _process_pools.clear()
+
+
+# predict_proba sharded across a thread ("thread") or process ("process") pool,
+# with the shard results stacked back in input order
+@perf_metrics.timed("predict_proba")
+def predict_proba(model, features, workers = 1, executor = "thread"):
+    shards = min(workers, len(features) // min_shard_rows)
+    if shards <= 1:
+        return model.predict_proba(features)
+
+    bounds = np.linspace(0, len(features), shards + 1).astype(int)
+    parts = [features.iloc[start:stop] for start, stop in zip(bounds[:-1], bounds[1:])]
+    pool = _get_pool(model, workers, executor)
+    score = _predict_shard if executor == "process" else model.predict_proba
+    return np.vstack(list(pool.map(score, parts)))
+
+
+# Score a cleaned frame, returning decoded labels and class probabilities
+def bulk_prediction(model, df, encoder, workers = 1, executor = "thread"):
+    prob_score = predict_proba(model, schema.model_input(df), workers, executor)
+    bulk_pred = (prob_score[:, 1] >= 0.5).astype(int)
+    with perf_metrics.span("inverse_transform"):
+        bulk_prediction = encoder.inverse_transform(bulk_pred)
+    return bulk_prediction, prob_score
+
+
+# Add the columns saved with every bulk prediction. Re-scoring an earlier
+# output overwrites its prediction columns in place.
+def add_prediction_columns(df, bulk_predict, probability_score, model_name, prediction_date):
+    bulk_history_df = df.drop(columns = ["Prediction_Date"], errors = "ignore")
+    bulk_history_df.insert(1, "Prediction_Date", prediction_date)
+    bulk_history_df["Model_used"] = model_name
+    bulk_history_df["income_above_limit"] = bulk_predict
+    bulk_history_df["Probability"] = np.where(bulk_predict == 0, np.round(probability_score[:, 0] * 100, 2), np.round(probability_score[:, 1] * 100, 2))
+    return bulk_history_df
+
+
+# Clean, validate and score a raw dataset one chunk at a time
+def iter_scored_chunks(source, model, encoder, chunk_size, model_name = bulk_model_name, workers = 1, executor = "thread"):
+    prediction_date = datetime.datetime.now().date()
+    for chunk in columnar_cache.iter_chunks(source, chunk_size):
+        chunk = schema.clean_columns(chunk)
+        if not all(feature in chunk.columns for feature in schema.expected_features):
+            raise ValueError("Uploaded data does not match expected features.")
+        bulk_predict, probability_score = bulk_prediction(model, chunk, encoder, workers, executor)
+        yield add_prediction_columns(chunk, bulk_predict, probability_score, model_name, prediction_date)
+
+
+# Score a whole dataset into output_path (CSV, or Parquet for a .parquet path)
+# with memory bounded by the chunk size. Results go to a temporary file that
+# replaces output_path only once every chunk has been scored.
+# progress(rows_done, total_rows, elapsed) is called after each chunk.
+def stream_bulk_prediction(source, model, encoder, output_path, chunk_size = 50000,
+                           model_name = bulk_model_name, progress = None, workers = 1, executor = "thread"):
+    total_rows = columnar_cache.count_rows(source, chunk_size)
+    temp_path = f"{output_path}.partial"
+    parquet_output = str(output_path).endswith(".parquet")
+    if parquet_output:
+        output_writer = columnar_cache.ChunkWriter(temp_path, strict = True)
+    else:
+        # The Parquet copy for the History page and Dashboard is written alongside
+        cache_writer = columnar_cache.ChunkWriter()
+    rows_done = 0
+    start = time.perf_counter()
+
+    try:
+        for scored in iter_scored_chunks(source, model, encoder, chunk_size, model_name, workers, executor):
+            if parquet_output:
+                output_writer.write(scored)
+            else:
+                scored.to_csv(temp_path, mode = "a" if rows_done else "w", header = not rows_done, index = False)
+                cache_writer.write(scored)
+            rows_done += len(scored)
+            if progress is not None:
+                progress(rows_done, total_rows, time.perf_counter() - start)
+    except BaseException:
+        if parquet_output:
+            output_writer.abort()
+        else:
+            cache_writer.abort()
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        raise
+
+    if parquet_output:
+        output_writer.save(output_path)
+    elif rows_done:
+        os.replace(temp_path, output_path)
+        cache_writer.commit(output_path)
+    else:
+        cache_writer.abort()
+    return rows_done, time.perf_counter() - start
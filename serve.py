@@ -0,0 +1,203 @@
+import argparse
+import json
+import pickle
+import sys
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pandas as pd
+import batch_score
+import model_registry
+import perf_metrics
+import schema
+import scoring
+
+
+# Merges single-row requests that arrive close together into one vectorized
+# predict_proba call. A batch is scored once max_batch_size requests are
+# waiting or max_wait seconds after its first request, whichever comes first.
+class MicroBatcher:
+    def __init__(self, model, encoder, max_batch_size = 64, max_wait = 0.005):
+        self.model = model
+        self.encoder = encoder
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.requests = queue.Queue()
+        self.batches = 0
+        self.rows = 0
+        self.thread = threading.Thread(target = self._run, name = "micro-batcher", daemon = True)
+        self.thread.start()
+
+    # Queue one record and return a Future resolved with its prediction
+    def submit(self, record):
+        future = Future()
+        self.requests.put((record, future))
+        return future
+
+    def predict(self, record, timeout = None):
+        return self.submit(record).result(timeout)
+
+    def _run(self):
+        while True:
+            batch = [self.requests.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.requests.get(timeout = remaining))
+                except queue.Empty:
+                    break
+            self._score(batch)
+
+    def _score(self, batch):
+        try:
+            results = score_records(self.model, self.encoder, [record for record, _ in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0][1].set_exception(e)
+                return
+            # One bad record should not fail the requests it was batched with
+            for item in batch:
+                self._score([item])
+            return
+
+        self.batches += 1
+        self.rows += len(batch)
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+
+# Score a list of records (dicts keyed by feature name) in one predict_proba call;
+# probability is that of the predicted class, as in the single prediction history
+def score_records(model, encoder, records):
+    df = schema.clean_columns(pd.DataFrame.from_records(records, columns = schema.expected_features))
+    with perf_metrics.span("predict_proba"):
+        probability = model.predict_proba(schema.model_input(df))
+    pred = (probability[:, 1] >= 0.5).astype(int)
+    with perf_metrics.span("inverse_transform"):
+        labels = encoder.inverse_transform(pred)
+    return [
+        {"ID": record.get("ID"), "prediction": str(label), "probability": round(float(prob[p]) * 100, 2)}
+        for record, label, prob, p in zip(records, labels, probability, pred)
+    ]
+
+
+# Features a record is missing, so bad requests are rejected before queueing
+def missing_features(record):
+    if not isinstance(record, dict):
+        return list(schema.expected_features)
+    return [feature for feature in schema.expected_features if feature not in record]
+
+
+def make_handler(batcher, model_name):
+    class ScoringHandler(BaseHTTPRequestHandler):
+        # Keep-alive lets a client send many requests over one connection
+        protocol_version = "HTTP/1.1"
+
+        def _send_json(self, status, body):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send_json(200, {"status": "ok", "model": model_name, "batches": batcher.batches, "rows": batcher.rows})
+            elif self.path == "/metrics" and perf_metrics.enabled:
+                # Stage timings for Prometheus to scrape
+                payload = perf_metrics.prometheus_text().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+            else:
+                self._send_json(404, {"error": "Not found"})
+
+        # POST /predict with one record, or a list of records, as JSON
+        def do_POST(self):
+            if self.path != "/predict":
+                self._send_json(404, {"error": "Not found"})
+                return
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            except ValueError:
+                self._send_json(400, {"error": "Request body is not valid JSON."})
+                return
+
+            records = body if isinstance(body, list) else [body]
+            for record in records:
+                missing = missing_features(record)
+                if missing:
+                    self._send_json(400, {"error": "Record does not match expected features.", "missing": missing})
+                    return
+
+            futures = [batcher.submit(record) for record in records]
+            try:
+                results = [future.result() for future in futures]
+            except Exception as e:
+                self._send_json(422, {"error": str(e)})
+                return
+            self._send_json(200, results if isinstance(body, list) else results[0])
+
+        def log_message(self, format, *args):
+            pass
+
+    return ScoringHandler
+
+
+# Thread per connection, with a backlog that can take a burst of clients
+class ScoringServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def make_server(model, encoder, host = "127.0.0.1", port = 8000, max_batch_size = 64, max_wait = 0.005,
+                model_name = "XGBoost"):
+    batcher = MicroBatcher(model, encoder, max_batch_size, max_wait)
+    server = ScoringServer((host, port), make_handler(batcher, model_name))
+    server.batcher = batcher
+    return server
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Local HTTP scoring service with micro-batching")
+    parser.add_argument("--model", choices = sorted(scoring.model_choices), default = "xgboost")
+    parser.add_argument("--host", default = "127.0.0.1")
+    parser.add_argument("--port", type = int, default = 8000)
+    parser.add_argument("--max-batch-size", type = int, default = 64, help = "most requests scored in one call")
+    parser.add_argument("--max-wait", type = float, default = 5.0, help = "milliseconds a batch waits to fill up")
+    parser.add_argument("--backend", choices = ["pipeline", "compiled"], default = "pipeline",
+                        help = "score with the fitted pipeline or its compiled NumPy version")
+    parser.add_argument("--models-dir", default = batch_score.default_model_dir, help = "directory holding the saved pipelines and encoder")
+    args = parser.parse_args(argv)
+
+    model_name = scoring.model_choices[args.model]
+    model_registry.use_model_dir(args.models_dir)
+
+    # A missing file or a Git LFS pointer that was never pulled fails here
+    try:
+        model = scoring.load_model(model_name, args.backend)
+        encoder = scoring.load_encoder()
+    except (OSError, KeyError, pickle.UnpicklingError) as e:
+        print(f"Error: could not load the {model_name} model and encoder from {args.models_dir}: {e!r}", file = sys.stderr)
+        return 1
+
+    server = make_server(model, encoder, args.host, args.port, args.max_batch_size, args.max_wait / 1000, model_name)
+    print(f"Serving {model_name} on http://{args.host}:{args.port}/predict")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
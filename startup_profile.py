@@ -0,0 +1,95 @@
+import importlib.machinery
+import os
+import sys
+import threading
+import time
+
+# Set PROFILE_STARTUP=1 to time every module imported after this one and the
+# first paint of the app; the report goes to stderr and the sidebar
+enabled = os.environ.get("PROFILE_STARTUP", "") not in ("", "0")
+
+# Slowest imports listed in the report
+report_modules = 30
+
+# The clock starts when app.py first imports this module
+started = time.perf_counter()
+first_paint = None
+page_loads = {}
+_imports = []
+_lock = threading.Lock()
+_local = threading.local()
+_installed = False
+
+
+# Times exec_module of each module found on sys.path. Self time leaves out the
+# modules it imported, like python -X importtime.
+class _TimingFinder:
+    def find_spec(self, name, path = None, target = None):
+        spec = importlib.machinery.PathFinder.find_spec(name, path, target)
+        if spec is None or spec.loader is None or isinstance(spec.loader, type) or not hasattr(spec.loader, "exec_module"):
+            return spec
+        exec_module = spec.loader.exec_module
+
+        # Each thread keeps its own stack of the imports it is inside
+        def timed_exec_module(module):
+            stack = _local.__dict__.setdefault("stack", [])
+            stack.append(0.0)
+            start = time.perf_counter()
+            try:
+                exec_module(module)
+            finally:
+                seconds = time.perf_counter() - start
+                children = stack.pop()
+                if stack:
+                    stack[-1] += seconds
+                with _lock:
+                    _imports.append({"module": name, "seconds": seconds, "self_seconds": seconds - children,
+                                     "top_level": not stack})
+
+        spec.loader.exec_module = timed_exec_module
+        return spec
+
+
+# Start timing imports, once per process
+def install():
+    global _installed
+    if enabled and not _installed:
+        _installed = True
+        sys.meta_path.insert(0, _TimingFinder())
+
+
+# Call at the end of each script run; the first one is the first paint
+def painted():
+    global first_paint
+    if enabled and first_paint is None:
+        first_paint = time.perf_counter() - started
+        print(report(), file = sys.stderr)
+
+
+# Call with the seconds a page module took to import the first time it was shown
+def page_loaded(page, seconds):
+    if enabled:
+        page_loads[page] = seconds
+        print(f"Startup profile: {page} imported in {seconds * 1000:.0f} ms", file = sys.stderr)
+
+
+# Modules imported so far, slowest first
+def imports(limit = None):
+    with _lock:
+        timings = sorted((dict(timing) for timing in _imports), key = lambda timing: timing["seconds"], reverse = True)
+    return timings[:limit]
+
+
+def report():
+    lines = ["Startup profile",
+             f"  time to first paint: {first_paint * 1000:.0f} ms" if first_paint is not None else "  not painted yet"]
+    with _lock:
+        top_level = sum(timing["seconds"] for timing in _imports if timing["top_level"])
+        count = len(_imports)
+    lines.append(f"  imports: {top_level * 1000:.0f} ms over {count} modules")
+    for page, seconds in page_loads.items():
+        lines.append(f"  {page} first shown after importing for {seconds * 1000:.0f} ms")
+    lines.append(f"  {'cumulative_ms':>13} {'self_ms':>8}  module")
+    for timing in imports(report_modules):
+        lines.append(f"  {timing['seconds'] * 1000:>13.1f} {timing['self_seconds'] * 1000:>8.1f}  {timing['module']}")
+    return "\n".join(lines)
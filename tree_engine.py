@@ -0,0 +1,397 @@
+import json
+import weakref
+import numpy as np
+import pandas as pd
+
+# Rows preprocessed and traversed together; bounds the dense feature block in memory
+block_rows = 8192
+
+# Larger batches go to the fitted pipeline: past roughly a thousand rows its
+# native tree code is faster than NumPy traversal, while below that the
+# compiled path avoids its per-call overhead (see benchmarks/bench_tree_engine.py)
+max_compiled_rows = 1000
+
+# Compiled pipelines, kept for as long as the fitted pipeline they were built from
+_compiled = weakref.WeakKeyDictionary()
+
+
+# Largest float32 not above each threshold, so "x > t" on float32 inputs gives
+# the same branch as the float64 comparison sklearn makes
+def _float32_at_most(thresholds):
+    thresholds = np.asarray(thresholds, dtype = np.float64)
+    rounded = thresholds.astype(np.float32)
+    above = rounded.astype(np.float64) > thresholds
+    rounded[above] = np.nextafter(rounded[above], np.float32(-np.inf))
+    return rounded
+
+
+# Flat node arrays of a whole ensemble, renumbered level by level so that every
+# split's right child directly follows its left child. A step down the trees
+# is then left[node] + (x > threshold). Missing values are folded into the
+# feature index: each row is stored twice, with NaN as -inf (columns 0..F-1)
+# and as +inf (columns F..2F-1), and a split whose missing values go right
+# reads the second copy. Leaves are their own left child with an infinite
+# threshold, so rows that reach a leaf early stay there for the remaining steps.
+class TreeEnsemble:
+    def __init__(self, trees, kind, n_features, base_margin = 0.0, classes = None):
+        offsets = np.cumsum([0] + [len(tree["feature"]) for tree in trees])
+        feature = np.concatenate([tree["feature"] for tree in trees]).astype(np.int64)
+        threshold = np.concatenate([tree["threshold"] for tree in trees]).astype(np.float32)
+        value = np.concatenate([tree["value"] for tree in trees]).astype(np.float64)
+        left = np.concatenate([np.where(tree["left"] < 0, -1, tree["left"] + offset) for offset, tree in zip(offsets, trees)])
+        right = np.concatenate([np.where(tree["right"] < 0, -1, tree["right"] + offset) for offset, tree in zip(offsets, trees)])
+        default_left = np.concatenate([tree["default_left"] for tree in trees]).astype(bool)
+
+        # Roots take ids 0..n_trees-1, then each level's children are numbered in pairs
+        new_id = np.full(len(feature), -1, dtype = np.int64)
+        frontier = offsets[:-1].astype(np.int64)
+        new_id[frontier] = np.arange(len(frontier))
+        next_id = len(frontier)
+        depth = 0
+        while True:
+            internal = frontier[left[frontier] >= 0]
+            if not len(internal):
+                break
+            pairs = next_id + 2 * np.arange(len(internal))
+            new_id[left[internal]] = pairs
+            new_id[right[internal]] = pairs + 1
+            next_id += 2 * len(internal)
+            frontier = np.concatenate((left[internal], right[internal]))
+            depth += 1
+
+        # Nodes no tree reaches (e.g. deleted in XGBoost) are left out
+        reachable = np.flatnonzero(new_id >= 0)
+        order = np.empty(next_id, dtype = np.int64)
+        order[new_id[reachable]] = reachable
+        leaf = left[order] < 0
+
+        self.left = np.where(leaf, np.arange(next_id), new_id[np.maximum(left[order], 0)]).astype(np.int32)
+        self.feature = np.where(leaf, 0, feature[order] + n_features * ~default_left[order]).astype(np.int32)
+        self.threshold = np.where(leaf, np.inf, threshold[order]).astype(np.float32)
+        self.value = value[order]
+        self.n_trees = len(trees)
+        self.n_features = n_features
+        self.depth = depth
+        self.kind = kind
+        self.base_margin = base_margin
+        self.classes_ = classes
+        # XGBoost treats the zeros left out of a sparse input as missing
+        self.zero_is_missing = False
+
+    # Walk every row down every tree at once, one level per step
+    def leaves(self, X):
+        X = np.asarray(X, dtype = np.float32)
+        missing = np.isnan(X) | (X == 0) if self.zero_is_missing else np.isnan(X)
+        flat = np.hstack((np.where(missing, -np.inf, X), np.where(missing, np.inf, X))).astype(np.float32).ravel()
+        row_start = (np.arange(len(X), dtype = np.int32) * np.int32(2 * self.n_features))[:, None]
+
+        node = np.broadcast_to(np.arange(self.n_trees, dtype = np.int32), (len(X), self.n_trees)).copy()
+        for _ in range(self.depth):
+            x = np.take(flat, np.add(row_start, np.take(self.feature, node)))
+            node = np.add(np.take(self.left, node), np.greater(x, np.take(self.threshold, node)))
+        return node
+
+    def predict_proba(self, X):
+        values = np.take(self.value, self.leaves(X), axis = 0)
+        if self.kind == "logistic":
+            # Accumulated tree by tree in float32 from the base margin, as XGBoost does
+            margin = np.full(len(values), self.base_margin, dtype = np.float32)
+            for tree in range(self.n_trees):
+                margin += values[:, tree, 0].astype(np.float32)
+            positive = (np.float32(1) / (np.float32(1) + np.exp(-margin))).astype(np.float64)
+            return np.column_stack((1 - positive, positive))
+        return values.mean(axis = 1)
+
+
+# sklearn forests: average of the class proportions at each tree's leaf
+def _compile_forest(forest):
+    if getattr(forest, "n_outputs_", 1) != 1:
+        raise ValueError("Only single-output forests can be compiled.")
+    trees = []
+    for estimator in forest.estimators_:
+        tree = estimator.tree_
+        value = tree.value[:, 0, :]
+        value = value / np.maximum(value.sum(axis = 1, keepdims = True), 1e-300)
+        trees.append({
+            "feature": np.maximum(tree.feature, 0),
+            "threshold": _float32_at_most(tree.threshold),
+            "left": tree.children_left,
+            "right": tree.children_right,
+            "default_left": getattr(tree, "missing_go_to_left", np.zeros(tree.node_count, dtype = bool)).astype(bool),
+            "value": value,
+        })
+    return TreeEnsemble(trees, "mean", forest.n_features_in_, classes = forest.classes_)
+
+
+# XGBoost binary:logistic models read from the booster's JSON model, where
+# split conditions are stored as exact float32 values and leaves hold their value
+def _compile_xgboost(classifier):
+    booster = classifier.get_booster()
+    learner = json.loads(booster.save_raw("json"))["learner"]
+    if learner["objective"]["name"] != "binary:logistic":
+        raise ValueError(f"XGBoost objective {learner['objective']['name']} is not supported.")
+    if learner["gradient_booster"]["name"] != "gbtree":
+        raise ValueError(f"XGBoost booster {learner['gradient_booster']['name']} is not supported.")
+    model = learner["gradient_booster"]["model"]
+
+    # Early-stopped models predict with the trees up to their best iteration
+    trees = model["trees"]
+    best_iteration = booster.attr("best_iteration")
+    if best_iteration is not None:
+        trees = trees[:model["iteration_indptr"][int(best_iteration) + 1]]
+
+    compiled = []
+    for tree in trees:
+        if any(tree["split_type"]):
+            raise ValueError("XGBoost categorical splits are not supported.")
+        left = np.asarray(tree["left_children"], dtype = np.int64)
+        right = np.asarray(tree["right_children"], dtype = np.int64)
+        conditions = np.asarray(tree["split_conditions"], dtype = np.float32)
+        # XGBoost goes right when x >= condition, i.e. x > the float32 just below it
+        threshold = np.nextafter(conditions, np.float32(-np.inf))
+        compiled.append({
+            "feature": np.asarray(tree["split_indices"], dtype = np.int64),
+            "threshold": threshold,
+            "left": left,
+            "right": right,
+            "default_left": np.asarray(tree["default_left"], dtype = bool),
+            "value": np.where(left < 0, conditions, 0).astype(np.float64)[:, None],
+        })
+
+    base_score = float(learner["learner_model_param"]["base_score"])
+    base_margin = np.log(base_score / (1 - base_score))
+    n_features = int(learner["learner_model_param"]["num_feature"])
+    return TreeEnsemble(compiled, "logistic", n_features, base_margin, classes = classifier.classes_)
+
+
+def _compile_estimator(estimator):
+    name = type(estimator).__name__
+    if name in ("RandomForestClassifier", "ExtraTreesClassifier"):
+        return _compile_forest(estimator)
+    if name == "XGBClassifier":
+        return _compile_xgboost(estimator)
+    raise ValueError(f"{name} cannot be compiled.")
+
+
+def _is_missing(values, missing_values):
+    if missing_values is None or (isinstance(missing_values, float) and np.isnan(missing_values)):
+        return pd.isna(values)
+    return values == missing_values
+
+
+# Each preprocessing step becomes a function on a 2-D array: object arrays for
+# raw categoricals, float64 once a step has produced numbers
+def _compile_step(step):
+    name = type(step).__name__
+    if step == "passthrough" or step is None:
+        return lambda X: X
+
+    if name == "Pipeline":
+        functions = [_compile_step(inner) for _, inner in step.steps if not hasattr(inner, "fit_resample")]
+
+        def run(X):
+            for function in functions:
+                X = function(X)
+            return X
+        return run
+
+    if name == "SimpleImputer":
+        if step.add_indicator:
+            raise ValueError("SimpleImputer(add_indicator=True) is not supported.")
+        statistics = step.statistics_
+        keep = slice(None)
+        if statistics.dtype.kind == "f" and not getattr(step, "keep_empty_features", False):
+            # Columns that were all missing at fit time are dropped, as sklearn does
+            keep = ~np.isnan(statistics)
+            statistics = statistics[keep]
+
+        def impute(X):
+            X = X[:, keep]
+            if statistics.dtype.kind == "f":
+                X = np.asarray(X, dtype = np.float64)
+            missing = _is_missing(X, step.missing_values)
+            if missing.any():
+                X = np.where(missing, statistics[None, :], X)
+            return X
+        return impute
+
+    if name == "StandardScaler":
+        mean = step.mean_ if step.with_mean else 0.0
+        scale = step.scale_ if step.with_std else 1.0
+        return lambda X: (np.asarray(X, dtype = np.float64) - mean) / scale
+
+    if name == "RobustScaler":
+        center = step.center_ if step.with_centering else 0.0
+        scale = step.scale_ if step.with_scaling else 1.0
+        return lambda X: (np.asarray(X, dtype = np.float64) - center) / scale
+
+    if name == "MinMaxScaler":
+        if step.clip:
+            low, high = step.feature_range
+            return lambda X: np.clip(np.asarray(X, dtype = np.float64) * step.scale_ + step.min_, low, high)
+        return lambda X: np.asarray(X, dtype = np.float64) * step.scale_ + step.min_
+
+    if name == "MaxAbsScaler":
+        return lambda X: np.asarray(X, dtype = np.float64) / step.scale_
+
+    if name == "OneHotEncoder":
+        if getattr(step, "infrequent_categories_", None) is not None and any(
+                infrequent is not None for infrequent in step.infrequent_categories_):
+            raise ValueError("OneHotEncoder infrequent categories are not supported.")
+        drop_idx = step.drop_idx_ if step.drop_idx_ is not None else [None] * len(step.categories_)
+        widths = [len(categories) - (drop is not None) for categories, drop in zip(step.categories_, drop_idx)]
+        lookups = [_category_lookup(categories) for categories in step.categories_]
+
+        def one_hot(X):
+            output = np.zeros((len(X), sum(widths)), dtype = np.float64)
+            offset = 0
+            for col, (lookup, drop, width) in enumerate(zip(lookups, drop_idx, widths)):
+                codes = lookup(X[:, col])
+                if step.handle_unknown == "error" and (codes < 0).any():
+                    raise ValueError(f"Found unknown categories in column {col} during transform")
+                if drop is not None:
+                    codes = np.where(codes == drop, -1, codes - (codes > drop))
+                rows = np.flatnonzero(codes >= 0)
+                output[rows, offset + codes[rows]] = 1.0
+                offset += width
+            return output
+        return one_hot
+
+    if name == "OrdinalEncoder":
+        lookups = [_category_lookup(categories) for categories in step.categories_]
+
+        def ordinal(X):
+            output = np.empty(X.shape, dtype = np.float64)
+            for col, lookup in enumerate(lookups):
+                codes = lookup(X[:, col]).astype(np.float64)
+                missing = pd.isna(X[:, col])
+                codes[(codes < 0) & ~missing] = step.unknown_value if step.unknown_value is not None else np.nan
+                codes[missing & (codes < 0)] = step.encoded_missing_value
+                output[:, col] = codes
+            return output
+        return ordinal
+
+    if hasattr(step, "get_support"):
+        support = step.get_support()
+        return lambda X: X[:, support]
+
+    raise ValueError(f"{name} cannot be compiled.")
+
+
+# Maps values to their position in the fitted categories, -1 when unseen. A
+# NaN category fitted by the encoder matches missing values. Small batches
+# use a dict; larger ones a hash-table lookup over the whole column.
+def _category_lookup(categories):
+    categories = np.asarray(categories)
+    nan_code = len(categories) - 1 if categories.dtype.kind in "fO" and len(categories) and pd.isna(categories[-1]) else -1
+    known = categories[:-1] if nan_code >= 0 else categories
+    index = pd.Index(known)
+    mapping = {value: code for code, value in enumerate(known)}
+
+    def lookup(values):
+        if len(values) <= 64:
+            codes = np.array([mapping.get(value, -1) if not pd.isna(value) else nan_code for value in values], dtype = np.int64)
+        else:
+            codes = index.get_indexer(values).astype(np.int64)
+            if nan_code >= 0:
+                codes[pd.isna(values)] = nan_code
+        return codes
+    return lookup
+
+
+# Compiled ColumnTransformer taking either a frame or a 2-D array whose
+# columns are in the order the transformer was fitted on
+def _compile_column_transformer(transformer):
+    feature_names = list(getattr(transformer, "feature_names_in_", []))
+    parts = []
+    for name, step, columns in transformer.transformers_:
+        if isinstance(columns, slice) or (len(columns) and isinstance(columns[0], (int, np.integer, bool, np.bool_))):
+            positions = np.arange(transformer.n_features_in_)[columns]
+            columns = [feature_names[position] for position in positions] if feature_names else list(positions)
+        else:
+            positions = [feature_names.index(col) for col in columns]
+        if step == "drop" or len(columns) == 0:
+            continue
+        parts.append((_compile_step(step), list(columns), np.asarray(positions, dtype = np.int64)))
+
+    def transform(source):
+        blocks = []
+        for function, columns, positions in parts:
+            if isinstance(source, pd.DataFrame):
+                # Column by column avoids pandas' block consolidation, which dominates small batches
+                values = np.column_stack([source[col].to_numpy() for col in columns])
+            else:
+                values = source[:, positions]
+            blocks.append(np.asarray(function(values), dtype = np.float64))
+        return np.hstack(blocks)
+    return transform
+
+
+# A fitted pipeline with its preprocessing compiled to NumPy steps and its
+# trees flattened into a TreeEnsemble. predict_proba takes the same frame as
+# the pipeline, or a 2-D array with columns in feature_names order. Only the
+# fitted steps are held, not the pipeline object, so the compiled copy never
+# keeps its pipeline alive.
+class CompiledPipeline:
+    def __init__(self, steps, feature_names):
+        self.steps = [step for step in steps if not hasattr(step, "fit_resample")]
+        self.feature_names = list(feature_names)
+        self.ensemble = _compile_estimator(self.steps[-1])
+        self.classes_ = self.ensemble.classes_
+
+        self.preprocess = []
+        sparse_output = False
+        for position, step in enumerate(self.steps[:-1]):
+            if type(step).__name__ == "ColumnTransformer":
+                self.preprocess.append(_compile_column_transformer(step))
+                sparse_output = step.sparse_output_
+            else:
+                function = _compile_step(step)
+                if position == 0:
+                    self.preprocess.append(lambda source, function = function: function(np.asarray(source)))
+                else:
+                    self.preprocess.append(function)
+                if type(step).__name__ == "OneHotEncoder":
+                    sparse_output = step.sparse_output
+                elif not hasattr(step, "get_support"):
+                    sparse_output = False
+        self.ensemble.zero_is_missing = sparse_output and type(self.steps[-1]).__name__ == "XGBClassifier"
+
+    # Compiled steps are closures, so a pickled copy (e.g. for a process pool) recompiles
+    def __reduce__(self):
+        return CompiledPipeline, (self.steps, self.feature_names)
+
+    def transform(self, source):
+        X = source
+        for function in self.preprocess:
+            X = function(X)
+        return np.asarray(X, dtype = np.float64)
+
+    # The fitted steps run one after another, as Pipeline.predict_proba does
+    def _fitted_predict_proba(self, source):
+        if not isinstance(source, pd.DataFrame) and self.feature_names:
+            source = pd.DataFrame(source, columns = self.feature_names)
+        for step in self.steps[:-1]:
+            source = step.transform(source)
+        return self.steps[-1].predict_proba(source)
+
+    def predict_proba(self, source):
+        if max_compiled_rows is not None and len(source) > max_compiled_rows:
+            return self._fitted_predict_proba(source)
+        if len(source) <= block_rows:
+            return self.ensemble.predict_proba(self.transform(source))
+        return np.vstack([
+            self.ensemble.predict_proba(self.transform(source[start:start + block_rows]))
+            for start in range(0, len(source), block_rows)
+        ])
+
+
+# Compiled version of a fitted pipeline (or bare estimator), built once per
+# pipeline. Raises ValueError for steps or estimators the engine does not support.
+def compile_pipeline(pipeline):
+    compiled = _compiled.get(pipeline)
+    if compiled is None:
+        steps = [step for _, step in pipeline.steps] if hasattr(pipeline, "steps") else [pipeline]
+        compiled = CompiledPipeline(steps, getattr(pipeline, "feature_names_in_", []))
+        _compiled[pipeline] = compiled
+    return compiled